@@ -0,0 +1,88 @@
+"""
+Solve latency and objective of the central MILP with every solver backend,
+for a range of building counts and horizons.
+
+Only the HiGHS backend is run by default, so the benchmark needs no solver
+licence. Pass --solvers gurobi highs to compare against gurobi; sizes that
+the available gurobi licence can not solve are reported as skipped.
+"""
+import argparse
+import numpy as np
+import gurobipy as gp
+from phoenaix.optimizer.backends import \
+    BACKENDS, \
+    make_backend
+from phoenaix.optimizer.matrix_model import assemble_central_milp
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon
+
+BUILDING_COUNTS = (5, 20, 50)
+HORIZONS = (10, 24, 48)
+
+
+def run(backend, n_buildings, n_horizon, n_samples, param_mpc):
+    buildings = make_buildings(n_buildings)
+    profiles = make_profiles(buildings, n_samples * 24 + n_horizon)
+    solve_times, objs = [], []
+    for sample in range(n_samples):
+        milp = assemble_central_milp(
+            demands_and_pv=horizon(profiles, sample * 24, n_horizon),
+            buildings=buildings,
+            n_horizon=n_horizon,
+            param_mpc=param_mpc,
+            init_val=None)
+        solution = backend.solve(milp)
+        solve_times.append(solution.solve_time)
+        objs.append(solution.obj_val if solution.has_solution else np.nan)
+    return np.array(solve_times), np.array(objs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--solvers', nargs='+', default=['highs'],
+                        choices=list(BACKENDS))
+    parser.add_argument('--buildings', nargs='+', type=int,
+                        default=list(BUILDING_COUNTS))
+    parser.add_argument('--horizons', nargs='+', type=int,
+                        default=list(HORIZONS))
+    parser.add_argument('--samples', type=int, default=3)
+    parser.add_argument('--mip-gap', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    param_mpc['gp']['mip_gap'] = args.mip_gap
+    backends = {solver: make_backend(solver, param_mpc)
+                for solver in args.solvers}
+
+    print(f"{'buildings':>9} {'horizon':>7} " +
+          " ".join(f"{solver + ' [ms]':>14} {solver + ' obj':>14}"
+                   for solver in backends) + "  max rel. obj. diff")
+    for n_buildings in args.buildings:
+        for n_horizon in args.horizons:
+            line = f"{n_buildings:9d} {n_horizon:7d} "
+            objs = []
+            for solver, backend in backends.items():
+                try:
+                    solve_times, obj = run(backend, n_buildings, n_horizon,
+                                           args.samples, param_mpc)
+                except gp.GurobiError:
+                    line += f"{'skipped':>14} {'':>14} "
+                    continue
+                objs.append(obj)
+                line += f"{1e3 * solve_times.mean():14.2f} {obj.mean():14.2f} "
+            if len(objs) > 1:
+                objs = np.array(objs)
+                rel_diff = (objs.max(axis=0) - objs.min(axis=0)) / \
+                    np.abs(objs).max(axis=0)
+                line += f" {rel_diff.max():.1e}"
+            print(line)
+
+    for backend in backends.values():
+        backend.dispose()
+
+
+if __name__ == '__main__':
+    main()
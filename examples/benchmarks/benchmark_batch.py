@@ -0,0 +1,71 @@
+"""
+Throughput of batch.solve_batch in horizons per second for an increasing
+number of worker processes, against solving the same horizons one after
+the other in this process.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from phoenaix.optimizer.backends import \
+    BACKENDS, \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.batch import solve_batch
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--solver', default='highs', choices=list(BACKENDS))
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--horizons', type=int, default=200,
+                        help='number of horizons in the batch')
+    parser.add_argument('--workers', nargs='+', type=int,
+                        default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    buildings = make_buildings(args.buildings)
+    profiles = make_profiles(buildings, args.horizons + args.horizon)
+    param_mpc = mpc_params()
+    inputs = [horizon(profiles, start, args.horizon)
+              for start in range(args.horizons)]
+
+    backend = make_backend(args.solver, param_mpc)
+    start_time = time.perf_counter()
+    objs = [solve_central(demands_and_pv=demands_and_pv,
+                          buildings=buildings,
+                          n_horizon=args.horizon,
+                          param_mpc=param_mpc,
+                          init_val=None,
+                          backend=backend).obj_val
+            for demands_and_pv in inputs]
+    sequential = args.horizons / (time.perf_counter() - start_time)
+    backend.dispose()
+    print(f"{args.solver}, {args.buildings} buildings, horizon "
+          f"{args.horizon}, {args.horizons} horizons on {os.cpu_count()} "
+          f"cores")
+    print(f"{'sequential':>12}: {sequential:8.1f} horizons/s")
+
+    for n_workers in sorted(set(args.workers)):
+        batch = solve_batch(inputs=inputs,
+                            init_vals=None,
+                            buildings=buildings,
+                            n_horizon=args.horizon,
+                            param_mpc=param_mpc,
+                            solver=args.solver,
+                            n_workers=n_workers,
+                            chunksize=max(1, args.horizons // (4 * n_workers)))
+        rel_diff = np.max(np.abs(batch.obj_val - objs) / np.abs(objs))
+        print(f"{n_workers:3d} workers: {batch.throughput:8.1f} horizons/s, "
+              f"speedup {batch.throughput / sequential:5.2f}x, "
+              f"max rel. objective difference {rel_diff:.1e}")
+
+
+if __name__ == '__main__':
+    main()
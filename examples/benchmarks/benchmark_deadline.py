@@ -0,0 +1,85 @@
+"""
+Per-step latency of the central MPC in a closed loop with and without a
+deadline (deadline.Deadline): mean, 99th percentile and maximum latency,
+deadline misses, statuses and the cost of stopping at an incumbent.
+"""
+import argparse
+import time
+from collections import Counter
+import numpy as np
+from phoenaix.optimizer.backends import \
+    BACKENDS, \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.deadline import Deadline
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+
+def run(backend, buildings, profiles, param_mpc, n_horizon, n_steps,
+        budget, acceptable_gap):
+    latencies, objs, statuses, misses = [], [], Counter(), 0
+    soc_init = None
+    for step in range(n_steps):
+        start_time = time.perf_counter()
+        deadline = None
+        if budget is not None:
+            deadline = Deadline(budget=budget,
+                                acceptable_gap=acceptable_gap,
+                                start_time=start_time)
+        res = solve_central(demands_and_pv=horizon(profiles, step, n_horizon),
+                            buildings=buildings,
+                            n_horizon=n_horizon,
+                            param_mpc=param_mpc,
+                            init_val=soc_init,
+                            backend=backend,
+                            deadline=deadline)
+        latencies.append(time.perf_counter() - start_time)
+        misses += deadline is not None and deadline.remaining() < 0
+        statuses[res.status if res is not None else "none"] += 1
+        objs.append(res.obj_val if res is not None else np.nan)
+        soc_init = soc_init_from_results(res)
+    return np.array(latencies), np.array(objs), statuses, misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--solver', default='highs', choices=list(BACKENDS))
+    parser.add_argument('--buildings', type=int, default=20)
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--budget', type=float, default=0.5,
+                        help='deadline of every step in seconds')
+    parser.add_argument('--acceptable-gap', type=float, default=0.05)
+    args = parser.parse_args()
+
+    buildings = make_buildings(args.buildings)
+    profiles = make_profiles(buildings, args.steps + args.horizon)
+    param_mpc = mpc_params()
+    param_mpc['gp']['mip_gap'] = 1e-4
+    backend = make_backend(args.solver, param_mpc)
+
+    print(f"{args.solver}, {args.buildings} buildings, horizon {args.horizon}, "
+          f"{args.steps} closed-loop steps, budget {args.budget} s")
+    results = {}
+    for name, budget in (("no deadline", None), ("deadline", args.budget)):
+        latencies, objs, statuses, misses = run(
+            backend, buildings, profiles, param_mpc, args.horizon, args.steps,
+            budget, args.acceptable_gap)
+        results[name] = objs
+        print(f"{name:>12}: latency mean {1e3 * latencies.mean():8.2f} ms, "
+              f"p99 {1e3 * np.percentile(latencies, 99):8.2f} ms, "
+              f"max {1e3 * latencies.max():8.2f} ms, "
+              f"deadline misses {misses}, statuses {dict(statuses)}")
+
+    penalty = np.nanmean(results["deadline"] / results["no deadline"] - 1)
+    print(f"mean cost penalty of the deadline: {100 * penalty:.3f} %")
+    backend.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Decomposition of the central MPC into subproblems per building
+(decomposition.DecomposedCentralModel) against the central solve: price
+iterations, gap to the central objective and wall time for an increasing
+number of worker processes.
+
+Every configuration solves two consecutive steps, the second one starts
+from the prices of the first and is reported.
+"""
+import argparse
+import os
+import time
+import numpy as np
+import gurobipy as gp
+from phoenaix.optimizer.backends import \
+    BACKENDS, \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.decomposition import DecomposedCentralModel
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_building_table, \
+    make_profiles, \
+    horizon
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--solver', default='highs', choices=list(BACKENDS))
+    parser.add_argument('--buildings', nargs='+', type=int,
+                        default=[20, 100, 200])
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--workers', nargs='+', type=int,
+                        default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--mip-gap', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    param_mpc['gp']['mip_gap'] = args.mip_gap
+    backend = make_backend(args.solver, param_mpc)
+    print(f"{args.solver}, horizon {args.horizon}, {os.cpu_count()} cores")
+    for n_buildings in args.buildings:
+        buildings = make_building_table(n_buildings)
+        profiles = make_profiles(make_buildings(n_buildings), args.horizon + 1)
+        steps = [horizon(profiles, step, args.horizon, as_arrays=True)
+                 for step in range(2)]
+
+        start_time = time.perf_counter()
+        try:
+            central = solve_central(demands_and_pv=steps[1],
+                                    buildings=buildings,
+                                    n_horizon=args.horizon,
+                                    param_mpc=param_mpc,
+                                    init_val=None,
+                                    backend=backend).obj_val
+            t_central = time.perf_counter() - start_time
+            print(f"{n_buildings} buildings, central: "
+                  f"{1e3 * t_central:.0f} ms")
+        except gp.GurobiError as e:
+            # a size-limited licence still solves the subproblems
+            central, t_central = np.nan, np.nan
+            print(f"{n_buildings} buildings, central skipped: {e}")
+
+        for n_workers in sorted(set(args.workers)):
+            model = DecomposedCentralModel(buildings=buildings,
+                                           n_horizon=args.horizon,
+                                           param_mpc=param_mpc,
+                                           solver=args.solver,
+                                           n_workers=n_workers)
+            for demands_and_pv in steps:
+                res = model.solve(demands_and_pv=demands_and_pv)
+            model.dispose()
+            metrics = res.info["decomposition"]
+            gap = (res.obj_val - central) / abs(central)
+            print(f"  {n_workers:3d} workers: "
+                  f"{1e3 * metrics['wall_time']:8.0f} ms, "
+                  f"speedup vs central {t_central / metrics['wall_time']:5.2f}x, "
+                  f"iterations {metrics['iterations']}, "
+                  f"converged {metrics['converged']}, "
+                  f"gap to central {100 * gap:+.4f} %")
+    backend.dispose()
+
+
+if __name__ == '__main__':
+    main()
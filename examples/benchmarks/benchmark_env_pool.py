@@ -0,0 +1,100 @@
+"""
+Concurrent gurobi solves of several neighborhoods in one process, with an
+environment per neighborhood and with a shared env_pool.EnvPool.
+
+Every neighborhood runs in a thread of its own and solves a number of
+horizons back to back, like overlapping MPC steps or several MPCs hosted
+in one process. The pool caps the concurrent solves and splits the cores
+among them.
+"""
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from phoenaix.optimizer.backends import \
+    GurobiBackend, \
+    solve_central
+from phoenaix.optimizer.env_pool import EnvPool
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_building_table, \
+    make_profiles, \
+    horizon
+
+
+def neighborhood(backend, buildings, profiles, n_solves, n_horizon,
+                 param_mpc, latencies):
+    for step in range(n_solves):
+        start_time = time.perf_counter()
+        solve_central(demands_and_pv=horizon(profiles, step, n_horizon,
+                                             as_arrays=True),
+                      buildings=buildings,
+                      n_horizon=n_horizon,
+                      param_mpc=param_mpc,
+                      init_val=None,
+                      backend=backend)
+        latencies.append(time.perf_counter() - start_time)
+
+
+def run(backends, buildings, profiles, n_solves, n_horizon, param_mpc):
+    latencies = []
+    threads = [threading.Thread(target=neighborhood,
+                                args=(backend, buildings, profiles, n_solves,
+                                      n_horizon, param_mpc, latencies))
+               for backend in backends]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start_time
+    return wall_time, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--neighborhoods', type=int, default=4)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--solves', type=int, default=10)
+    parser.add_argument('--concurrent', type=int, nargs='+', default=[1, 2])
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    buildings = make_building_table(args.buildings)
+    profiles = make_profiles(buildings, args.solves + args.horizon)
+    n_total = args.neighborhoods * args.solves
+    print(f"{args.neighborhoods} neighborhoods of {args.buildings} buildings, "
+          f"{args.solves} solves each, {os.cpu_count()} cores")
+
+    def report(label, wall_time, latencies, extra=""):
+        print(f"{label:26s}: {n_total / wall_time:6.1f} solves/s, latency "
+              f"mean {1e3 * latencies.mean():7.1f} ms, "
+              f"p99 {1e3 * np.percentile(latencies, 99):7.1f} ms{extra}")
+
+    backends = [GurobiBackend(param_mpc, diagnose=False)
+                for _ in range(args.neighborhoods)]
+    wall_time, latencies = run(backends, buildings, profiles, args.solves,
+                               args.horizon, param_mpc)
+    report("env per neighborhood", wall_time, latencies,
+           f", {len(backends)} envs with all cores each")
+    for backend in backends:
+        backend.dispose()
+
+    for max_concurrent in args.concurrent:
+        pool = EnvPool(max_concurrent=max_concurrent)
+        backends = [GurobiBackend(param_mpc, diagnose=False, pool=pool)
+                    for _ in range(args.neighborhoods)]
+        wall_time, latencies = run(backends, buildings, profiles,
+                                   args.solves, args.horizon, param_mpc)
+        stats = pool.stats()
+        report(f"pool of {max_concurrent}", wall_time, latencies,
+               f", {stats['envs']} envs with {stats['threads']} threads, "
+               f"wait p99 {1e3 * stats['wait_p99']:7.1f} ms, "
+               f"solve p99 {1e3 * stats['hold_p99']:7.1f} ms")
+        pool.dispose()
+
+
+if __name__ == '__main__':
+    main()
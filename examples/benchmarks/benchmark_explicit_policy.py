@@ -0,0 +1,94 @@
+"""
+Evaluation time and closed-loop regret of an explicit MPC policy
+(explicit_policy.ExplicitPolicy) against the exact MPC.
+
+The policy is fitted on sampled horizons of the profiles and then run in
+closed loop next to the exact MPC over --steps hours, with perfect
+forecasts. The synthetic profiles are used by default, --year runs on the
+demand and PV profiles of the demonstrator (needs the data files). The
+policy can be saved with --save and loaded by the MPC via
+settings.EXPLICIT_POLICY.
+"""
+import argparse
+import time
+from phoenaix.optimizer.backends import make_backend
+from phoenaix.optimizer.explicit_policy import \
+    fit_policy, \
+    evaluate_regret
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_building_table, \
+    make_profiles
+
+
+def year_profiles(buildings, year):
+    """Hourly profiles of the demonstrator as arrays (building, time)"""
+    from phoenaix.utils.load_demands import load_demands_and_pv
+
+    building_ids = list(buildings)
+    data = load_demands_and_pv(year=year,
+                               building_ids=building_ids).iloc[::4]
+    return {key: data[key][building_ids].to_numpy().T
+            for key in ("elec", "heating", "cooling", "dhw", "pv_power")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--steps', type=int, default=168)
+    parser.add_argument('--start', type=int, default=0,
+                        help='first hour of the closed loop')
+    parser.add_argument('--year', type=int, default=None,
+                        help='use the profiles of the demonstrator')
+    parser.add_argument('--max-distance', type=float, default=0.25)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--solver', default="highs")
+    parser.add_argument('--save', default=None)
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    buildings = make_building_table(args.buildings)
+    if args.year is None:
+        profiles = make_profiles(buildings, 8760 + args.horizon)
+    else:
+        profiles = year_profiles(buildings, args.year)
+
+    start_time = time.perf_counter()
+    policy = fit_policy(profiles=profiles,
+                        buildings=buildings,
+                        building_ids=list(buildings),
+                        n_horizon=args.horizon,
+                        param_mpc=param_mpc,
+                        n_samples=args.samples,
+                        solver=args.solver,
+                        n_workers=args.workers,
+                        max_distance=args.max_distance)
+    print(f"fitted {len(policy)} of {args.samples} samples in "
+          f"{time.perf_counter() - start_time:.1f} s")
+    if args.save is not None:
+        policy.save(args.save)
+
+    backend = make_backend(args.solver, param_mpc)
+    report = evaluate_regret(policy=policy,
+                             profiles=profiles,
+                             buildings=buildings,
+                             n_horizon=args.horizon,
+                             param_mpc=param_mpc,
+                             backend=backend,
+                             n_steps=args.steps,
+                             start=args.start)
+    backend.dispose()
+    print(f"{report['steps']} steps: exact {report['exact_cost']:.2f}, "
+          f"policy {report['policy_cost']:.2f}, "
+          f"regret {100 * report['regret']:.3f} %, "
+          f"fallbacks {report['fallbacks']}, "
+          f"infeasible actions {report['infeasible_actions']}")
+    print(f"policy evaluation mean {1e6 * report['eval_mean']:.1f} us, "
+          f"p99 {1e6 * report['eval_p99']:.1f} us, "
+          f"exact solve mean {1e3 * report['solve_mean']:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Time to read and write a list of FMU variables one by one
+(FMUHandler.get_value/set_value) and with an IOPlan
+(simulation.fmu_handler.IOPlan), which makes one call per value type.
+"""
+import argparse
+import time
+from phoenaix.simulation.fmu_handler import FMUHandler
+from benchmark_fmu_state import FMU_PATH
+
+
+def timed(function, n_repeats):
+    start_time = time.perf_counter()
+    for _ in range(n_repeats):
+        function()
+    return (time.perf_counter() - start_time) / n_repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fmu', default=str(FMU_PATH))
+    parser.add_argument('--variables', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--repeats', type=int, default=1000)
+    args = parser.parse_args()
+
+    handler = FMUHandler(fmu_path=args.fmu, step_size=3600)
+    handler.initialize()
+    reals = [name for name, variable in handler.variables.items()
+             if variable.type == 'Real']
+    # only parameters and inputs may be set
+    inputs = [name for name in reals
+              if handler.variables[name].causality in ('input', 'parameter')
+              and handler.variables[name].variability == 'tunable']
+
+    for n_variables in args.variables:
+        names = reals[:n_variables]
+        plan = handler.io_plan(names)
+        loop = timed(lambda: [handler.get_value(name) for name in names],
+                     args.repeats)
+        planned = timed(plan.read, args.repeats)
+        print(f"read  {len(names):5d} variables: one by one "
+              f"{1e6 * loop:9.1f} us, plan {1e6 * planned:9.1f} us")
+
+        names = inputs[:n_variables]
+        if not names:
+            continue
+        plan = handler.io_plan(names)
+        values = plan.read()
+        loop = timed(lambda: [handler.set_value(name, value)
+                              for name, value in zip(names, values)],
+                     args.repeats)
+        planned = timed(lambda: plan.write(values), args.repeats)
+        print(f"write {len(names):5d} variables: one by one "
+              f"{1e6 * loop:9.1f} us, plan {1e6 * planned:9.1f} us")
+    handler.terminate_and_free_instance()
+
+
+if __name__ == '__main__':
+    main()
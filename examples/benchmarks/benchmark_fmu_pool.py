@@ -0,0 +1,55 @@
+"""
+Throughput of the FMU worker pool (simulation.fmu_pool.FMUPool) in
+scenario-steps per second against the number of worker processes.
+
+Every scenario gets its own random heat pump powers and heat demands, all
+scenarios advance in lock-step and return the SOCs of the houses.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from phoenaix.simulation.fmu_pool import FMUPool
+from benchmark_fmu_state import FMU_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fmu', default=str(FMU_PATH))
+    parser.add_argument('--scenarios', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count()}))
+    parser.add_argument('--buildings', type=int, nargs='+',
+                        default=[1, 2, 3])
+    parser.add_argument('--step-size', type=float, default=3600)
+    args = parser.parse_args()
+
+    inputs = [name
+              for building_id in args.buildings
+              for name in (f'relativePower{building_id}',
+                           f'thermalDemand{building_id}')]
+    outputs = [f'haus_{building_id}.SOC' for building_id in args.buildings]
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1, size=(args.steps, args.scenarios,
+                                     len(inputs)))
+    # heat demands in W
+    values[:, :, 1::2] *= 5000
+
+    for n_workers in args.workers:
+        start_time = time.perf_counter()
+        with FMUPool(fmu_path=args.fmu,
+                     step_size=args.step_size,
+                     n_scenarios=args.scenarios,
+                     inputs=inputs,
+                     outputs=outputs,
+                     n_workers=n_workers) as pool:
+            startup = time.perf_counter() - start_time
+            pool.run(values)
+            print(f"{pool.n_workers:3d} workers: "
+                  f"{pool.throughput:9.1f} scenario-steps/s, "
+                  f"start of {args.scenarios} instances {startup:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
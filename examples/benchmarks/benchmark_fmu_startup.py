@@ -0,0 +1,83 @@
+"""
+Start and reset times of the FMUHandler with and without the extraction
+cache (simulation.fmu_cache).
+
+    - uncached: extracted to a temporary directory and parsed every time,
+      the former FMUHandler.initialize
+    - cold: first start with an empty cache
+    - warm (disk): the cache is filled by an earlier process, the hashes
+      and model descriptions in memory are cleared before every start
+    - warm (process): another start in the same process
+    - reset: FMUHandler.reset with fmi2Reset against terminating and
+      initializing the uncached handler again
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+from phoenaix.simulation import fmu_cache
+from phoenaix.simulation.fmu_handler import FMUHandler
+from benchmark_fmu_state import FMU_PATH
+
+
+def start(fmu_path, cache_dir):
+    start_time = time.perf_counter()
+    handler = FMUHandler(fmu_path=fmu_path,
+                         step_size=3600,
+                         cache_dir=cache_dir)
+    handler.initialize()
+    return handler, time.perf_counter() - start_time
+
+
+def report(label, times):
+    times = np.atleast_1d(times)
+    print(f"{label:15s}: mean {1e3 * times.mean():8.1f} ms, "
+          f"min {1e3 * times.min():8.1f} ms ({times.size} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fmu', default=str(FMU_PATH))
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        times = {"uncached": [], "warm (disk)": [], "warm (process)": [],
+                 "reset": [], "re-initialize": []}
+        fmu_cache.clear_memory()
+        handler, cold = start(args.fmu, cache_dir)
+        handler.terminate_and_free_instance()
+        for _ in range(args.runs):
+            handler, elapsed = start(args.fmu, None)
+            times["uncached"].append(elapsed)
+            # the former reset: a new instance in a new directory
+            start_time = time.perf_counter()
+            handler.terminate_and_free_instance()
+            handler.initialize()
+            times["re-initialize"].append(time.perf_counter() - start_time)
+            handler.terminate_and_free_instance()
+
+            fmu_cache.clear_memory()
+            handler, elapsed = start(args.fmu, cache_dir)
+            times["warm (disk)"].append(elapsed)
+            handler.terminate_and_free_instance()
+
+            handler, elapsed = start(args.fmu, cache_dir)
+            times["warm (process)"].append(elapsed)
+            handler.do_step({})
+            start_time = time.perf_counter()
+            handler.reset()
+            times["reset"].append(time.perf_counter() - start_time)
+            handler.terminate_and_free_instance()
+
+        report("cold", cold)
+        for label, values in times.items():
+            report(label, values)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
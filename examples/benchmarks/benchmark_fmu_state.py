@@ -0,0 +1,91 @@
+"""
+Steps per second and memory growth of the state handling modes of the
+FMUHandler (simulation.fmu_handler.STATE_MODES) over a year of hourly
+steps.
+
+'former' is FMUHandler.do_step before the state modes: it serialized and
+deep-copied the state after every step and never freed the state handle
+it got from the FMU. The resident set size is read from /proc after the
+initialization and at the end of every run, every mode runs in a fresh
+instance of the FMU.
+"""
+import argparse
+import copy
+import os
+import resource
+import time
+from pathlib import Path
+from phoenaix.simulation.fmu_handler import \
+    FMUHandler, \
+    STATE_MODES, \
+    STATE_NONE
+
+FMU_PATH = Path(__file__).parents[2] / 'data' / '01_input' / '05_fmu' / \
+    'DEQ_MVP_FMU.fmu'
+
+
+def rss():
+    """Resident set size of the process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # peak instead of current size without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def former_step(handler, set_var_dict):
+    """FMUHandler.do_step with use_local=False before the state modes"""
+    handler.set_values(set_var_dict)
+    handler.fmu.doStep(currentCommunicationPoint=handler.current_time,
+                       communicationStepSize=handler.step_size)
+    return copy.deepcopy(
+        handler.fmu.serializeFMUState(handler.fmu.getFMUState()))
+
+
+def run(mode, fmu_path, step_size, n_steps, building_ids):
+    handler = FMUHandler(fmu_path=fmu_path,
+                         step_size=step_size,
+                         state_mode=STATE_NONE if mode == 'former' else mode)
+    handler.initialize()
+    names = [name
+             for building_id in building_ids
+             for name in (f'relativePower{building_id}',
+                          f'thermalDemand{building_id}')
+             if name in handler.variables]
+    step = former_step if mode == 'former' else FMUHandler.do_step
+
+    rss_start = rss()
+    start_time = time.perf_counter()
+    for _ in range(n_steps):
+        step(handler, {name: 0.5 if name.startswith('relative') else 2000.0
+                       for name in names})
+        handler.current_time += step_size
+    wall_time = time.perf_counter() - start_time
+    rss_growth = rss() - rss_start
+    handler.terminate_and_free_instance()
+    return n_steps / wall_time, rss_growth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fmu', default=str(FMU_PATH))
+    parser.add_argument('--step-size', type=float, default=3600)
+    parser.add_argument('--steps', type=int, default=8760)
+    parser.add_argument('--buildings', type=int, nargs='+',
+                        default=[1, 2, 3])
+    args = parser.parse_args()
+
+    for mode in ('former',) + STATE_MODES:
+        steps_per_s, rss_growth = run(mode=mode,
+                                      fmu_path=args.fmu,
+                                      step_size=args.step_size,
+                                      n_steps=args.steps,
+                                      building_ids=args.buildings)
+        print(f"{mode:10s}: {steps_per_s:8.1f} steps/s, RSS growth over "
+              f"{args.steps} steps {rss_growth:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Steps per second of an open-loop FMU simulation with one do_step per hour
+and Python-level set/get around it, as in the ModelicaAgent, against
+FMUHandler.simulate_trajectory over the same input schedule, also with
+sub-steps finer than the step size.
+"""
+import argparse
+import time
+import numpy as np
+from phoenaix.simulation.fmu_handler import \
+    FMUHandler, \
+    STATE_NONE
+from benchmark_fmu_state import FMU_PATH
+
+
+def step_loop(handler, inputs, input_names, outputs):
+    results = []
+    for values in inputs:
+        handler.do_step(dict(zip(input_names, values)))
+        results.append([handler.get_value(name) for name in outputs])
+        handler.current_time += handler.step_size
+    return np.array(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fmu', default=str(FMU_PATH))
+    parser.add_argument('--steps', type=int, default=8760)
+    parser.add_argument('--step-size', type=float, default=3600)
+    parser.add_argument('--substeps', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--buildings', type=int, nargs='+',
+                        default=[1, 2, 3])
+    args = parser.parse_args()
+
+    input_names = [name
+                   for building_id in args.buildings
+                   for name in (f'relativePower{building_id}',
+                                f'thermalDemand{building_id}')]
+    outputs = [f'haus_{building_id}.SOC' for building_id in args.buildings]
+    rng = np.random.default_rng(0)
+    inputs = rng.uniform(0, 1, size=(args.steps, len(input_names)))
+    # heat demands in W
+    inputs[:, 1::2] *= 5000
+
+    handler = FMUHandler(fmu_path=args.fmu,
+                         step_size=args.step_size,
+                         state_mode=STATE_NONE)
+    handler.initialize()
+
+    start_time = time.perf_counter()
+    reference = step_loop(handler, inputs, input_names, outputs)
+    wall_time = time.perf_counter() - start_time
+    print(f"do_step loop          : {args.steps / wall_time:9.1f} steps/s")
+
+    for n_substeps in args.substeps:
+        handler.reset()
+        start_time = time.perf_counter()
+        results = handler.simulate_trajectory(inputs=inputs,
+                                              outputs=outputs,
+                                              input_names=input_names,
+                                              n_substeps=n_substeps)
+        wall_time = time.perf_counter() - start_time
+        deviation = np.abs(results - reference).max()
+        print(f"trajectory, {n_substeps:2d} substeps: "
+              f"{args.steps / wall_time:9.1f} steps/s, "
+              f"max deviation from the loop {deviation:.2e}")
+    handler.terminate_and_free_instance()
+
+
+if __name__ == '__main__':
+    main()
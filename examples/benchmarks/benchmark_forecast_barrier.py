@@ -0,0 +1,87 @@
+"""
+Time from the forecast requests of an MPC cycle until the MPC starts,
+with the former polling loop and with forecast_barrier.ForecastBarrier.
+
+The forecast agents are threads that answer after a random delay. In the
+second scenario one of them drops the first request of every cycle and
+only answers the retry.
+"""
+import argparse
+import threading
+import time
+import numpy as np
+from phoenaix.optimizer.forecast_barrier import ForecastBarrier
+
+# Sleep of the former polling loop in seconds
+POLL_INTERVAL = 0.5
+
+
+def poll(barrier, request, retry_after):
+    """Former MPC._online_pre_predict_process"""
+    start_time = time.perf_counter()
+    cycle_start = start_time
+    while barrier.missing():
+        time.sleep(POLL_INTERVAL)
+        this_time = time.perf_counter()
+        if this_time - start_time > retry_after:
+            for building_id in barrier.missing():
+                threading.Thread(target=request, args=(building_id,)).start()
+            start_time = this_time
+    return time.perf_counter() - cycle_start
+
+
+def wait(barrier, request, retry_after):
+    barrier.wait(request=request)
+    return barrier.times_to_barrier[-1]
+
+
+def run(method, n_buildings, n_cycles, delay, retry_after, drop, rng):
+    barrier = ForecastBarrier(building_ids=range(n_buildings),
+                              retry_after=retry_after)
+    lossy = n_buildings - 1 if drop else None
+
+    def answer(building_id):
+        time.sleep(rng.uniform(0, delay))
+        barrier.arrive(building_id)
+
+    def request(building_id, first=False):
+        if first and building_id == lossy:
+            return
+        threading.Thread(target=answer, args=(building_id,)).start()
+
+    times = []
+    for _ in range(n_cycles):
+        barrier.start_cycle()
+        for building_id in range(n_buildings):
+            request(building_id, first=True)
+        times.append(method(barrier, request, retry_after))
+    return np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.3,
+                        help='maximum answer time of an agent in s')
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    args = parser.parse_args()
+
+    for drop in (False, True):
+        for name, method in (("polling", poll), ("barrier", wait)):
+            times = run(method=method,
+                        n_buildings=args.buildings,
+                        n_cycles=args.cycles,
+                        delay=args.delay,
+                        retry_after=args.retry_after,
+                        drop=drop,
+                        rng=np.random.default_rng(0))
+            label = f"{name}, {'one request lost' if drop else 'no loss'}"
+            print(f"{label:26s}: time to barrier "
+                  f"mean {1e3 * times.mean():7.1f} ms, "
+                  f"p99 {1e3 * np.percentile(times, 99):7.1f} ms, "
+                  f"max {1e3 * times.max():7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
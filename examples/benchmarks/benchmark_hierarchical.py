@@ -0,0 +1,111 @@
+"""
+Per-step latency and closed-loop costs of the two-level MPC
+(hierarchical.HierarchicalPlanner) against the single-level MPC over the
+same horizon.
+
+Both run in closed loop over the synthetic profiles: the first step of
+every plan is applied, its costs are summed up and its storage states are
+the initial states of the next step. The single-level MPC solves the full
+horizon in hourly steps every hour. The two-level MPC plans the same
+horizon in coarse steps once a day, or when the forecasts deviate, and
+tracks the plan with a short problem. With --noise the forecasts of every
+step are perturbed, so that deviations renew the plan.
+"""
+import argparse
+import time
+import numpy as np
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.explicit_policy import step_cost
+from phoenaix.optimizer.hierarchical import HierarchicalPlanner
+from phoenaix.optimizer.time_grid import TimeGrid
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_building_table, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+
+def run(solve, profiles, n_horizon, n_steps, param_mpc, noise, rng):
+    latencies, costs = [], []
+    init_val = None
+    for step in range(n_steps):
+        demands_and_pv = horizon(profiles, step, n_horizon, as_arrays=True)
+        forecast = {key: values * rng.normal(1.0, noise, size=values.shape)
+                    .clip(0.0, None)
+                    for key, values in demands_and_pv.items()}
+        # the applied step is the one that really happens
+        for values, actual in zip(forecast.values(), demands_and_pv.values()):
+            values[:, 0] = actual[:, 0]
+        start_time = time.perf_counter()
+        res = solve(forecast, init_val)
+        latencies.append(time.perf_counter() - start_time)
+        if res is None:
+            raise RuntimeError(f"No solution in step {step}")
+        costs.append(step_cost(res, param_mpc))
+        init_val = soc_init_from_results(res)
+    return np.array(latencies), np.array(costs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=48)
+    parser.add_argument('--coarse-step', type=float, default=2.0,
+                        help='hours per step of the coarse plan')
+    parser.add_argument('--short', type=int, default=6,
+                        help='hourly steps of the tracking problem')
+    parser.add_argument('--steps', type=int, default=336)
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help='relative noise of the forecasts')
+    parser.add_argument('--solver', default="highs")
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    backend = make_backend(args.solver, param_mpc)
+    buildings = make_building_table(args.buildings)
+    profiles = make_profiles(buildings, args.steps + args.horizon)
+
+    def single(demands_and_pv, init_val):
+        return solve_central(demands_and_pv=demands_and_pv,
+                             buildings=buildings,
+                             n_horizon=args.horizon,
+                             param_mpc=param_mpc,
+                             init_val=init_val,
+                             backend=backend)
+
+    n_coarse = int(args.horizon // args.coarse_step)
+    day_grid = TimeGrid.from_blocks(
+        [(n_coarse, args.coarse_step),
+         (args.horizon - n_coarse * args.coarse_step, 1)])
+    planner = HierarchicalPlanner(buildings=buildings,
+                                  param_mpc=param_mpc,
+                                  backend=backend,
+                                  day_grid=day_grid,
+                                  n_short=args.short)
+
+    results = {}
+    for name, solve in (("single-level", single),
+                        ("two-level", planner.solve)):
+        latencies, costs = run(solve=solve,
+                               profiles=profiles,
+                               n_horizon=args.horizon,
+                               n_steps=args.steps,
+                               param_mpc=param_mpc,
+                               noise=args.noise,
+                               rng=np.random.default_rng(0))
+        results[name] = costs.sum()
+        print(f"{name:12s}: latency mean {1e3 * latencies.mean():7.2f} ms, "
+              f"p99 {1e3 * np.percentile(latencies, 99):7.2f} ms, "
+              f"max {1e3 * latencies.max():7.2f} ms, "
+              f"costs {costs.sum():12.2f}")
+    backend.dispose()
+    extra = results["two-level"] / results["single-level"] - 1
+    print(f"two-level costs {100 * extra:+.3f} % over {args.steps} steps, "
+          f"plans {planner.stats()}")
+
+
+if __name__ == '__main__':
+    main()
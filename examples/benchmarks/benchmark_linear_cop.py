@@ -0,0 +1,84 @@
+"""
+Solve time of the central MILP with the CoP as a parameter (linear heat
+pump equation) against the former bilinear form with the CoP as a decision
+variable, for a range of horizons.
+"""
+import argparse
+import time
+import numpy as np
+import gurobipy as gp
+from phoenaix.optimizer.formulation import \
+    build_central_model, \
+    set_solver_params
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon
+
+HORIZONS = (6, 12, 24, 48, 72)
+
+
+def solve(demands_and_pv, buildings, n_horizon, param_mpc, env, bilinear_cop):
+    model, _ = build_central_model(demands_and_pv=demands_and_pv,
+                                   buildings=buildings,
+                                   n_horizon=n_horizon,
+                                   param_mpc=param_mpc,
+                                   init_val=None,
+                                   env=env,
+                                   bilinear_cop=bilinear_cop)
+    set_solver_params(model, param_mpc)
+    start_time = time.perf_counter()
+    model.optimize()
+    solve_time = time.perf_counter() - start_time
+    obj = model.ObjVal if model.SolCount else float('nan')
+    model.dispose()
+    return solve_time, obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--samples', type=int, default=10,
+                        help='number of start hours per horizon')
+    parser.add_argument('--t-air', action='store_true',
+                        help='use a time varying outdoor temperature')
+    args = parser.parse_args()
+
+    buildings = make_buildings(args.buildings)
+    n_steps = 24 * 30
+    profiles = make_profiles(buildings, n_steps + max(HORIZONS))
+    param_mpc = mpc_params()
+    starts = np.linspace(0, n_steps, args.samples, endpoint=False).astype(int)
+
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+
+    for n_horizon in HORIZONS:
+        times = {False: [], True: []}
+        objs = {False: [], True: []}
+        for start in starts:
+            demands_and_pv = horizon(profiles, start, n_horizon)
+            if args.t_air:
+                hours = start + np.arange(n_horizon)
+                demands_and_pv['t_air'] = list(
+                    5 + 6 * np.sin(2 * np.pi * hours / 24 - np.pi / 2))
+            for bilinear_cop in (False, True):
+                solve_time, obj = solve(
+                    demands_and_pv, buildings, n_horizon, param_mpc, env,
+                    bilinear_cop)
+                times[bilinear_cop].append(solve_time)
+                objs[bilinear_cop].append(obj)
+
+        rel_diff = np.nanmax(np.abs(np.array(objs[True]) - np.array(objs[False])) /
+                             np.maximum(np.abs(objs[False]), 1e-9))
+        print(f"horizon {n_horizon:3d}: linear {1e3 * np.mean(times[False]):9.2f} ms, "
+              f"bilinear {1e3 * np.mean(times[True]):9.2f} ms "
+              f"(x{np.mean(times[True]) / np.mean(times[False]):.1f}), "
+              f"max relative objective difference {rel_diff:.2e}")
+    env.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Build time of the central MILP with the variable-by-variable builder
+(formulation.build_central_model) against the matrix builder
+(matrix_model.build_matrix_model). That both give the same plan is
+tested in tests/test_matrix_model.py.
+"""
+import argparse
+import time
+import gurobipy as gp
+from phoenaix.optimizer.formulation import build_central_model
+from phoenaix.optimizer.matrix_model import build_matrix_model
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon
+
+SIZES = ((5, 10), (20, 24), (100, 48))
+
+
+def timed_build(build_model, demands_and_pv, buildings, n_horizon,
+                param_mpc, env):
+    start_time = time.perf_counter()
+    model, _ = build_model(demands_and_pv=demands_and_pv,
+                           buildings=buildings,
+                           n_horizon=n_horizon,
+                           param_mpc=param_mpc,
+                           init_val=None,
+                           env=env)
+    model.update()
+    return model, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+
+    for n_buildings, n_horizon in SIZES:
+        buildings = make_buildings(n_buildings)
+        demands_and_pv = horizon(make_profiles(buildings, 24 * 7),
+                                 start=24 * 3, n_horizon=n_horizon)
+
+        times = {}
+        models = {}
+        for name, build_model in (('dict', build_central_model),
+                                  ('matrix', build_matrix_model)):
+            best = float('inf')
+            for _ in range(args.repeat):
+                if name in models:
+                    models[name].dispose()
+                models[name], build_time = timed_build(
+                    build_model, demands_and_pv, buildings, n_horizon,
+                    param_mpc, env)
+                best = min(best, build_time)
+            times[name] = best
+
+        line = (f"{n_buildings:4d} buildings x {n_horizon:3d} steps: "
+                f"{models['matrix'].NumVars:7d} vars, "
+                f"{models['matrix'].NumConstrs:7d} constrs | build dict "
+                f"{1e3 * times['dict']:9.2f} ms, matrix "
+                f"{1e3 * times['matrix']:7.2f} ms "
+                f"(x{times['dict'] / times['matrix']:.1f})")
+        print(line)
+
+        for model in models.values():
+            model.dispose()
+    env.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Forecast fan-out of an MPC cycle over the shared message bus
+(communication.message_bus.MessageBus).
+
+The MPC publishes /predict<id> for every building at once, one handler per
+building answers on /predicted and the MPC waits on its ForecastBarrier.
+The time of the publishes and the time until the barrier is complete are
+measured per cycle, on the in-process LocalBroker or, with --broker, over
+one connection to the MQTT broker of the settings, e.g. a local mosquitto.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from phoenaix.communication.local_broker import LocalBroker
+from phoenaix.communication.message_bus import \
+    MessageBus, \
+    mqtt_client
+from phoenaix.optimizer.forecast_barrier import ForecastBarrier
+
+
+def run(bus, n_buildings, n_cycles):
+    barrier = ForecastBarrier(building_ids=range(n_buildings))
+
+    def forecast(building_id):
+        def on_message(client, userdata, msg):
+            bus.publish('/predicted',
+                        json.dumps({'building_id': building_id,
+                                    'current_ix': 0}))
+        return on_message
+
+    def on_predicted(client, userdata, msg):
+        data = json.loads(msg.payload)
+        barrier.arrive(data['building_id'], data['current_ix'])
+
+    for building_id in range(n_buildings):
+        bus.subscribe(f'/predict{building_id}', forecast(building_id),
+                      inline=True)
+    bus.subscribe('/predicted', on_predicted, inline=True)
+    bus.start()
+    # let the subscriptions reach the broker
+    time.sleep(0.5)
+
+    publish_times, barrier_times = [], []
+    for _ in range(n_cycles):
+        barrier.start_cycle()
+        start_time = time.perf_counter()
+        bus.publish_many((f'/predict{building_id}', None)
+                         for building_id in range(n_buildings))
+        publish_times.append(time.perf_counter() - start_time)
+        barrier.wait()
+        barrier_times.append(barrier.times_to_barrier[-1])
+    bus.close()
+    return np.array(publish_times), np.array(barrier_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, nargs='+',
+                        default=[5, 100, 500])
+    parser.add_argument('--cycles', type=int, default=50)
+    parser.add_argument('--broker', action='store_true',
+                        help='use the MQTT broker of the settings')
+    args = parser.parse_args()
+
+    for n_buildings in args.buildings:
+        client = mqtt_client() if args.broker else LocalBroker().client()
+        publish_times, barrier_times = run(bus=MessageBus(client),
+                                           n_buildings=n_buildings,
+                                           n_cycles=args.cycles)
+        print(f"{n_buildings:4d} buildings: publish "
+              f"{1e6 * publish_times.mean():9.1f} us/cycle "
+              f"({1e6 * publish_times.mean() / n_buildings:5.2f} us/building), "
+              f"time to barrier mean {1e3 * barrier_times.mean():7.2f} ms, "
+              f"p99 {1e3 * np.percentile(barrier_times, 99):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Size and solve time of the central MILP with and without the reduction of
+fixed and dead columns (reduction.reduce_central_milp).
+"""
+import argparse
+import time
+import numpy as np
+import gurobipy as gp
+from phoenaix.optimizer.formulation import set_solver_params
+from phoenaix.optimizer.matrix_model import \
+    assemble_central_milp, \
+    to_gurobi
+from phoenaix.optimizer.reduction import reduce_central_milp
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon
+
+SIZES = ((5, 10), (20, 24), (100, 48))
+
+
+def solve(milp, param_mpc, env):
+    model, x, _ = to_gurobi(milp, env=env)
+    set_solver_params(model, param_mpc)
+    start_time = time.perf_counter()
+    model.optimize()
+    solve_time = time.perf_counter() - start_time
+    obj_val = model.ObjVal
+    model.dispose()
+    return solve_time, obj_val
+
+
+def run(n_buildings, n_horizon, n_samples, param_mpc, env):
+    buildings = make_buildings(n_buildings)
+    profiles = make_profiles(buildings, n_samples * 24 + n_horizon)
+
+    full_times, reduced_times, reduce_times, obj_diffs = [], [], [], []
+    for sample in range(n_samples):
+        milp = assemble_central_milp(
+            demands_and_pv=horizon(profiles, sample * 24, n_horizon),
+            buildings=buildings,
+            n_horizon=n_horizon,
+            param_mpc=param_mpc,
+            init_val=None)
+        full_time, full_obj = solve(milp, param_mpc, env)
+
+        reduced = reduce_central_milp(milp=milp,
+                                      buildings=buildings,
+                                      param_mpc=param_mpc)
+        reduced_time, reduced_obj = solve(reduced, param_mpc, env)
+
+        full_times.append(full_time)
+        reduced_times.append(reduced_time)
+        reduce_times.append(reduced.reduce_time)
+        obj_diffs.append(abs(full_obj - reduced_obj - reduced.obj_offset) /
+                         max(abs(full_obj), 1e-9))
+
+    summary = reduced.summary()
+    full_time = np.mean(full_times)
+    reduced_time = np.mean(reduce_times) + np.mean(reduced_times)
+    print(f"{n_buildings:4d} buildings, horizon {n_horizon:3d}: "
+          f"rows {summary['rows']:7d} -> {summary['rows'] - summary['rows_removed']:7d}, "
+          f"cols {summary['cols']:7d} -> {summary['cols'] - summary['cols_removed']:7d}, "
+          f"{len(summary['skipped_buildings'])} buildings skipped | "
+          f"solve {1e3 * full_time:8.2f} ms, "
+          f"reduce + solve {1e3 * reduced_time:8.2f} ms "
+          f"(reduce {1e3 * np.mean(reduce_times):6.2f} ms), "
+          f"speedup {full_time / reduced_time:5.2f}x, "
+          f"max rel. objective difference {max(obj_diffs):.1e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--samples', type=int, default=5)
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    param_mpc['gp']['mip_gap'] = 0.0
+
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+    for n_buildings, n_horizon in SIZES:
+        run(n_buildings, n_horizon, args.samples, param_mpc, env)
+    env.dispose()
+
+
+if __name__ == '__main__':
+    main()
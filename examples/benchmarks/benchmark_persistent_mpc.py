@@ -0,0 +1,106 @@
+"""
+Per-step build and solve time of the central MPC in a closed loop:
+rebuilding the model in every step (MPC._run_central_optimization) against
+the persistent model that only updates its right-hand sides.
+"""
+import argparse
+import time
+import numpy as np
+import gurobipy as gp
+from phoenaix.optimizer.formulation import \
+    build_central_model, \
+    set_solver_params
+from phoenaix.optimizer.persistent_model import PersistentCentralModel
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+
+def run_rebuild(profiles, buildings, param_mpc, n_horizon, n_steps, env):
+    build_times, solve_times, objs = [], [], []
+    soc_init = None
+    for step in range(n_steps):
+        demands_and_pv = horizon(profiles, step, n_horizon)
+
+        start_time = time.perf_counter()
+        model, handles = build_central_model(demands_and_pv=demands_and_pv,
+                                             buildings=buildings,
+                                             n_horizon=n_horizon,
+                                             param_mpc=param_mpc,
+                                             init_val=soc_init,
+                                             env=env)
+        set_solver_params(model, param_mpc)
+        build_times.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        model.optimize()
+        solve_times.append(time.perf_counter() - start_time)
+        objs.append(model.ObjVal)
+
+        soc_init = {'soc': {n: {'tes': handles['soc'][n]['tes'][0].X}
+                            for n in buildings}}
+        model.dispose()
+    return np.array(build_times), np.array(solve_times), np.array(objs)
+
+
+def run_persistent(profiles, buildings, param_mpc, n_horizon, n_steps, env):
+    central_model = PersistentCentralModel(buildings=buildings,
+                                           n_horizon=n_horizon,
+                                           param_mpc=param_mpc,
+                                           env=env)
+    build_times, solve_times, objs = [], [], []
+    soc_init = None
+    for step in range(n_steps):
+        res = central_model.solve(demands_and_pv=horizon(profiles, step, n_horizon),
+                                  init_val=soc_init)
+        build_times.append(central_model.build_time + central_model.update_time)
+        solve_times.append(central_model.solve_time)
+        objs.append(res.obj_val)
+        soc_init = soc_init_from_results(res)
+    central_model.dispose()
+    return np.array(build_times), np.array(solve_times), np.array(objs)
+
+
+def report(name, build_times, solve_times):
+    print(f"{name:>12}: build/update mean {1e3 * build_times.mean():8.2f} ms "
+          f"(first {1e3 * build_times[0]:8.2f} ms), "
+          f"solve mean {1e3 * solve_times.mean():8.2f} ms, "
+          f"total {build_times.sum() + solve_times.sum():7.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=200)
+    args = parser.parse_args()
+
+    buildings = make_buildings(args.buildings)
+    profiles = make_profiles(buildings, args.steps + args.horizon)
+    param_mpc = mpc_params()
+
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    env.start()
+
+    print(f"{args.buildings} buildings, horizon {args.horizon}, "
+          f"{args.steps} closed-loop steps")
+    rebuild = run_rebuild(profiles, buildings, param_mpc,
+                          args.horizon, args.steps, env)
+    report('rebuild', *rebuild[:2])
+    persistent = run_persistent(profiles, buildings, param_mpc,
+                                args.horizon, args.steps, env)
+    report('persistent', *persistent[:2])
+
+    rel_diff = np.abs(rebuild[2] - persistent[2]) / \
+        np.maximum(np.abs(rebuild[2]), 1e-9)
+    print(f"max relative objective difference: {rel_diff.max():.2e} "
+          f"(mip gap {param_mpc['gp']['mip_gap']})")
+    env.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Costs and step latency of the rule-based controller
+(rule_based.RuleBasedController) against the MILP of the MPC.
+
+Both run in closed loop over the 8200 hourly steps of the offline scenario
+of examples/simulation_example.py with perfect forecasts: every step
+applies the first step of the plan and starts the next one from its SOCs.
+The costs of every step are those of the objective of the MILP without
+the network load term. The synthetic profiles are used by default, --year
+runs on the profiles of the demonstrator (needs the data files).
+"""
+import argparse
+import time
+import numpy as np
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.explicit_policy import step_cost
+from phoenaix.optimizer.rule_based import RuleBasedController
+from benchmark_explicit_policy import year_profiles
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_building_table, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+
+def closed_loop(step, n_steps):
+    """Costs and seconds of every step of step(demands_and_pv, init_val)"""
+    init_val = None
+    costs, times = np.zeros(n_steps), np.zeros(n_steps)
+    for t in range(n_steps):
+        start_time = time.perf_counter()
+        res, cost = step(t, init_val)
+        times[t] = time.perf_counter() - start_time
+        costs[t] = cost
+        init_val = soc_init_from_results(res)
+    return costs, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--steps', type=int, default=8200)
+    parser.add_argument('--year', type=int, default=None,
+                        help='use the profiles of the demonstrator')
+    parser.add_argument('--solver', default="highs")
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    buildings = make_building_table(args.buildings)
+    if args.year is None:
+        profiles = make_profiles(buildings, args.steps + args.horizon)
+    else:
+        profiles = year_profiles(buildings, args.year)
+
+    start_time = time.perf_counter()
+    controller = RuleBasedController(buildings=buildings,
+                                     param_mpc=param_mpc)
+    print(f"rule-based controller compiled in "
+          f"{time.perf_counter() - start_time:.2f} s")
+
+    def rule_based(t, init_val):
+        # the forecasts in the format the MPC receives them
+        plan = controller.act(
+            demands_and_pv=horizon(profiles, t, args.horizon),
+            init_val=init_val)
+        return plan, step_cost(plan, param_mpc)
+
+    backend = make_backend(args.solver, param_mpc)
+    n_failed = 0
+
+    def milp(t, init_val):
+        nonlocal n_failed
+        res = solve_central(
+            demands_and_pv=horizon(profiles, t, args.horizon, as_arrays=True),
+            buildings=buildings,
+            n_horizon=args.horizon,
+            param_mpc=param_mpc,
+            init_val=init_val,
+            backend=backend)
+        if res is None:
+            n_failed += 1
+            return None, np.nan
+        return res, step_cost(res, param_mpc)
+
+    results = {}
+    for name, step in (("rule-based", rule_based), ("MILP", milp)):
+        costs, times = closed_loop(step, args.steps)
+        results[name] = costs
+        print(f"{name:10s}: costs {np.nansum(costs):12.2f}, step latency "
+              f"mean {1e3 * times.mean():8.3f} ms, "
+              f"p99 {1e3 * np.percentile(times, 99):8.3f} ms, "
+              f"max {1e3 * times.max():8.3f} ms")
+    backend.dispose()
+    extra = np.nansum(results["rule-based"]) / np.nansum(results["MILP"]) - 1
+    print(f"rule-based costs {100 * extra:+.2f} % against the MILP over "
+          f"{args.steps} steps, {n_failed} MILP steps without a solution")
+
+
+if __name__ == '__main__':
+    main()
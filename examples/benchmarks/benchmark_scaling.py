@@ -0,0 +1,95 @@
+"""
+Memory and step latency of the central MPC against the number of buildings.
+
+For every neighborhood size the device parameters are held once as nested
+dicts and once as buildings.BuildingTable, the forecasts once as dicts of
+lists and once as arrays. Reported are the memory of the device parameters,
+the time to build the right-hand sides and the matrix form of one step, the
+solve time of the reduced problem and the peak memory of the process.
+"""
+import argparse
+import resource
+import time
+import tracemalloc
+from phoenaix.optimizer.backends import \
+    BACKENDS, \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.matrix_model import assemble_central_milp
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_buildings, \
+    make_building_table, \
+    make_profiles, \
+    horizon
+
+
+def allocated(make):
+    """Object returned by make and the memory allocated for it in bytes"""
+    tracemalloc.start()
+    obj = make()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def assembly_time(buildings, demands_and_pv, n_horizon, param_mpc, samples):
+    start_time = time.perf_counter()
+    for _ in range(samples):
+        assemble_central_milp(demands_and_pv=demands_and_pv,
+                              buildings=buildings,
+                              n_horizon=n_horizon,
+                              param_mpc=param_mpc,
+                              init_val=None)
+    return (time.perf_counter() - start_time) / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--solver', default='highs', choices=list(BACKENDS))
+    parser.add_argument('--buildings', nargs='+', type=int,
+                        default=[5, 20, 50, 100, 200, 500])
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--samples', type=int, default=5)
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    backend = make_backend(args.solver, param_mpc)
+    print(f"{args.solver}, horizon {args.horizon}, assembly averaged over "
+          f"{args.samples} steps")
+    print(f"{'buildings':>9} {'dicts kB':>9} {'table kB':>9} "
+          f"{'assembly dicts ms':>18} {'assembly arrays ms':>19} "
+          f"{'solve ms':>9} {'peak RSS MB':>12}")
+    for n_buildings in args.buildings:
+        buildings, dict_size = allocated(lambda: make_buildings(n_buildings))
+        table, table_size = allocated(lambda: make_building_table(n_buildings))
+        profiles = make_profiles(buildings, args.horizon)
+        as_dicts = horizon(profiles, 0, args.horizon)
+        as_arrays = horizon(profiles, 0, args.horizon, as_arrays=True)
+
+        t_dicts = assembly_time(buildings, as_dicts, args.horizon, param_mpc,
+                                args.samples)
+        t_arrays = assembly_time(table, as_arrays, args.horizon, param_mpc,
+                                 args.samples)
+
+        start_time = time.perf_counter()
+        res = solve_central(demands_and_pv=as_arrays,
+                            buildings=table,
+                            n_horizon=args.horizon,
+                            param_mpc=param_mpc,
+                            init_val=None,
+                            backend=backend,
+                            reduce_model=True)
+        t_solve = time.perf_counter() - start_time
+        status = res.status if res is not None else "none"
+        # ru_maxrss is in kB on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+        print(f"{n_buildings:9d} {dict_size / 1e3:9.1f} {table_size / 1e3:9.1f} "
+              f"{1e3 * t_dicts:18.2f} {1e3 * t_arrays:19.2f} "
+              f"{1e3 * t_solve:9.1f} {peak_rss:12.1f}  {status}")
+    backend.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Run time of repeated closed-loop replays with and without the solution
+cache (solution_cache.SolutionCache).
+
+Every replay runs the MPC over the same synthetic profiles, like repeated
+offline simulations of a scenario, with a little noise on the forecasts.
+Forecasts only share a key if no value rounds to another multiple of the
+resolution, so the hit rate drops quickly once the noise reaches a small
+fraction of it. The cache is consulted in front of the solver the same
+way as in MPC.solve.
+"""
+import argparse
+import time
+import numpy as np
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.solution_cache import SolutionCache
+from phoenaix.optimizer.time_grid import TimeGrid
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_building_table, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+
+def replay(profiles, buildings, n_steps, n_horizon, param_mpc, backend,
+           cache, noise, rng):
+    grid = TimeGrid.uniform(n_horizon)
+    init_val = None
+    obj_vals = []
+    for step in range(n_steps):
+        demands_and_pv = horizon(profiles, step, n_horizon, as_arrays=True)
+        demands_and_pv = {
+            key: values + rng.uniform(-noise, noise, size=values.shape)
+            * (values > 0)
+            for key, values in demands_and_pv.items()}
+        res = None
+        if cache is not None:
+            key = cache.key(demands_and_pv=demands_and_pv,
+                            init_val=init_val,
+                            buildings=buildings,
+                            param_mpc=param_mpc,
+                            time_grid=grid)
+            res = cache.get(key)
+        if res is None:
+            res = solve_central(demands_and_pv=demands_and_pv,
+                                buildings=buildings,
+                                n_horizon=n_horizon,
+                                param_mpc=param_mpc,
+                                init_val=init_val,
+                                backend=backend)
+            if cache is not None:
+                cache.store(key, res)
+        obj_vals.append(res.obj_val)
+        init_val = soc_init_from_results(res)
+    return np.array(obj_vals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=5)
+    parser.add_argument('--horizon', type=int, default=24)
+    parser.add_argument('--steps', type=int, default=48)
+    parser.add_argument('--replays', type=int, default=5)
+    parser.add_argument('--cache-size', type=int, default=1000)
+    parser.add_argument('--noise', type=float, nargs='+',
+                        default=[0.0, 0.01, 0.5],
+                        help='forecast noise in W of every run with cache')
+    parser.add_argument('--solver', default="highs")
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    param_mpc['gp']['mip_gap'] = 0.0
+    backend = make_backend(args.solver, param_mpc)
+    buildings = make_building_table(args.buildings)
+    profiles = make_profiles(buildings, args.steps + args.horizon)
+
+    runs = [(None, 0.0)] + [(SolutionCache(max_size=args.cache_size), noise)
+                            for noise in args.noise]
+    for cache, noise in runs:
+        rng = np.random.default_rng(0)
+        start_time = time.perf_counter()
+        obj_vals = [replay(profiles=profiles,
+                           buildings=buildings,
+                           n_steps=args.steps,
+                           n_horizon=args.horizon,
+                           param_mpc=param_mpc,
+                           backend=backend,
+                           cache=cache,
+                           noise=noise,
+                           rng=rng)
+                    for _ in range(args.replays)]
+        wall_time = time.perf_counter() - start_time
+        spread = np.max(np.ptp(np.array(obj_vals), axis=0) /
+                        np.maximum(np.abs(obj_vals[0]), 1e-9))
+        label = "no cache" if cache is None else \
+            f"cache of {cache.max_size:5d}, noise {noise:5.2f} W"
+        print(f"{label:32s}: {args.replays} replays of {args.steps} steps in "
+              f"{wall_time:6.2f} s, "
+              f"{1e3 * wall_time / (args.replays * args.steps):7.2f} ms/step, "
+              f"max rel. objective spread over replays {spread:.1e}"
+              + ("" if cache is None else f" | {cache.stats()}"))
+    backend.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Solve time and closed-loop cost of the MPC on a uniform and a non-uniform
+time grid (time_grid.TimeGrid).
+
+Every configuration runs the MPC in closed loop over the same synthetic
+profiles: the first step of every plan is applied, its costs are summed up
+and its storage states are the initial states of the next step.
+"""
+import argparse
+import time
+import numpy as np
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.formulation import DT
+from phoenaix.optimizer.time_grid import TimeGrid
+from phoenaix.optimizer.synthetic_inputs import \
+    mpc_params, \
+    make_building_table, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+GRIDS = {
+    "uniform 24 h": TimeGrid.uniform(24),
+    "uniform 72 h": TimeGrid.uniform(72),
+    "blocks 72 h": TimeGrid.from_blocks([(12, 1), (6, 2), (6, 8)]),
+}
+
+
+def step_cost(res, param_mpc):
+    """Costs of the first step of a plan"""
+    eco = param_mpc["eco"]
+    return DT * (eco["gas"] * res.gas_from_grid[0] +
+                 eco["el_grid"] * res.p_demand[0] -
+                 eco["sell_pv"] * res.p_feed_pv[0])
+
+
+def run(grid, buildings, profiles, n_steps, param_mpc, backend, reduce_model):
+    solve_times, costs = [], []
+    init_val = None
+    for step in range(n_steps):
+        start_time = time.perf_counter()
+        res = solve_central(demands_and_pv=horizon(profiles, step,
+                                                   grid.n_values,
+                                                   as_arrays=True),
+                            buildings=buildings,
+                            n_horizon=grid.n_steps,
+                            param_mpc=param_mpc,
+                            init_val=init_val,
+                            backend=backend,
+                            reduce_model=reduce_model,
+                            time_grid=grid)
+        solve_times.append(time.perf_counter() - start_time)
+        if res is None:
+            raise RuntimeError(f"No solution in step {step}")
+        costs.append(step_cost(res, param_mpc))
+        init_val = soc_init_from_results(res)
+    return np.array(solve_times), np.array(costs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buildings', type=int, default=20)
+    parser.add_argument('--steps', type=int, default=48)
+    parser.add_argument('--solver', default="highs")
+    parser.add_argument('--reduce', action='store_true')
+    args = parser.parse_args()
+
+    param_mpc = mpc_params()
+    backend = make_backend(args.solver, param_mpc)
+    buildings = make_building_table(args.buildings)
+    n_values = max(grid.n_values for grid in GRIDS.values())
+    profiles = make_profiles(buildings, args.steps + n_values)
+
+    print(f"{args.buildings} buildings, {args.steps} closed-loop steps, "
+          f"{args.solver}{' with reduction' if args.reduce else ''}")
+    reference = None
+    for name, grid in GRIDS.items():
+        solve_times, costs = run(grid=grid,
+                                 buildings=buildings,
+                                 profiles=profiles,
+                                 n_steps=args.steps,
+                                 param_mpc=param_mpc,
+                                 backend=backend,
+                                 reduce_model=args.reduce)
+        total = costs.sum()
+        reference = total if reference is None else reference
+        print(f"{name:14s}: {grid.n_steps:3d} steps over {grid.hours:5.1f} h | "
+              f"solve mean {1e3 * solve_times.mean():8.2f} ms, "
+              f"p95 {1e3 * np.percentile(solve_times, 95):8.2f} ms | "
+              f"closed-loop cost {total:12.2f} "
+              f"({100 * (total / reference - 1):+6.2f} % to {next(iter(GRIDS))})")
+    backend.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ from phoenaix.optimizer.mpc import MPC
 from phoenaix.simulation.modelica import ModelicaAgent
 from phoenaix.utils.fiware_utils import clean_up
 from phoenaix.config import ROOT_DIR
+from phoenaix.settings import settings
 import copy
 import logging
 import threading
@@ -61,7 +62,7 @@ def main():
     stop_event = threading.Event()
     
     threads = []
-    for building_ix in range(5):
+    for building_ix in settings.BUILDING_IDS:
         t = threading.Thread(target=run_forecasts, args=[building_ix, stop_event])
         threads.append(t)
         t.start()
@@ -4,6 +4,7 @@ import copy
 from phoenaix.forecasts.buildingEnergyForecast import BuildingEnergyForecast
 from phoenaix.optimizer.mpc import MPC
 from phoenaix.simulation.modelica import ModelicaAgent
+from phoenaix.settings import settings
 from tqdm import tqdm
 import pandas as pd
 import copy
@@ -17,7 +18,7 @@ def main():
         data_model = json.load(f)
 
     building_forecasts = {}
-    for building_ix in range(5):
+    for building_ix in settings.BUILDING_IDS:
         
         entity_id = f'BuildingEnergyForecast:DEQ:MVP:{"{:03}".format(building_ix)}'
         building_energy_forecast = BuildingEnergyForecast(
@@ -84,9 +85,8 @@ def main():
         mpc_results = mpc.predict(input_dict=input_dict_mpc,
                                 soc_init=soc_init)
         
-        input_modelica_keys = ['relativePower1',
-                        'relativePower2',
-                        'relativePower3']
+        input_modelica_keys = [f'relativePower{building_ix}'
+                               for building_ix in settings.FMU_BUILDING_IDS]
         
         if mpc_results is None:
             n_inf += 1
@@ -98,14 +98,15 @@ def main():
         modelica_results = modelica.do_step(input_modelica)
         res = {**modelica_results, **input_modelica}
         results.append(copy.deepcopy(res))
-        soc_init = {'soc': {
-            0: {'tes': 0},
-            1: {'tes': modelica_results['SOC1']},
-            2: {'tes': modelica_results['SOC2']},
-            3: {'tes': modelica_results['SOC3']},
-            4: {'tes': 0},
-        }}
+        soc_init = {'soc': {building_ix: {'tes': 0}
+                            for building_ix in settings.BUILDING_IDS}}
+        for building_ix in settings.FMU_BUILDING_IDS:
+            soc_init['soc'][building_ix]['tes'] = \
+                modelica_results[f'SOC{building_ix}']
         
+    print(f'{n_inf} steps without MPC setpoints')
+    if mpc.plan_cache is not None:
+        print(f'Plan reuse: {mpc.plan_cache.stats()}')
     df = pd.DataFrame(results)
     
     df.to_csv('temp.csv')
@@ -1,2 +1,7 @@
+from phoenaix.communication.message_bus import \
+    MessageBus, \
+    shared_bus, \
+    install_bus
+from phoenaix.communication.local_broker import LocalBroker
 from phoenaix.communication.gateway import Gateway
 from phoenaix.communication.subscription_template import subscription_template
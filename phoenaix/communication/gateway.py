@@ -1,8 +1,8 @@
 from filip.clients.ngsi_v2.iota import IoTAClient
 from filip.clients.ngsi_v2.cb import ContextBrokerClient
 from filip.clients.ngsi_v2.quantumleap import QuantumLeapClient
-from paho.mqtt.client import MQTTv5, Client, MQTT_CLEAN_START_FIRST_ONLY
 import requests
+from phoenaix.communication.message_bus import shared_bus
 from phoenaix.settings import settings
 
 
@@ -11,16 +11,8 @@ class Gateway:
                  entity_type: str = None,
                  entity_id: str = None,
                  *args, **kwargs):
-        # MQTT client
-        self.mqtt_client = Client(protocol=MQTTv5)
-        if settings.MQTT_USER:
-            self.mqtt_client.username_pw_set(username=settings.MQTT_USER, password=settings.MQTT_PASSWORD)
-        if settings.MQTT_TLS:
-            self.mqtt_client.tls_set()
-        self.mqtt_client.connect(host=settings.MQTT_HOST,
-                                 port=settings.MQTT_PORT,
-                                 clean_start=MQTT_CLEAN_START_FIRST_ONLY
-                                 )
+        # MQTT, one connection per process shared by all agents
+        self.bus = shared_bus()
 
         # Fiware header
         # TODO any other restriction?
@@ -40,7 +32,7 @@ class Gateway:
         self.ql_client = QuantumLeapClient(url=settings.QL_URL, fiware_header=settings.fiware_header, session=s3)
 
     def health_check(self):
-        self.mqtt_client.publish(topic="health/check", payload="health check")
+        self.bus.publish(topic="health/check", payload="health check")
         self.cb_client.get_version()
         self.iota_client.get_version()
         self.ql_client.get_version()
@@ -0,0 +1,111 @@
+"""
+In-process stand-in for the MQTT broker.
+
+LocalBroker routes messages between LocalClients of the same process. A
+client has the part of the paho client interface that message_bus.
+MessageBus uses, so agents can run on a bus without a broker, e.g. in
+tests and benchmarks of the message flow. Like paho, every client delivers
+its messages in a network thread of its own, started by loop_start.
+"""
+import queue
+import threading
+from phoenaix.communication.message_bus import \
+    is_wildcard, \
+    topic_matches
+
+
+class LocalMessage:
+    """Message with the attributes of paho's MQTTMessage that are used"""
+
+    def __init__(self, topic: str, payload=None, qos: int = 0):
+        self.topic = topic
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode()
+        self.payload = payload
+        self.qos = qos
+
+
+class LocalBroker:
+    """Subscriptions of all LocalClients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # clients by topic, and the wildcard subscriptions of every client
+        self._subscribers = {}
+        self._wildcards = {}
+        self.n_routed = 0
+
+    def client(self):
+        """New client connected to this broker"""
+        return LocalClient(self)
+
+    def _subscribe(self, client, topic):
+        with self._lock:
+            if is_wildcard(topic):
+                self._wildcards.setdefault(client, set()).add(topic)
+            else:
+                self._subscribers.setdefault(topic, set()).add(client)
+
+    def _unsubscribe(self, client, topic):
+        with self._lock:
+            self._wildcards.get(client, set()).discard(topic)
+            self._subscribers.get(topic, set()).discard(client)
+
+    def _route(self, message):
+        with self._lock:
+            receivers = set(self._subscribers.get(message.topic, ()))
+            receivers.update(client
+                             for client, topics in self._wildcards.items()
+                             if any(topic_matches(topic, message.topic)
+                                    for topic in topics))
+            self.n_routed += 1
+        for client in receivers:
+            client._queue.put(message)
+
+
+class LocalClient:
+    """Client of a LocalBroker with the interface of a paho client"""
+
+    _STOP = object()
+
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+        self.on_connect = None
+        self.on_message = None
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self.broker._subscribe(self, topic)
+
+    def unsubscribe(self, topic: str):
+        self.broker._unsubscribe(self, topic)
+
+    def publish(self, topic: str, payload=None, qos: int = 0):
+        self.broker._route(LocalMessage(topic, payload, qos))
+
+    def loop_start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _loop(self):
+        # like paho, on_connect is called in the network thread
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+        while True:
+            message = self._queue.get()
+            if message is self._STOP:
+                return
+            if self.on_message is not None:
+                self.on_message(self, None, message)
@@ -0,0 +1,273 @@
+"""
+One MQTT connection per process, shared by all agents in it.
+
+The agents used to open a client each, the MPC even two plus the one of
+its Gateway, and all of them ran a network loop of their own. MessageBus
+wraps a single client: agents subscribe handlers to topics, messages are
+dispatched to all handlers of matching subscriptions. The handlers keep the
+signature of paho's on_message, (client, userdata, msg). Every handler runs
+in a worker thread of its own, so a slow agent, e.g. the ModelicaAgent
+waiting for the end of its cycle, does not hold up the messages of the
+others. Short handlers may run inline in the network thread instead.
+
+The client is a paho client connected to settings.MQTT_HOST or a client of
+local_broker.LocalBroker, which stands in for the broker in tests and
+benchmarks.
+
+paho holds its callback mutex while it calls on_message and takes the same
+mutex in publish, subscribe and unsubscribe. The lock of the bus is
+therefore never held around a call of the client, else a publish in one
+thread and a message arriving in the network thread would wait for each
+other. The client itself is thread-safe.
+"""
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def is_wildcard(subscription: str) -> bool:
+    return "+" in subscription or "#" in subscription
+
+
+def topic_matches(subscription: str, topic: str) -> bool:
+    """Whether a topic matches a subscription with the wildcards + and #"""
+    sub_levels = subscription.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(sub_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(sub_levels) == len(topic_levels)
+
+
+class _Worker:
+    """Thread that calls one handler for the messages in its queue"""
+
+    _STOP = object()
+
+    def __init__(self, bus, handler):
+        self.bus = bus
+        self.handler = handler
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                return
+            self.bus._call(self.handler, *item)
+
+    def stop(self):
+        self.queue.put(self._STOP)
+
+
+class MessageBus:
+    """
+    Topic based dispatch on one MQTT client.
+
+    Args:
+        client: paho.mqtt.client.Client or local_broker.LocalClient, its
+            on_connect and on_message are taken over by the bus
+        qos: quality of service of subscriptions and publishes
+    """
+
+    def __init__(self, client, qos: int = 0):
+        self.client = client
+        self.qos = qos
+        # guards the subscriptions and counters, never held around calls
+        # of the client
+        self._lock = threading.Lock()
+        self._handlers = defaultdict(list)
+        # subscriptions with wildcards, all others are looked up directly
+        self._wildcards = set()
+        self._workers = {}
+        self._n_running = 0
+        self._connected = False
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+
+        self.n_published = 0
+        self.n_received = 0
+        self.n_dispatched = 0
+        self.n_errors = 0
+
+    def subscribe(self, topic: str, handler, inline: bool = False):
+        """
+        Call handler(client, userdata, msg) for every message on topic.
+
+        Args:
+            inline: call the handler in the network thread, only for
+                handlers that return within microseconds
+        """
+        with self._lock:
+            new_topic = topic not in self._handlers
+            self._handlers[topic].append(handler)
+            if is_wildcard(topic):
+                self._wildcards.add(topic)
+            if not inline and handler not in self._workers:
+                self._workers[handler] = _Worker(self, handler)
+            subscribe = new_topic and self._connected
+        if subscribe:
+            self.client.subscribe(topic, self.qos)
+
+    def unsubscribe(self, topic: str, handler):
+        worker = None
+        unsubscribe = False
+        with self._lock:
+            handlers = self._handlers.get(topic, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            if not handlers and topic in self._handlers:
+                del self._handlers[topic]
+                self._wildcards.discard(topic)
+                unsubscribe = self._connected
+            if handler in self._workers and \
+                    not any(handler in topic_handlers
+                            for topic_handlers in self._handlers.values()):
+                worker = self._workers.pop(handler)
+        if unsubscribe:
+            self.client.unsubscribe(topic)
+        if worker is not None:
+            worker.stop()
+
+    def publish(self, topic: str, payload=None):
+        self.client.publish(topic, payload, self.qos)
+        with self._lock:
+            self.n_published += 1
+
+    def publish_many(self, messages):
+        """
+        Publish several messages at once.
+
+        Args:
+            messages: iterable of (topic, payload)
+        """
+        n_published = 0
+        for topic, payload in messages:
+            self.client.publish(topic, payload, self.qos)
+            n_published += 1
+        with self._lock:
+            self.n_published += n_published
+
+    def start(self):
+        """Start the network loop, once for all agents that call it"""
+        with self._lock:
+            self._n_running += 1
+            start = self._n_running == 1
+        if start:
+            self.client.loop_start()
+
+    def stop(self):
+        """Stop the network loop after the last agent stopped"""
+        with self._lock:
+            self._n_running -= 1
+            stop = self._n_running == 0
+        if stop:
+            self.client.loop_stop()
+
+    def close(self):
+        """Stop the network loop and all worker threads"""
+        with self._lock:
+            running = self._n_running > 0
+            self._n_running = 0
+            workers, self._workers = self._workers, {}
+        if running:
+            self.client.loop_stop()
+        for worker in workers.values():
+            worker.stop()
+
+    def run(self, stop_event: threading.Event = None):
+        """Run the network loop until stop_event is set, forever if None"""
+        self.start()
+        try:
+            (stop_event or threading.Event()).wait()
+        finally:
+            self.stop()
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        # (re)subscribe all topics on every new connection
+        with self._lock:
+            self._connected = True
+            topics = list(self._handlers)
+        for topic in topics:
+            client.subscribe(topic, self.qos)
+        logger.info(f'Connected with result code {rc}, subscribed '
+                    f'{len(topics)} topics')
+
+    def _on_message(self, client, userdata, msg):
+        with self._lock:
+            handlers = list(self._handlers.get(msg.topic, ()))
+            for subscription in self._wildcards:
+                if topic_matches(subscription, msg.topic):
+                    handlers += self._handlers[subscription]
+            self.n_received += 1
+            workers = [self._workers.get(handler) for handler in handlers]
+        for handler, worker in zip(handlers, workers):
+            if worker is None:
+                self._call(handler, client, userdata, msg)
+            else:
+                worker.queue.put((client, userdata, msg))
+
+    def _call(self, handler, client, userdata, msg):
+        try:
+            handler(client, userdata, msg)
+            self.n_dispatched += 1
+        except Exception:
+            self.n_errors += 1
+            logger.exception(f'Handler of {msg.topic} failed')
+
+    def stats(self) -> dict:
+        return {"topics": len(self._handlers),
+                "published": self.n_published,
+                "received": self.n_received,
+                "dispatched": self.n_dispatched,
+                "errors": self.n_errors}
+
+
+def mqtt_client():
+    """paho client connected to the broker of the settings"""
+    # only needed for a real broker, the local one works without paho
+    from paho.mqtt.client import Client, MQTTv5, MQTT_CLEAN_START_FIRST_ONLY
+    from phoenaix.settings import settings
+
+    client = Client(protocol=MQTTv5)
+    if settings.MQTT_USER:
+        client.username_pw_set(username=settings.MQTT_USER,
+                               password=settings.MQTT_PASSWORD)
+    if settings.MQTT_TLS:
+        client.tls_set()
+    client.connect(host=settings.MQTT_HOST,
+                   port=settings.MQTT_PORT,
+                   clean_start=MQTT_CLEAN_START_FIRST_ONLY)
+    return client
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def shared_bus() -> MessageBus:
+    """
+    The MessageBus of this process, connected to the broker of the
+    settings on the first call unless one was installed with install_bus.
+    """
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = MessageBus(mqtt_client())
+    return _bus
+
+
+def install_bus(bus: MessageBus):
+    """Use bus as the shared bus, e.g. on a local_broker.LocalBroker"""
+    global _bus
+    with _bus_lock:
+        _bus = bus
@@ -1,11 +1,9 @@
 from pathlib import Path
 from phoenaix.machine_learning.heat_demand_forecast import HeatingDemandLearner
 import numpy as np
-import paho.mqtt.client as mqtt
 from phoenaix.machine_learning.heat_demand_forecast import HeatingDemandLearner
 import json
 import pandas as pd
-import time
 from phoenaix.utils.load_demands import load_demands_and_pv
 from phoenaix.settings import settings
 from phoenaix.utils.setup_logger import setup_logger
@@ -24,18 +22,13 @@ class BuildingEnergyForecast(Device):
         super().__init__(*args, **kwargs)
         self.offline_modus = offline_modus
 
-        if not self.offline_modus:
-            self.mqtt_client = mqtt.Client()
-            self.mqtt_client.on_connect = self.on_connect
-            self.mqtt_client.on_message = self.on_message
-            self.mqtt_client.connect(host=settings.MQTT_HOST,
-                                     port=settings.MQTT_PORT)
-
         self.n_horizon = settings.N_HORIZON
         self.timestep = settings.TIMESTEP
 
         self.building_ix = building_ix
         self.topic = f"/predict{self.building_ix}"
+        if not self.offline_modus:
+            self.bus.subscribe(self.topic, self.on_message)
 
         self.attribute_df_dict = {
             'electricityDemand': ('elec', building_ix),
@@ -54,8 +47,8 @@ class BuildingEnergyForecast(Device):
 
         # TODO 3600 is at the moment hardcoded as .iloc[::4]
         important_columns = list(self.attribute_df_dict.values())
-        self.load_demands_and_pv = load_demands_and_pv()[
-            important_columns].iloc[::4].copy()
+        self.load_demands_and_pv = load_demands_and_pv(
+            building_ids=[self.building_ix])[important_columns].iloc[::4].copy()
 
         self.max_n = self.load_demands_and_pv.shape[0]
 
@@ -102,12 +95,6 @@ class BuildingEnergyForecast(Device):
 
         assert self.attribute_df_dict.keys() == self.attribute_name_dict.keys()
 
-    def on_connect(self, client, userdata, flags, rc):
-        print("Connected with result code "+str(rc))
-        # Subscribe to the /predict topic
-        client.subscribe(self.topic)
-        print(f'Subscribed to topic {self.topic}')
-
     def on_message(self, client, userdata, msg):
         if msg.topic != self.topic:
             return
@@ -179,8 +166,7 @@ class BuildingEnergyForecast(Device):
 
         payload = {'building_id': self.building_ix,
                    'current_ix': self.ix}
-        self.mqtt_client.publish('/predicted',
-                                 payload=json.dumps(payload))
+        self.bus.publish('/predicted', payload=json.dumps(payload))
 
         self.ix += 1
         if self.ix > self.max_n:
@@ -193,15 +179,8 @@ class BuildingEnergyForecast(Device):
             self.logger.error(
                 'You cant run this, if it is set to be in offline modus!')
             return
-        
-        if self.stop_event is not None:
-            self.mqtt_client.loop_start()
-            while not self.stop_event.is_set():
-                time.sleep(1)
-            self.mqtt_client.loop_stop()
 
-        else:
-            self.mqtt_client.loop_forever()
+        self.bus.run(stop_event=self.stop_event)
 
 
 if __name__ == '__main__':
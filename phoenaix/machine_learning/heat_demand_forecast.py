@@ -37,7 +37,8 @@ class HeatingDemandLearner:
 
     def _get_data(self):
         # TODO hardcoded to go to 1 hour intervals
-        data = load_demands_and_pv().iloc[::4].copy()
+        data = load_demands_and_pv(
+            building_ids=[self.building_ix]).iloc[::4].copy()
         new_cols = [f'{i[0]}_{i[1]}' for i in list(data)]
         data_new = pd.DataFrame(columns=new_cols, data=data.to_numpy())
         tsd = Tsd(data_new)
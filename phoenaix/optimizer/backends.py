@@ -0,0 +1,401 @@
+"""
+Solver backends for the matrix form of the central MILP.
+
+Every backend takes a CentralMILP (or a ReducedMILP) and returns a Solution
+with the values of all its columns. The solver parameters in param_mpc["gp"]
+are mapped to the options of each solver:
+
+=============  ==========  ===============================================
+param_mpc      Gurobi      HiGHS
+=============  ==========  ===============================================
+time_limit     TimeLimit   time_limit
+mip_gap        MIPGap      mip_rel_gap
+numeric_focus  MIPFocus    mip_heuristic_effort (highspy only, see
+                           HIGHS_FOCUS_EFFORT)
+threads        Threads     threads (highspy only), optional
+=============  ==========  ===============================================
+
+HiGHS is used through highspy if it is installed and through
+scipy.optimize.milp otherwise, so no licence is needed for it.
+
+A deadline.Deadline caps the time limit of all backends. Gurobi
+additionally stops at an incumbent with the acceptable gap of the deadline.
+"""
+import logging
+import time
+import numpy as np
+import gurobipy as gp
+from scipy.optimize import \
+    milp as scipy_milp, \
+    Bounds, \
+    LinearConstraint
+from phoenaix.optimizer.formulation import set_solver_params
+from phoenaix.optimizer.deadline import optimize_with_deadline
+from phoenaix.optimizer.diagnostics import submit_iis
+from phoenaix.optimizer.matrix_model import \
+    assemble_central_milp, \
+    to_gurobi
+from phoenaix.optimizer.reduction import reduce_central_milp
+from phoenaix.optimizer.results import \
+    MPCResult, \
+    OPTIMAL, \
+    TIME_LIMIT, \
+    INFEASIBLE, \
+    NO_SOLUTION, \
+    gurobi_status
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+logger = logging.getLogger(__name__)
+
+# Heuristic effort of HiGHS for the values of MIPFocus. A focus on feasible
+# solutions (1) spends more time in the primal heuristics, a focus on the
+# bound (2, 3) less. HiGHS default is 0.05.
+HIGHS_FOCUS_EFFORT = {0: 0.05, 1: 0.3, 2: 0.02, 3: 0.0}
+
+
+class Solution:
+    """
+    Solution of a MILP in matrix form.
+
+    Args:
+        x: values of all columns, None without a feasible solution
+        status: one of OPTIMAL, TIME_LIMIT, INFEASIBLE and NO_SOLUTION
+        obj_val: objective value of x
+        mip_gap: relative gap of x
+        solve_time: wall time of the solver in seconds
+    """
+
+    def __init__(self,
+                 x: np.ndarray = None,
+                 status: str = NO_SOLUTION,
+                 obj_val: float = None,
+                 mip_gap: float = None,
+                 solve_time: float = 0.0):
+        self.x = x
+        self.status = status
+        self.obj_val = obj_val
+        self.mip_gap = mip_gap
+        self.solve_time = solve_time
+
+    @property
+    def has_solution(self) -> bool:
+        return self.x is not None
+
+
+class GurobiBackend:
+    """
+    Solve with gurobi, in an own environment that is started once or in one
+    of an env_pool.EnvPool per solve.
+
+    Args:
+        param_mpc: MPC parameters with the solver settings in "gp"
+        diagnose: compute and write the IIS of infeasible problems in the
+            background, see diagnostics.submit_iis
+        env: gurobi environment to use instead of an own one
+        pool: env_pool.EnvPool to take the environment of every solve from,
+            a solve that finds no free one before its deadline returns
+            without a solution
+    """
+    name = "gurobi"
+
+    def __init__(self,
+                 param_mpc: dict,
+                 diagnose: bool = True,
+                 env=None,
+                 pool=None):
+        self.param_mpc = param_mpc
+        self.diagnose = diagnose
+        self.pool = pool
+        self._own_env = env is None and pool is None
+        if self._own_env:
+            env = gp.Env(empty=True)
+            env.setParam('OutputFlag', 0)
+            env.start()
+        self.env = env
+
+    def solve(self, milp, deadline=None) -> Solution:
+        if self.pool is None:
+            return self._solve(milp, deadline, self.env)
+        try:
+            with self.pool.acquire(deadline) as env:
+                return self._solve(milp, deadline, env)
+        except TimeoutError as e:
+            logger.warning(f'Solve skipped: {e}')
+            return Solution(status=NO_SOLUTION)
+
+    def _solve(self, milp, deadline, env) -> Solution:
+        model, x, _ = to_gurobi(milp, env=env)
+        # disposed also on a GurobiError, e.g. of a size-limited licence, so
+        # that a pooled environment goes back without a model on it
+        try:
+            set_solver_params(model, self.param_mpc)
+
+            start_time = time.perf_counter()
+            optimize_with_deadline(
+                model=model,
+                deadline=deadline,
+                time_limit=self.param_mpc["gp"]["time_limit"])
+            solution = Solution(status=gurobi_status(model),
+                                solve_time=time.perf_counter() - start_time)
+
+            if solution.status == INFEASIBLE and self.diagnose:
+                submit_iis(model)
+            if model.SolCount > 0:
+                solution.x = x.X
+                solution.obj_val = model.ObjVal
+                solution.mip_gap = model.MIPGap if model.IsMIP else 0.0
+            return solution
+        finally:
+            model.dispose()
+
+    def dispose(self):
+        if self._own_env:
+            self.env.dispose()
+
+
+class HighsBackend:
+    """
+    Solve with HiGHS, via highspy if it is installed or via
+    scipy.optimize.milp.
+
+    Args:
+        param_mpc: MPC parameters with the solver settings in "gp"
+        interface: "highspy", "scipy" or None for highspy if available
+    """
+    name = "highs"
+
+    def __init__(self,
+                 param_mpc: dict,
+                 interface: str = None):
+        self.param_mpc = param_mpc
+        if interface is None:
+            interface = "scipy" if highspy is None else "highspy"
+        if interface == "highspy" and highspy is None:
+            raise ImportError("highspy is not installed")
+        self.interface = interface
+
+    @staticmethod
+    def _row_bounds(milp):
+        row_lb = np.where(milp.sense == "<", -np.inf, milp.rhs)
+        row_ub = np.where(milp.sense == ">", np.inf, milp.rhs)
+        return row_lb, row_ub
+
+    def solve(self, milp, deadline=None) -> Solution:
+        time_limit = self.param_mpc["gp"]["time_limit"]
+        if deadline is not None:
+            time_limit = deadline.time_limit(time_limit)
+        if self.interface == "highspy":
+            return self._solve_highspy(milp, time_limit)
+        return self._solve_scipy(milp, time_limit)
+
+    def _solve_scipy(self, milp, time_limit) -> Solution:
+        params = self.param_mpc["gp"]
+        row_lb, row_ub = self._row_bounds(milp)
+
+        start_time = time.perf_counter()
+        res = scipy_milp(c=milp.c,
+                         constraints=LinearConstraint(milp.A, row_lb, row_ub),
+                         bounds=Bounds(milp.lb, milp.ub),
+                         integrality=(milp.vtype != "C").astype(int),
+                         options={"time_limit": time_limit,
+                                  "mip_rel_gap": params["mip_gap"],
+                                  "disp": False})
+        solve_time = time.perf_counter() - start_time
+
+        if res.status == 0:
+            status = OPTIMAL
+        elif res.status == 2:
+            status = INFEASIBLE
+        elif res.status == 1 and res.x is not None:
+            status = TIME_LIMIT
+        else:
+            status = NO_SOLUTION
+
+        if res.x is None:
+            return Solution(status=status, solve_time=solve_time)
+        return Solution(x=res.x,
+                        status=status,
+                        obj_val=res.fun,
+                        mip_gap=getattr(res, "mip_gap", 0.0),
+                        solve_time=solve_time)
+
+    def _solve_highspy(self, milp, time_limit) -> Solution:
+        params = self.param_mpc["gp"]
+        row_lb, row_ub = self._row_bounds(milp)
+        A = milp.A.tocsc()
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = milp.n_cols
+        lp.num_row_ = milp.n_rows
+        lp.col_cost_ = milp.c
+        lp.col_lower_ = milp.lb
+        lp.col_upper_ = milp.ub
+        lp.row_lower_ = row_lb
+        lp.row_upper_ = row_ub
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        lp.integrality_ = [highspy.HighsVarType.kInteger if vtype != "C"
+                           else highspy.HighsVarType.kContinuous
+                           for vtype in milp.vtype]
+
+        h = highspy.Highs()
+        h.setOptionValue("output_flag", False)
+        h.setOptionValue("time_limit", float(time_limit))
+        h.setOptionValue("mip_rel_gap", float(params["mip_gap"]))
+        h.setOptionValue("mip_heuristic_effort",
+                         HIGHS_FOCUS_EFFORT.get(params["numeric_focus"], 0.05))
+        if "threads" in params:
+            h.setOptionValue("threads", int(params["threads"]))
+        h.passModel(lp)
+
+        start_time = time.perf_counter()
+        h.run()
+        solve_time = time.perf_counter() - start_time
+
+        model_status = h.getModelStatus()
+        info = h.getInfo()
+        has_solution = info.primal_solution_status == 2
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            status = OPTIMAL
+        elif model_status in (highspy.HighsModelStatus.kInfeasible,
+                              highspy.HighsModelStatus.kUnboundedOrInfeasible):
+            status = INFEASIBLE
+        elif has_solution:
+            status = TIME_LIMIT
+        else:
+            status = NO_SOLUTION
+
+        if not has_solution:
+            return Solution(status=status, solve_time=solve_time)
+        return Solution(x=np.array(h.getSolution().col_value),
+                        status=status,
+                        obj_val=info.objective_function_value,
+                        mip_gap=info.mip_gap,
+                        solve_time=solve_time)
+
+    def dispose(self):
+        pass
+
+
+BACKENDS = {
+    "gurobi": GurobiBackend,
+    "highs": HighsBackend,
+}
+
+
+def make_backend(solver: str,
+                 param_mpc: dict,
+                 **kwargs):
+    """
+    Create the backend of a solver.
+
+    Args:
+        solver: one of the keys of BACKENDS
+        param_mpc: MPC parameters with the solver settings in "gp"
+        kwargs: passed to the backend
+    """
+    if solver not in BACKENDS:
+        raise ValueError(f"Unknown solver {solver}, use one of "
+                         f"{list(BACKENDS)}")
+    return BACKENDS[solver](param_mpc, **kwargs)
+
+
+def solve_central(demands_and_pv,
+                  buildings,
+                  n_horizon,
+                  param_mpc,
+                  init_val,
+                  backend,
+                  reduce_model: bool = False,
+                  deadline=None,
+                  time_grid=None):
+    """
+    Assemble the central MILP in matrix form and solve it with a backend,
+    see solve_central_with_status.
+
+    Returns:
+        MPCResult or None without a feasible solution
+    """
+    res, _ = solve_central_with_status(demands_and_pv=demands_and_pv,
+                                       buildings=buildings,
+                                       n_horizon=n_horizon,
+                                       param_mpc=param_mpc,
+                                       init_val=init_val,
+                                       backend=backend,
+                                       reduce_model=reduce_model,
+                                       deadline=deadline,
+                                       time_grid=time_grid)
+    return res
+
+
+def solve_central_with_status(demands_and_pv,
+                              buildings,
+                              n_horizon,
+                              param_mpc,
+                              init_val,
+                              backend,
+                              reduce_model: bool = False,
+                              deadline=None,
+                              time_grid=None):
+    """
+    Assemble the central MILP in matrix form and solve it with a backend.
+
+    Args:
+        backend: a backend of BACKENDS
+        reduce_model: remove fixed and dead columns before solving, see
+            reduction.reduce_central_milp. The sizes of the full and the
+            reduced problem are returned in MPCResult.info.
+        deadline: deadline.Deadline of the solve or None
+        time_grid: time_grid.TimeGrid of the horizon or None for n_horizon
+            steps of DT
+
+    Returns:
+        MPCResult or None without a feasible solution, and the status of
+        the solve, which tells an infeasible problem (INFEASIBLE) from one
+        that was stopped without a solution (NO_SOLUTION)
+    """
+    milp = assemble_central_milp(demands_and_pv=demands_and_pv,
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=init_val,
+                                 time_grid=time_grid)
+    info = {"backend": backend.name}
+    problem = milp
+    if reduce_model:
+        problem = reduce_central_milp(milp=milp,
+                                      buildings=buildings,
+                                      param_mpc=param_mpc)
+        info.update(problem.summary())
+
+    # All columns are fixed if no building has dispatch freedom
+    if problem.n_cols == 0:
+        solution = Solution(x=np.zeros(0), status=OPTIMAL, obj_val=0.0,
+                            mip_gap=0.0)
+    else:
+        solution = backend.solve(problem, deadline=deadline)
+    info["solve_time"] = solution.solve_time
+    if not solution.has_solution:
+        return None, solution.status
+
+    values = solution.x
+    obj_val = solution.obj_val
+    if reduce_model:
+        values = problem.expand(values)
+        obj_val += problem.obj_offset
+
+    res = MPCResult(values=values,
+                    columns=milp.columns,
+                    building_ids=milp.building_ids,
+                    param_mpc=param_mpc,
+                    status=solution.status,
+                    obj_val=obj_val,
+                    mip_gap=solution.mip_gap,
+                    info=info)
+    return res, solution.status
@@ -0,0 +1,169 @@
+"""
+Parallel solving of many independent MPC horizons.
+
+Offline studies, for example an open-loop evaluation on precomputed
+forecasts, solve many horizons whose initial SOCs do not depend on each
+other. solve_batch distributes them over a process pool. Every worker
+creates its solver backend once, with its own gurobi environment, and
+solves with a single thread, so the workers do not compete for cores.
+"""
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.matrix_model import assemble_central_milp
+from phoenaix.optimizer.results import \
+    MPCResult, \
+    NO_SOLUTION
+
+# state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(buildings, n_horizon, param_mpc, solver, reduce_model,
+                 time_grid):
+    param_mpc = copy.deepcopy(param_mpc)
+    param_mpc["gp"]["threads"] = 1
+    _worker.update(buildings=buildings,
+                   n_horizon=n_horizon,
+                   param_mpc=param_mpc,
+                   reduce_model=reduce_model,
+                   time_grid=time_grid,
+                   backend=make_backend(solver, param_mpc))
+
+
+def _solve_one(task):
+    demands_and_pv, init_val = task
+    res = solve_central(demands_and_pv=demands_and_pv,
+                        buildings=_worker["buildings"],
+                        n_horizon=_worker["n_horizon"],
+                        param_mpc=_worker["param_mpc"],
+                        init_val=init_val,
+                        backend=_worker["backend"],
+                        reduce_model=_worker["reduce_model"],
+                        time_grid=_worker["time_grid"])
+    if res is None:
+        return None, NO_SOLUTION, np.nan, np.nan
+    return res.values, res.status, res.obj_val, res.mip_gap
+
+
+class BatchResult:
+    """
+    Solutions of a batch of horizons, stacked along a first batch axis.
+
+    Args:
+        values: solution vectors of shape (batch, columns), NaN for the
+            horizons without a solution
+        columns: column layout shared by all solutions
+        building_ids: keys of the buildings
+        param_mpc: MPC parameters
+        status: status of every horizon
+        obj_val: objective values of shape (batch,)
+        mip_gap: MIP gaps of shape (batch,)
+        wall_time: wall time of the whole batch in seconds
+        n_workers: number of worker processes
+    """
+
+    def __init__(self, values, columns, building_ids, param_mpc, status,
+                 obj_val, mip_gap, wall_time, n_workers):
+        self.values = values
+        self.columns = columns
+        self.building_ids = building_ids
+        self.param_mpc = param_mpc
+        self.status = status
+        self.obj_val = obj_val
+        self.mip_gap = mip_gap
+        self.wall_time = wall_time
+        self.n_workers = n_workers
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, i) -> MPCResult:
+        return MPCResult(values=self.values[i],
+                         columns=self.columns,
+                         building_ids=self.building_ids,
+                         param_mpc=self.param_mpc,
+                         status=self.status[i],
+                         obj_val=self.obj_val[i],
+                         mip_gap=self.mip_gap[i])
+
+    def get(self, name) -> np.ndarray:
+        """Values of one column group, shaped (batch, building, time),
+        (batch, time) or (batch,)"""
+        return self.values[:, self.columns[name]]
+
+    @property
+    def throughput(self) -> float:
+        """Solved horizons per second"""
+        return len(self) / self.wall_time
+
+
+def solve_batch(inputs: list,
+                init_vals: list,
+                buildings: dict,
+                n_horizon: int,
+                param_mpc: dict,
+                solver: str = "gurobi",
+                reduce_model: bool = False,
+                n_workers: int = None,
+                chunksize: int = 1,
+                time_grid=None):
+    """
+    Solve independent horizons in a process pool.
+
+    Args:
+        inputs: forecasts of every horizon in the input format of
+            MPC.predict
+        init_vals: initial SOCs of every horizon, entries may be None
+        buildings: device parameters of all buildings
+        n_horizon: number of time steps of every horizon
+        param_mpc: MPC parameters
+        solver: solver backend, see backends.BACKENDS
+        reduce_model: reduce every problem before solving it
+        n_workers: number of worker processes, all cores by default
+        chunksize: horizons sent to a worker at once
+        time_grid: time_grid.TimeGrid of all horizons or None
+
+    Returns:
+        BatchResult
+    """
+    if init_vals is None:
+        init_vals = [None] * len(inputs)
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    # all problems share the column layout of the first one
+    milp = assemble_central_milp(demands_and_pv=inputs[0],
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=init_vals[0],
+                                 time_grid=time_grid)
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             initializer=_init_worker,
+                             initargs=(buildings, n_horizon, param_mpc,
+                                       solver, reduce_model,
+                                       time_grid)) as pool:
+        solutions = list(pool.map(_solve_one, zip(inputs, init_vals),
+                                  chunksize=chunksize))
+    wall_time = time.perf_counter() - start_time
+
+    values = np.full((len(inputs), milp.n_cols), np.nan)
+    for i, (x, _, _, _) in enumerate(solutions):
+        if x is not None:
+            values[i] = x
+    return BatchResult(values=values,
+                       columns=milp.columns,
+                       building_ids=milp.building_ids,
+                       param_mpc=param_mpc,
+                       status=[status for _, status, _, _ in solutions],
+                       obj_val=np.array([obj for _, _, obj, _ in solutions]),
+                       mip_gap=np.array([gap for _, _, _, gap in solutions]),
+                       wall_time=wall_time,
+                       n_workers=n_workers)
@@ -0,0 +1,149 @@
+"""
+Device parameters of a neighborhood as a table of arrays.
+
+The nested dicts of MPC.load_buildings ({building: {device: {key: value}}})
+are walked building by building wherever a parameter is needed, which gets
+slow and memory hungry for hundreds of buildings. BuildingTable holds every
+parameter as one NumPy column of shape (building,). It still iterates over
+the building ids and returns the nested dict of a building on indexing, so
+code written against the dicts keeps working.
+"""
+import numpy as np
+
+# Heater types, the column 'heater' of Devs.xlsx
+HEATER_TYPES = ("boi", "hp")
+
+# Column of every device parameter in the nested dict format
+DEVICE_KEYS = {
+    "cap_boi": ("boi", "cap"),
+    "eta_th": ("boi", "eta_th"),
+    "cap_hp": ("hp", "cap"),
+    "dT_max_hp": ("hp", "dT_max"),
+    "mod_lvl_hp": ("hp", "mod_lvl"),
+    "cap_eh": ("eh", "cap"),
+    "cap_tes": ("tes", "cap"),
+    "dT_max_tes": ("tes", "dT_max"),
+    "min_soc": ("tes", "min_soc"),
+    "eta_tes": ("tes", "eta_tes"),
+    "eta_ch": ("tes", "eta_ch"),
+    "eta_dch": ("tes", "eta_dch"),
+}
+
+# Defaults of MPC.load_buildings
+DEFAULTS = {
+    "eta_th": 0.97,
+    "dT_max_hp": 15,
+    "mod_lvl_hp": 1,
+    "dT_max_tes": 35,
+    "min_soc": 0.0,
+    "eta_tes": 0.98,
+    "eta_ch": 1,
+    "eta_dch": 1,
+}
+
+
+class BuildingTable:
+    """
+    Struct of arrays with the device parameters of all buildings.
+
+    Args:
+        ids: building ids, in the order of all arrays
+        heater: heater type of every building, see HEATER_TYPES
+        **columns: device parameters of DEVICE_KEYS, scalars are broadcast
+            to all buildings and missing ones take their DEFAULTS
+    """
+
+    def __init__(self, ids, heater, **columns):
+        self.ids = np.asarray(ids)
+        self.heater = np.asarray(heater, dtype=str)
+        n_buildings = self.ids.size
+        self._index = {building_id: i
+                       for i, building_id in enumerate(self.ids.tolist())}
+        if len(self._index) != n_buildings:
+            raise ValueError("Building ids must be unique")
+
+        unknown = set(columns) - set(DEVICE_KEYS)
+        if unknown:
+            raise KeyError(f"Unknown device parameters {sorted(unknown)}")
+        self.columns = {}
+        for name in DEVICE_KEYS:
+            value = columns.get(name, DEFAULTS.get(name, 0.0))
+            self.columns[name] = np.broadcast_to(
+                np.asarray(value, dtype=float), (n_buildings,)).copy()
+
+    @classmethod
+    def from_design(cls, ids, heater, design_heat, design_dhw, design_tes):
+        """
+        Size the devices like MPC.load_buildings from the design values of
+        Devs.xlsx: buildings with a boiler or a heat pump as heater, an
+        electric heater for the dhw and a storage.
+        """
+        heater = np.asarray(heater, dtype=str)
+        design_heat = np.asarray(design_heat, dtype=float)
+        is_boi = heater == "boi"
+        is_hp = heater == "hp"
+        has_heater = is_boi | is_hp
+        return cls(ids=ids,
+                   heater=heater,
+                   cap_boi=np.where(is_boi, design_heat, 0.0),
+                   cap_hp=np.where(is_hp, design_heat, 0.0),
+                   cap_eh=np.where(has_heater, design_dhw, 0.0),
+                   cap_tes=np.where(has_heater, design_tes, 0.0))
+
+    @classmethod
+    def from_dict(cls, buildings: dict):
+        """Table of device parameters in the nested dict format"""
+        ids = list(buildings)
+        columns = {name: [buildings[n][dev].get(key, DEFAULTS.get(name, 0.0))
+                          for n in ids]
+                   for name, (dev, key) in DEVICE_KEYS.items()}
+        heater = np.where(np.array(columns["cap_hp"]) > 0, "hp", "boi")
+        return cls(ids=ids, heater=heater, **columns)
+
+    def __len__(self):
+        return self.ids.size
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, building_id):
+        return building_id in self._index
+
+    def __getitem__(self, building_id) -> dict:
+        """Nested dict of one building, see MPC.load_buildings"""
+        i = self._index[building_id]
+        devs = {"boi": {}, "hp": {}, "eh": {}, "tes": {}}
+        for name, (dev, key) in DEVICE_KEYS.items():
+            devs[dev][key] = float(self.columns[name][i])
+        return devs
+
+    def index(self, building_id) -> int:
+        """Position of a building in the arrays"""
+        return self._index[building_id]
+
+    def select(self, ids):
+        """Table of a subset of the buildings"""
+        rows = [self._index[building_id] for building_id in ids]
+        return BuildingTable(ids=self.ids[rows],
+                             heater=self.heater[rows],
+                             **{name: values[rows]
+                                for name, values in self.columns.items()})
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of all arrays in bytes"""
+        return self.ids.nbytes + self.heater.nbytes + \
+            sum(values.nbytes for values in self.columns.values())
+
+
+def building_arrays(buildings):
+    """
+    Device parameters of all buildings as arrays of shape (building,).
+
+    Args:
+        buildings: BuildingTable or device parameters in the nested dict
+            format
+    """
+    if not isinstance(buildings, BuildingTable):
+        buildings = BuildingTable.from_dict(buildings)
+    return buildings.columns
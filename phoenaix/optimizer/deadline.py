@@ -0,0 +1,122 @@
+"""
+Deadlines of the MPC solves.
+
+The MPC has to deliver its setpoints within settings.CYCLE_TIME, part of
+which is already spent waiting for the forecasts. The rest, minus a margin
+for pushing the results, is the budget of the solver. Within the budget the
+solve is anytime: once a share of the budget is used, an incumbent with an
+acceptable gap is returned instead of proving the configured MIP gap, and
+at the end of the budget any incumbent is returned.
+"""
+import time
+import gurobipy as gp
+
+# Time in seconds reserved after the solve for pushing the results
+DEADLINE_MARGIN = 1.0
+# Time in seconds a solve gets even if the budget is already used up
+MIN_SOLVE_TIME = 0.1
+# Share of the budget after which an incumbent with ACCEPTABLE_GAP is used
+SOFT_DEADLINE_SHARE = 0.5
+ACCEPTABLE_GAP = 0.05
+
+
+class Deadline:
+    """
+    Point in time by which a solve has to return.
+
+    Args:
+        budget: time in seconds from start_time until the deadline
+        acceptable_gap: relative gap of an incumbent that is good enough
+            once soft_share of the budget is used
+        soft_share: share of the budget after which acceptable_gap applies
+        start_time: time.perf_counter() at which the budget starts, now by
+            default
+    """
+
+    def __init__(self,
+                 budget: float,
+                 acceptable_gap: float = ACCEPTABLE_GAP,
+                 soft_share: float = SOFT_DEADLINE_SHARE,
+                 start_time: float = None):
+        self.start_time = time.perf_counter() if start_time is None \
+            else start_time
+        self.budget = budget
+        self.acceptable_gap = acceptable_gap
+        self.soft_share = soft_share
+
+    @classmethod
+    def from_cycle(cls,
+                   cycle_start: float,
+                   cycle_time: float,
+                   margin: float = DEADLINE_MARGIN,
+                   **kwargs):
+        """
+        Deadline at the end of an MPC cycle that started at cycle_start,
+        the time since then is subtracted from the budget.
+        """
+        now = time.perf_counter()
+        return cls(budget=cycle_time - margin - (now - cycle_start),
+                   start_time=now,
+                   **kwargs)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def remaining(self) -> float:
+        return self.budget - self.elapsed()
+
+    def time_limit(self, time_limit: float) -> float:
+        """Solver time limit, the given one capped by the remaining time"""
+        return min(time_limit, max(self.remaining(), MIN_SOLVE_TIME))
+
+    def report(self) -> dict:
+        elapsed = self.elapsed()
+        return {"budget": self.budget,
+                "elapsed": elapsed,
+                "deadline_met": elapsed <= self.budget}
+
+
+def deadline_callback(deadline: Deadline,
+                      time_limit: float):
+    """
+    Gurobi callback that stops the solve once soft_share of time_limit is
+    used and the incumbent has the acceptable gap of the deadline.
+    """
+    soft_time = deadline.soft_share * time_limit
+
+    def callback(model, where):
+        if where != gp.GRB.Callback.MIP:
+            return
+        if model.cbGet(gp.GRB.Callback.MIP_SOLCNT) == 0:
+            return
+        if model.cbGet(gp.GRB.Callback.RUNTIME) < soft_time:
+            return
+        best = model.cbGet(gp.GRB.Callback.MIP_OBJBST)
+        bound = model.cbGet(gp.GRB.Callback.MIP_OBJBND)
+        if abs(best - bound) <= deadline.acceptable_gap * abs(best):
+            model.terminate()
+
+    return callback
+
+
+def optimize_with_deadline(model,
+                           deadline: Deadline,
+                           time_limit: float):
+    """
+    Optimize a gurobi model within a deadline. The time limit of the model
+    is reset to time_limit afterwards, so persistent models keep it.
+
+    Args:
+        model: gurobi model
+        deadline: Deadline or None to optimize without one
+        time_limit: configured time limit of the solver
+    """
+    if deadline is None:
+        model.optimize()
+        return
+    limit = deadline.time_limit(time_limit)
+    model.Params.TimeLimit = limit
+    try:
+        model.optimize(deadline_callback(deadline, limit))
+    finally:
+        model.Params.TimeLimit = time_limit
@@ -0,0 +1,408 @@
+"""
+Decomposition of the central MILP into one subproblem per building.
+
+The buildings of the central problem share no constraint. They are coupled
+only through the rows that sum their imports, exports and gas demands into
+the residual loads of the neighborhood ('residual_demand',
+'residual_feed_pv', 'demand_gas_total'), whose costs are paid on the
+neighborhood level. The columns of the neighborhood level (indexed by time
+step or single) and the rows between them form the coordinator problem, a
+small LP.
+
+The subproblems are coordinated by prices on the coupling rows (dual
+decomposition): every building solves its own MILP with its share of the
+coupling rows priced, the coordinator LP is solved for the resulting
+residual loads and its duals of the coupling rows are the prices of the
+next iteration. The iteration stops once the prices do not change any
+more, then no building can lower the total costs on its own. Every step
+starts from the prices of the previous one. With the linear grid tariffs
+of the central problem the prices are constant, so from the second step
+on the decomposition reaches the central optimum after a single round of
+subproblems. An augmented Lagrangian (ADMM) would put quadratic terms on
+the subproblems, which HiGHS can not solve as MIQP, and is not needed for
+linear couplings; damping with step < 1 is available for couplings whose
+prices depend on the residual loads. The model reduction
+(reduction.reduce_central_milp) substitutes the residual loads into the
+costs of the buildings, after it the subproblems are independent and need
+no coordinator at all.
+
+The subproblems of one iteration are solved in parallel in a process
+pool, every worker with its own backend and a single thread, see
+batch.solve_batch.
+"""
+import copy
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import linprog
+from phoenaix.optimizer.backends import make_backend
+from phoenaix.optimizer.matrix_model import \
+    BT_COLUMNS, \
+    assemble_central_milp
+from phoenaix.optimizer.reduction import \
+    ReducedMILP, \
+    reduce_central_milp
+from phoenaix.optimizer.results import \
+    MPCResult, \
+    OPTIMAL, \
+    TIME_LIMIT
+
+# Maximum number of price iterations
+MAX_ITER = 20
+# Relative change of the prices below which the iteration has converged
+PRICE_TOL = 1e-6
+
+# state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(solver, param_mpc):
+    param_mpc = copy.deepcopy(param_mpc)
+    param_mpc["gp"]["threads"] = 1
+    _worker.update(solver=solver, backend=make_backend(solver, param_mpc))
+
+
+def _solve_subproblem(task):
+    subproblem, c, deadline = task
+    subproblem = copy.copy(subproblem)
+    subproblem.c = c
+    solution = _worker["backend"].solve(subproblem, deadline=deadline)
+    return solution.x, solution.status, solution.mip_gap, solution.solve_time
+
+
+class Subproblem:
+    """
+    Rows and columns of the central MILP that belong to one building, in
+    the attributes a backend of backends.BACKENDS solves.
+
+    Args:
+        cols: columns of the building in the central MILP
+        coupling: coefficients of the building in the coupling rows, of
+            shape (coupling rows, cols)
+    """
+
+    def __init__(self, c, A, sense, rhs, lb, ub, vtype, cols, coupling):
+        self.c = c
+        self.A = A
+        self.sense = sense
+        self.rhs = rhs
+        self.lb = lb
+        self.ub = ub
+        self.vtype = vtype
+        self.cols = cols
+        self.coupling = coupling
+
+    @property
+    def n_cols(self):
+        return self.c.shape[0]
+
+    @property
+    def n_rows(self):
+        return self.rhs.shape[0]
+
+    def priced_costs(self, prices) -> np.ndarray:
+        """
+        Costs of the columns including the coupling rows priced with the
+        coordinator duals: raising the building's share of a coupling row
+        lowers the right-hand side left for the coordinator.
+        """
+        return self.c - self.coupling.T @ prices
+
+
+class Coordinator:
+    """
+    Columns of the neighborhood level and the rows between them, with the
+    coupling rows whose right-hand side is reduced by the building shares.
+    """
+
+    def __init__(self, milp, cols, rows, coupling_rows):
+        A = milp.A[np.concatenate([rows, coupling_rows])][:, cols]
+        sense = milp.sense[np.concatenate([rows, coupling_rows])]
+        self.milp = milp
+        self.cols = cols
+        self.coupling_rows = coupling_rows
+        self.n_own_rows = rows.size
+        self.rhs = milp.rhs[np.concatenate([rows, coupling_rows])]
+        self.c = milp.c[cols]
+
+        # The columns that are defined by a coupling equality take any value
+        # the buildings sum up to. Their bounds are dropped for the pricing,
+        # otherwise the duals are degenerate wherever a residual load is
+        # zero, and are checked on the recovered solution instead.
+        coupling_A = A[self.n_own_rows:]
+        is_eq = sense[self.n_own_rows:] == "="
+        defined = np.unique(coupling_A[is_eq].indices)
+        self.defined = defined
+        self.lb = milp.lb[cols].copy()
+        self.ub = milp.ub[cols].copy()
+        self.lb[defined] = -np.inf
+        self.ub[defined] = np.inf
+
+        self._eq = np.flatnonzero(sense == "=")
+        self._le = np.flatnonzero(sense == "<")
+        self._ge = np.flatnonzero(sense == ">")
+        self._A_eq = A[self._eq]
+        self._A_ub = A[np.concatenate([self._le, self._ge])]
+        self._ub_sign = np.concatenate([np.ones(self._le.size),
+                                        -np.ones(self._ge.size)])
+        self._A_ub = self._A_ub.multiply(self._ub_sign[:, None]).tocsr()
+
+    def solve(self, building_share):
+        """
+        Solve the coordinator LP for the given sums of the building columns
+        in the coupling rows.
+
+        Returns:
+            tuple of the values of the coordinator columns and the duals of
+            the coupling rows, d objective / d right-hand side
+        """
+        if self.cols.size == 0:
+            return np.zeros(0), np.zeros(self.coupling_rows.size)
+        rhs = self.rhs.copy()
+        rhs[self.n_own_rows:] -= building_share
+        b_ub = np.concatenate([rhs[self._le], rhs[self._ge]]) * self._ub_sign
+        res = linprog(c=self.c,
+                      A_ub=self._A_ub if b_ub.size else None,
+                      b_ub=b_ub if b_ub.size else None,
+                      A_eq=self._A_eq if self._eq.size else None,
+                      b_eq=rhs[self._eq] if self._eq.size else None,
+                      bounds=np.column_stack([self.lb, self.ub]),
+                      method="highs")
+        if res.status != 0:
+            raise RuntimeError(f"Coordinator LP failed: {res.message}")
+
+        duals = np.zeros(rhs.size)
+        duals[self._eq] = res.eqlin.marginals
+        duals[self._le] = res.ineqlin.marginals[:self._le.size]
+        duals[self._ge] = -res.ineqlin.marginals[self._le.size:]
+        return res.x, duals[self.n_own_rows:]
+
+    def bound_violation(self, x) -> float:
+        """Largest violation of the dropped bounds of the defined columns"""
+        lb = self.milp.lb[self.cols][self.defined]
+        ub = self.milp.ub[self.cols][self.defined]
+        x = x[self.defined]
+        return float(np.max(np.maximum(lb - x, x - ub), initial=0.0))
+
+
+def split_central_milp(milp):
+    """
+    Split the central MILP into the subproblems of all buildings and the
+    coordinator problem.
+
+    Args:
+        milp: CentralMILP or reduction.ReducedMILP
+
+    Returns:
+        tuple of the list of Subproblem of all buildings with columns left,
+        in the order of the building ids, and the Coordinator
+    """
+    full = milp.milp if isinstance(milp, ReducedMILP) else milp
+    n_buildings = len(full.building_ids)
+    owner = np.full(full.n_cols, -1)
+    for name in BT_COLUMNS:
+        owner[full.columns[name]] = np.arange(n_buildings)[:, None]
+    if isinstance(milp, ReducedMILP):
+        owner = owner[milp.cols]
+
+    A = milp.A.tocsr()
+    row_of_nz = np.repeat(np.arange(milp.n_rows), np.diff(A.indptr))
+    nz_owner = owner[A.indices]
+    # smallest and largest owner of every row, -1 for the coordinator
+    row_min = np.full(milp.n_rows, n_buildings)
+    row_max = np.full(milp.n_rows, -1)
+    np.minimum.at(row_min, row_of_nz, nz_owner)
+    np.maximum.at(row_max, row_of_nz, nz_owner)
+
+    is_building_row = (row_min >= 0) & (row_min < n_buildings)
+    if np.any(is_building_row & (row_min != row_max)):
+        raise ValueError("A row couples buildings without the neighborhood "
+                         "level, the problem can not be decomposed")
+    coupling_rows = np.flatnonzero((row_min == -1) & (row_max >= 0))
+    coordinator_rows = np.flatnonzero(row_max == -1)
+
+    coupling_A = A[coupling_rows]
+    subproblems = []
+    for i in range(n_buildings):
+        cols = np.flatnonzero(owner == i)
+        if cols.size == 0:
+            continue
+        rows = np.flatnonzero(is_building_row & (row_min == i))
+        subproblems.append(Subproblem(c=milp.c[cols],
+                                      A=A[rows][:, cols],
+                                      sense=milp.sense[rows],
+                                      rhs=milp.rhs[rows],
+                                      lb=milp.lb[cols],
+                                      ub=milp.ub[cols],
+                                      vtype=milp.vtype[cols],
+                                      cols=cols,
+                                      coupling=coupling_A[:, cols]))
+
+    coordinator = Coordinator(milp=milp,
+                              cols=np.flatnonzero(owner == -1),
+                              rows=coordinator_rows,
+                              coupling_rows=coupling_rows)
+    return subproblems, coordinator
+
+
+class DecomposedCentralModel:
+    """
+    Central MPC problem solved by price coordinated subproblems per
+    building, see the module docstring.
+
+    Args:
+        buildings: device parameters of all buildings
+        n_horizon: number of time steps
+        param_mpc: MPC parameters
+        solver: backend of the subproblems, see backends.BACKENDS
+        n_workers: worker processes for the subproblems, all cores by
+            default, 1 solves them in this process
+        time_grid: time_grid.TimeGrid of the horizon or None
+        reduce_model: reduce the central problem before splitting it, see
+            reduction.reduce_central_milp, buildings without dispatch
+            freedom then need no subproblem
+        max_iter: maximum number of price iterations
+        tol: relative change of the prices at convergence
+        step: damping of the price update, 1 takes the coordinator duals
+    """
+
+    def __init__(self,
+                 buildings,
+                 n_horizon: int,
+                 param_mpc: dict,
+                 solver: str = "highs",
+                 n_workers: int = None,
+                 time_grid=None,
+                 reduce_model: bool = True,
+                 max_iter: int = MAX_ITER,
+                 tol: float = PRICE_TOL,
+                 step: float = 1.0):
+        self.buildings = buildings
+        self.n_horizon = n_horizon
+        self.param_mpc = param_mpc
+        self.solver = solver
+        self.n_workers = os.cpu_count() if n_workers is None else n_workers
+        self.time_grid = time_grid
+        self.reduce_model = reduce_model
+        self.max_iter = max_iter
+        self.tol = tol
+        self.step = step
+        self._pool = None
+        self._prices = None
+        # status of the last solve, see results.py
+        self.status = None
+
+    def _map(self, tasks):
+        if self.n_workers == 1:
+            if _worker.get("solver") != self.solver:
+                _init_worker(self.solver, self.param_mpc)
+            return [_solve_subproblem(task) for task in tasks]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                initializer=_init_worker,
+                initargs=(self.solver, self.param_mpc))
+        chunksize = max(1, len(tasks) // (4 * self.n_workers))
+        return list(self._pool.map(_solve_subproblem, tasks,
+                                   chunksize=chunksize))
+
+    def solve(self,
+              demands_and_pv,
+              init_val: dict = None,
+              deadline=None):
+        """
+        Solve the central problem by decomposition.
+
+        Args:
+            deadline: deadline.Deadline of the subproblem solves, no further
+                iteration is started once it is exceeded
+
+        Returns:
+            MPCResult with the convergence metrics in
+            info['decomposition'], or None if a building has no feasible
+            solution
+        """
+        start_time = time.perf_counter()
+        milp = assemble_central_milp(demands_and_pv=demands_and_pv,
+                                     buildings=self.buildings,
+                                     n_horizon=self.n_horizon,
+                                     param_mpc=self.param_mpc,
+                                     init_val=init_val,
+                                     time_grid=self.time_grid)
+        problem = milp
+        if self.reduce_model:
+            problem = reduce_central_milp(milp=milp,
+                                          buildings=self.buildings,
+                                          param_mpc=self.param_mpc)
+        subproblems, coordinator = split_central_milp(problem)
+
+        x = np.zeros(problem.n_cols)
+        prices = self._prices
+        if prices is None or prices.size != coordinator.coupling_rows.size:
+            _, prices = coordinator.solve(
+                np.zeros(coordinator.coupling_rows.size))
+        price_changes, objectives = [], []
+        converged = False
+        subproblem_time = 0.0
+        for _ in range(self.max_iter):
+            tasks = [(sub, sub.priced_costs(prices), deadline)
+                     for sub in subproblems]
+            solutions = self._map(tasks)
+
+            statuses, gaps = [], []
+            share = np.zeros(coordinator.coupling_rows.size)
+            for sub, (x_sub, status, gap, solve_time) in zip(subproblems,
+                                                             solutions):
+                if x_sub is None:
+                    # an infeasible building makes the whole problem so
+                    self.status = status
+                    return None
+                x[sub.cols] = x_sub
+                share += sub.coupling @ x_sub
+                statuses.append(status)
+                gaps.append(gap)
+                subproblem_time += solve_time
+
+            x_coord, new_prices = coordinator.solve(share)
+            x[coordinator.cols] = x_coord
+            values = problem.expand(x) if self.reduce_model else x
+            objectives.append(float(milp.c @ values))
+            change = np.max(np.abs(new_prices - prices), initial=0.0) / \
+                max(1.0, np.max(np.abs(prices), initial=0.0))
+            price_changes.append(float(change))
+            if change <= self.tol:
+                converged = True
+                prices = new_prices
+                break
+            if deadline is not None and deadline.remaining() <= 0:
+                break
+            prices = prices + self.step * (new_prices - prices)
+        self._prices = prices
+
+        optimal = converged and all(status == OPTIMAL for status in statuses)
+        info = {"backend": self.solver,
+                "decomposition": {
+                    "iterations": len(objectives),
+                    "converged": converged,
+                    "price_change": price_changes,
+                    "objective": objectives,
+                    "n_subproblems": len(subproblems),
+                    "n_workers": self.n_workers,
+                    "subproblem_time": subproblem_time,
+                    "bound_violation": coordinator.bound_violation(x_coord),
+                    "wall_time": time.perf_counter() - start_time}}
+        self.status = OPTIMAL if optimal else TIME_LIMIT
+        return MPCResult(values=values,
+                         columns=milp.columns,
+                         building_ids=milp.building_ids,
+                         param_mpc=self.param_mpc,
+                         status=self.status,
+                         obj_val=objectives[-1],
+                         mip_gap=max(gaps, default=0.0) if converged else np.nan,
+                         info=info)
+
+    def dispose(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._pool = None
@@ -0,0 +1,103 @@
+"""
+Diagnosis of infeasible MPC problems off the control path.
+
+Computing the IIS of an infeasible model can take far longer than solving
+it. The control path therefore only hands a copy of the model, in an own
+gurobi environment, to a background thread and continues, see
+submit_iis.
+"""
+import logging
+import queue
+import threading
+from collections import deque
+import gurobipy as gp
+from phoenaix.optimizer.formulation import write_iis
+
+logger = logging.getLogger(__name__)
+
+# Number of models waiting for their IIS, further ones are dropped
+MAX_PENDING = 2
+
+
+class IISWorker:
+    """
+    Background thread that computes and writes the IIS of infeasible models,
+    see formulation.write_iis.
+
+    Args:
+        max_pending: number of models that may wait for the worker, models
+            submitted while the queue is full are dropped
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._env = None
+        self._lock = threading.Lock()
+        self.n_submitted = 0
+        self.n_dropped = 0
+        self.n_done = 0
+        # names of the IIS constraints of the last diagnosed models
+        self.results = deque(maxlen=10)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        self._env = gp.Env(empty=True)
+        self._env.setParam('OutputFlag', 0)
+        self._env.start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, model) -> bool:
+        """
+        Queue a copy of an infeasible model for the IIS computation.
+
+        Returns:
+            False if the model was dropped because the queue is full
+        """
+        with self._lock:
+            self._start()
+            if self._queue.full():
+                self.n_dropped += 1
+                return False
+            self._queue.put(model.copy(self._env))
+            self.n_submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            model = self._queue.get()
+            try:
+                iis = write_iis(model)
+                self.results.append(iis)
+                logger.info(f'IIS of an infeasible MPC problem with '
+                            f'{len(iis)} constraints: {iis[:10]}')
+            except gp.GurobiError as e:
+                logger.error(f'IIS computation failed: {e}')
+            finally:
+                model.dispose()
+                self.n_done += 1
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until all queued models are diagnosed"""
+        self._queue.join()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def submit_iis(model) -> bool:
+    """Diagnose an infeasible model in the shared background IISWorker"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = IISWorker()
+    return _worker.submit(model)
+
+
+def iis_worker():
+    """The shared IISWorker, None if nothing was submitted yet"""
+    return _worker
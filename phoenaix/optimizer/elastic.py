@@ -0,0 +1,99 @@
+"""
+Elastic version of the central MILP.
+
+If the central problem is infeasible, for example because a storage can not
+cover the heat demand with the available heaters, the MPC still has to
+deliver setpoints within its cycle. The elastic problem adds penalised
+slacks to the storage balances and the demand coverage, so it is feasible
+whenever the devices can run at all, and its solution violates those rows
+as little as possible.
+"""
+import numpy as np
+import scipy.sparse as sp
+from phoenaix.optimizer.matrix_model import \
+    CentralMILP, \
+    assemble_central_milp
+from phoenaix.optimizer.results import MPCResult
+
+# Constraint groups that get slacks: heat demand covered by the storage,
+# dhw covered by the electric heater and the SOC balances
+ELASTIC_ROWS = ("dch", "eh", "storage_init", "storage_bal")
+# Cost of one unit of slack, far above all energy prices
+ELASTIC_PENALTY = 100.0
+
+
+def make_elastic(milp: CentralMILP,
+                 groups: tuple = ELASTIC_ROWS,
+                 penalty: float = ELASTIC_PENALTY):
+    """
+    Add a pair of penalised slacks to every row of the given groups.
+
+    The slacks are appended behind all columns of milp, in the column
+    groups 'slack_pos' and 'slack_neg', so the layout of all other columns
+    stays the same.
+
+    Returns:
+        CentralMILP
+    """
+    rows = np.concatenate([milp.rows[name] for name in groups])
+    n_slack = rows.size
+    slack = sp.csr_matrix(
+        (np.concatenate([np.ones(n_slack), -np.ones(n_slack)]),
+         (np.concatenate([rows, rows]), np.arange(2 * n_slack))),
+        shape=(milp.n_rows, 2 * n_slack))
+
+    columns = dict(milp.columns)
+    columns["slack_pos"] = milp.n_cols + np.arange(n_slack)
+    columns["slack_neg"] = milp.n_cols + n_slack + np.arange(n_slack)
+    return CentralMILP(c=np.concatenate([milp.c, np.full(2 * n_slack, penalty)]),
+                       A=sp.hstack([milp.A, slack]).tocsr(),
+                       sense=milp.sense,
+                       rhs=milp.rhs,
+                       lb=np.concatenate([milp.lb, np.zeros(2 * n_slack)]),
+                       ub=np.concatenate([milp.ub, np.full(2 * n_slack, np.inf)]),
+                       vtype=np.concatenate([milp.vtype,
+                                             np.full(2 * n_slack, "C")]),
+                       columns=columns,
+                       rows=milp.rows,
+                       building_ids=milp.building_ids,
+                       n_horizon=milp.n_horizon,
+                       durations=milp.durations)
+
+
+def solve_elastic(demands_and_pv,
+                  buildings,
+                  n_horizon,
+                  param_mpc,
+                  init_val,
+                  backend,
+                  deadline=None,
+                  time_grid=None):
+    """
+    Solve the elastic central problem with a backend of backends.BACKENDS.
+
+    Returns:
+        MPCResult with the total slack in info['slack'], or None
+    """
+    milp = make_elastic(assemble_central_milp(demands_and_pv=demands_and_pv,
+                                              buildings=buildings,
+                                              n_horizon=n_horizon,
+                                              param_mpc=param_mpc,
+                                              init_val=init_val,
+                                              time_grid=time_grid))
+    solution = backend.solve(milp, deadline=deadline)
+    if not solution.has_solution:
+        return None
+
+    slack = float(solution.x[milp.columns["slack_pos"]].sum() +
+                  solution.x[milp.columns["slack_neg"]].sum())
+    return MPCResult(values=solution.x,
+                     columns=milp.columns,
+                     building_ids=milp.building_ids,
+                     param_mpc=param_mpc,
+                     status=solution.status,
+                     obj_val=solution.obj_val,
+                     mip_gap=solution.mip_gap,
+                     info={"backend": backend.name,
+                           "elastic": True,
+                           "slack": slack,
+                           "solve_time": solution.solve_time})
@@ -0,0 +1,163 @@
+"""
+Gurobi environments of the MPC solves and a cap on concurrent solves.
+
+Every MQTT trigger runs MPC.predict in a thread of its own. Without a cap,
+overlapping steps, or several neighborhoods in one process, each solve
+with as many threads as there are cores, and every model created on the
+default environment shares it between threads. EnvPool hands out one of
+max_concurrent started environments per solve, each with an equal share of
+the cores as Threads, and lets further solves wait for a free one. The
+environments are created on demand and reused until the pool is disposed.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import gurobipy as gp
+
+logger = logging.getLogger(__name__)
+
+# Number of solves at the same time of the shared pool
+MAX_CONCURRENT = 1
+
+
+class EnvPool:
+    """
+    Started gurobi environments, one per concurrent solve.
+
+    Args:
+        max_concurrent: number of solves at the same time, further solves
+            wait in acquire
+        threads: Threads of every environment, by default the cores split
+            evenly among the concurrent solves
+    """
+
+    def __init__(self,
+                 max_concurrent: int = MAX_CONCURRENT,
+                 threads: int = None):
+        if max_concurrent < 1:
+            raise ValueError("At least one concurrent solve is needed")
+        self.max_concurrent = max_concurrent
+        self.threads = threads if threads is not None else \
+            max(1, (os.cpu_count() or 1) // max_concurrent)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._envs = []
+        self.n_waiting = 0
+        self.n_active = 0
+        self.n_acquired = 0
+        self.n_timeouts = 0
+        # time waited for a free environment and time it was held, of the
+        # last solves
+        self.wait_times = deque(maxlen=1000)
+        self.hold_times = deque(maxlen=1000)
+
+    def new_env(self):
+        """
+        Started environment with the Threads of the pool, for models that
+        outlive a single solve, e.g. persistent_model.PersistentCentralModel.
+        It is disposed with the pool.
+        """
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.setParam('Threads', self.threads)
+        env.start()
+        with self._lock:
+            self._envs.append(env)
+        return env
+
+    @contextmanager
+    def acquire(self, deadline=None):
+        """
+        Environment for one solve, waits until one of the max_concurrent
+        environments is free.
+
+        Args:
+            deadline: deadline.Deadline of the solve, wait at most until it
+                has passed. None to wait without limit.
+
+        Raises:
+            TimeoutError: if no environment got free before the deadline
+        """
+        start_time = time.perf_counter()
+        timeout = None if deadline is None else max(deadline.remaining(), 0.0)
+        with self._lock:
+            self.n_waiting += 1
+        acquired = self._slots.acquire(timeout=timeout)
+        with self._lock:
+            self.n_waiting -= 1
+            if not acquired:
+                self.n_timeouts += 1
+            else:
+                self.n_active += 1
+                self.n_acquired += 1
+        if not acquired:
+            raise TimeoutError(f"No free gurobi environment within "
+                               f"{timeout:.2f} s")
+
+        hold_start = time.perf_counter()
+        self.wait_times.append(hold_start - start_time)
+        try:
+            env = self._idle.get_nowait()
+        except queue.Empty:
+            env = self.new_env()
+        try:
+            yield env
+        finally:
+            self._idle.put(env)
+            self.hold_times.append(time.perf_counter() - hold_start)
+            with self._lock:
+                self.n_active -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Queueing and solve latencies of the last solves in seconds"""
+        stats = {"max_concurrent": self.max_concurrent,
+                 "threads": self.threads,
+                 "envs": len(self._envs),
+                 "active": self.n_active,
+                 "waiting": self.n_waiting,
+                 "acquired": self.n_acquired,
+                 "timeouts": self.n_timeouts}
+        for name, times in (("wait", self.wait_times),
+                            ("hold", self.hold_times)):
+            if times:
+                times = np.array(times)
+                stats[f"{name}_mean"] = times.mean()
+                stats[f"{name}_p99"] = np.percentile(times, 99)
+                stats[f"{name}_max"] = times.max()
+        return stats
+
+    def dispose(self):
+        """Dispose all environments, models on them must be disposed first"""
+        with self._lock:
+            envs, self._envs = self._envs, []
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for env in envs:
+            env.dispose()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool(max_concurrent: int = MAX_CONCURRENT) -> EnvPool:
+    """
+    The EnvPool of all MPCs in this process, created on the first call
+    with max_concurrent. Later calls return the same pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EnvPool(max_concurrent=max_concurrent)
+        elif _pool.max_concurrent != max_concurrent:
+            logger.warning(f'The shared gurobi environment pool allows '
+                           f'{_pool.max_concurrent} concurrent solves, '
+                           f'ignoring {max_concurrent}')
+    return _pool
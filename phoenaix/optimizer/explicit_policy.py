@@ -0,0 +1,426 @@
+"""
+Explicit MPC policy: the first-step setpoints as a lookup table.
+
+The setpoints sent to the simulation, the heat pump powers and SOCs of the
+buildings with a house model, depend on few inputs: the initial SOCs and
+the next hours of the forecasts. fit_policy samples these inputs from
+demand profiles, solves the central problem for every sample in a process
+pool (batch.solve_batch) and stores the first-step setpoints in a table
+over standardized input features. ExplicitPolicy evaluates the table in
+microseconds as the inverse distance weighted mean of the nearest samples.
+Inputs farther from the samples than max_distance are outside the trained
+region, the MPC then solves the problem as usual.
+
+evaluate_regret runs the policy and the exact MPC side by side in closed
+loop and reports the extra costs of the policy.
+"""
+import time
+from collections import deque
+import numpy as np
+from scipy.spatial import cKDTree
+from phoenaix.optimizer.backends import solve_central
+from phoenaix.optimizer.batch import solve_batch
+from phoenaix.optimizer.buildings import building_arrays
+from phoenaix.optimizer.formulation import DT
+from phoenaix.optimizer.matrix_model import assemble_central_milp
+from phoenaix.optimizer.results import MPCResult
+
+# Status of the setpoints of the policy, see results.OPTIMAL
+POLICY = "policy"
+# Hours of the forecasts that enter the features
+WINDOW = 3
+# Number of samples whose setpoints are averaged
+N_NEIGHBORS = 4
+# Distance to the nearest sample beyond which an input is outside the
+# trained region, as root mean square over the features in their standard
+# deviations
+MAX_DISTANCE = 0.25
+
+
+def _forecast(demands_and_pv, key, buildings, n_values):
+    values = demands_and_pv[key]
+    if isinstance(values, np.ndarray):
+        return values[:, :n_values].astype(float)
+    return np.array([values[n][:n_values] for n in buildings], dtype=float)
+
+
+def policy_features(demands_and_pv,
+                    init_val,
+                    buildings,
+                    window: int = WINDOW) -> np.ndarray:
+    """
+    Input features of the policy, per building the SOC relative to the
+    storage capacity and the first value and the mean over window hours of
+    the heat demand and of the electricity demand net of PV.
+
+    Returns:
+        array of shape (5 * building,)
+    """
+    devs = building_arrays(buildings)
+    heat = _forecast(demands_and_pv, "heating", buildings, window) + \
+        _forecast(demands_and_pv, "dhw", buildings, window)
+    net_el = _forecast(demands_and_pv, "elec", buildings, window) - \
+        _forecast(demands_and_pv, "pv_power", buildings, window)
+    cap_tes = devs["cap_tes"]
+    if init_val is not None:
+        soc = np.array([init_val["soc"][n]["tes"] for n in buildings],
+                       dtype=float)
+    else:
+        soc = 0.5 * cap_tes
+    soc = np.divide(soc, cap_tes, out=np.zeros_like(soc), where=cap_tes > 0)
+    return np.concatenate([soc,
+                           heat[:, 0], heat.mean(axis=1),
+                           net_el[:, 0], net_el.mean(axis=1)])
+
+
+class PolicyAction:
+    """
+    First-step setpoints of the policy, with the accessors of MPCResult
+    that MPC.predict uses.
+
+    Args:
+        p_hp: electrical power of the heat pumps by building id
+        soc: SOCs at the end of the first step by building id
+        distance: distance of the input to the nearest sample
+    """
+    status = POLICY
+    mip_gap = None
+
+    def __init__(self, p_hp: dict, soc: dict, distance: float):
+        self.p_hp = p_hp
+        self.soc = soc
+        self.info = {"distance": distance}
+
+    def hp_power(self, building_id, step: int = 0) -> float:
+        return self.p_hp[building_id]
+
+    def tes_soc(self, building_id, step: int = 0) -> float:
+        return self.soc[building_id]
+
+
+class ExplicitPolicy:
+    """
+    Lookup table of first-step setpoints over the input features.
+
+    Args:
+        features: features of every sample, shape (sample, feature), see
+            policy_features
+        p_hp: heat pump powers of the first step, shape (sample, building)
+        soc: SOCs at the end of the first step, shape (sample, building)
+        building_ids: buildings of the columns of p_hp and soc
+        window: hours of the forecasts in the features
+        n_neighbors: samples whose setpoints are averaged
+        max_distance: root mean square distance to the nearest sample over
+            the standardized features beyond which act returns None
+    """
+
+    def __init__(self,
+                 features: np.ndarray,
+                 p_hp: np.ndarray,
+                 soc: np.ndarray,
+                 building_ids,
+                 window: int = WINDOW,
+                 n_neighbors: int = N_NEIGHBORS,
+                 max_distance: float = MAX_DISTANCE):
+        self.features = np.asarray(features, dtype=float)
+        self.p_hp = np.asarray(p_hp, dtype=float)
+        self.soc = np.asarray(soc, dtype=float)
+        self.building_ids = list(building_ids)
+        self.window = window
+        self.n_neighbors = min(n_neighbors, len(self.features))
+        self.max_distance = max_distance
+
+        self.mean = self.features.mean(axis=0)
+        std = self.features.std(axis=0)
+        # scaled such that distances are root mean squares over features
+        self.std = np.where(std > 0, std, 1.0) * \
+            np.sqrt(self.features.shape[1])
+        self._tree = cKDTree((self.features - self.mean) / self.std)
+
+        self.n_evaluations = 0
+        self.n_fallbacks = 0
+        # seconds per evaluation of the last calls of act
+        self.eval_times = deque(maxlen=1000)
+
+    def __len__(self):
+        return len(self.features)
+
+    def evaluate(self, features: np.ndarray):
+        """
+        Setpoints of one input.
+
+        Returns:
+            heat pump powers and SOCs of shape (building,) and the distance
+            to the nearest sample
+        """
+        x = (features - self.mean) / self.std
+        distance, index = self._tree.query(x, k=self.n_neighbors)
+        distance = np.atleast_1d(distance)
+        index = np.atleast_1d(index)
+        if distance[0] == 0.0:
+            return self.p_hp[index[0]], self.soc[index[0]], 0.0
+        weights = 1.0 / distance
+        weights /= weights.sum()
+        return weights @ self.p_hp[index], weights @ self.soc[index], \
+            float(distance[0])
+
+    def act(self,
+            demands_and_pv,
+            init_val,
+            buildings):
+        """
+        Setpoints of the MPC inputs.
+
+        Returns:
+            PolicyAction or None if the inputs are outside the trained
+            region
+        """
+        start_time = time.perf_counter()
+        features = policy_features(demands_and_pv=demands_and_pv,
+                                   init_val=init_val,
+                                   buildings=buildings,
+                                   window=self.window)
+        p_hp, soc, distance = self.evaluate(features)
+        self.eval_times.append(time.perf_counter() - start_time)
+        self.n_evaluations += 1
+        if distance > self.max_distance:
+            self.n_fallbacks += 1
+            return None
+        return PolicyAction(p_hp=dict(zip(self.building_ids, p_hp)),
+                            soc=dict(zip(self.building_ids, soc)),
+                            distance=distance)
+
+    def stats(self) -> dict:
+        stats = {"samples": len(self),
+                 "evaluations": self.n_evaluations,
+                 "fallbacks": self.n_fallbacks}
+        if self.eval_times:
+            times = np.array(self.eval_times)
+            stats["eval_mean"] = times.mean()
+            stats["eval_p99"] = np.percentile(times, 99)
+        return stats
+
+    def save(self, path):
+        np.savez(path,
+                 features=self.features,
+                 p_hp=self.p_hp,
+                 soc=self.soc,
+                 building_ids=np.array(self.building_ids),
+                 settings=np.array([self.window, self.n_neighbors,
+                                    self.max_distance]))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        window, n_neighbors, max_distance = data["settings"]
+        return cls(features=data["features"],
+                   p_hp=data["p_hp"],
+                   soc=data["soc"],
+                   building_ids=data["building_ids"].tolist(),
+                   window=int(window),
+                   n_neighbors=int(n_neighbors),
+                   max_distance=float(max_distance))
+
+
+def sample_inputs(profiles: dict,
+                  buildings,
+                  n_samples: int,
+                  n_horizon: int,
+                  rng: np.random.Generator):
+    """
+    Forecast horizons cut from the profiles at random hours, with random
+    initial SOCs between the minimum SOC and the capacity of the storages.
+
+    Args:
+        profiles: hourly profiles of shape (building, time) of every
+            quantity of the MPC input
+
+    Returns:
+        list of forecasts as arrays, list of initial SOCs
+    """
+    devs = building_arrays(buildings)
+    n_steps = next(iter(profiles.values())).shape[1]
+    starts = rng.integers(0, n_steps - n_horizon + 1, size=n_samples)
+    inputs = [{key: values[:, start:start + n_horizon]
+               for key, values in profiles.items()}
+              for start in starts]
+    lower = devs["min_soc"] * devs["cap_tes"]
+    socs = rng.uniform(lower, devs["cap_tes"],
+                       size=(n_samples, len(devs["cap_tes"])))
+    init_vals = [{"soc": {n: {"tes": float(value)}
+                          for n, value in zip(buildings, soc)}}
+                 for soc in socs]
+    return inputs, init_vals
+
+
+def fit_policy(profiles: dict,
+               buildings,
+               building_ids,
+               n_horizon: int,
+               param_mpc: dict,
+               n_samples: int = 2000,
+               solver: str = "gurobi",
+               n_workers: int = None,
+               seed: int = 0,
+               **kwargs) -> ExplicitPolicy:
+    """
+    Sample the inputs, solve all samples in parallel and build the policy
+    of their first-step setpoints.
+
+    Args:
+        profiles: hourly profiles of shape (building, time) of every
+            quantity of the MPC input
+        buildings: device parameters of all buildings
+        building_ids: buildings whose setpoints the policy returns
+        n_samples: number of sampled inputs, samples without a solution
+            are dropped
+        kwargs: passed to ExplicitPolicy
+    """
+    inputs, init_vals = sample_inputs(profiles=profiles,
+                                      buildings=buildings,
+                                      n_samples=n_samples,
+                                      n_horizon=n_horizon,
+                                      rng=np.random.default_rng(seed))
+    batch = solve_batch(inputs=inputs,
+                        init_vals=init_vals,
+                        buildings=buildings,
+                        n_horizon=n_horizon,
+                        param_mpc=param_mpc,
+                        solver=solver,
+                        n_workers=n_workers)
+    rows = [batch.building_ids.index(n) for n in building_ids]
+    p_hp = batch.get("p_hp")[:, rows, 0]
+    soc = batch.get("soc")[:, rows, 0]
+    solved = ~np.isnan(p_hp).any(axis=1)
+
+    window = kwargs.get("window", WINDOW)
+    features = np.array([policy_features(demands_and_pv=inputs[i],
+                                         init_val=init_vals[i],
+                                         buildings=buildings,
+                                         window=window)
+                         for i in np.flatnonzero(solved)])
+    return ExplicitPolicy(features=features,
+                          p_hp=p_hp[solved],
+                          soc=soc[solved],
+                          building_ids=building_ids,
+                          **kwargs)
+
+
+def step_cost(res, param_mpc) -> float:
+    """Costs of the first step of a plan"""
+    eco = param_mpc["eco"]
+    return DT * (eco["gas"] * res.gas_from_grid[0] +
+                 eco["el_grid"] * res.p_demand[0] -
+                 eco["sell_pv"] * res.p_feed_pv[0])
+
+
+def _solve_with_action(action, demands_and_pv, buildings, n_horizon,
+                       param_mpc, init_val, backend):
+    """Plan with the heat pump powers of the first step fixed to action"""
+    milp = assemble_central_milp(demands_and_pv=demands_and_pv,
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=init_val)
+    cols = np.array([milp.columns["p_hp"][milp.building_ids.index(n), 0]
+                     for n in action.p_hp])
+    value = np.clip(list(action.p_hp.values()), milp.lb[cols], milp.ub[cols])
+    milp.lb = milp.lb.copy()
+    milp.ub = milp.ub.copy()
+    milp.lb[cols] = value
+    milp.ub[cols] = value
+    solution = backend.solve(milp)
+    if not solution.has_solution:
+        return None
+    return MPCResult(values=solution.x,
+                     columns=milp.columns,
+                     building_ids=milp.building_ids,
+                     param_mpc=param_mpc,
+                     status=POLICY,
+                     obj_val=solution.obj_val,
+                     mip_gap=solution.mip_gap)
+
+
+def evaluate_regret(policy: ExplicitPolicy,
+                    profiles: dict,
+                    buildings,
+                    n_horizon: int,
+                    param_mpc: dict,
+                    backend,
+                    n_steps: int,
+                    start: int = 0) -> dict:
+    """
+    Closed-loop costs of the policy against the exact MPC.
+
+    Both run over the same profiles with perfect forecasts. The exact MPC
+    applies the first step of its plan. The policy applies its heat pump
+    powers, the rest of the first step is the plan with these powers fixed.
+    Inputs outside the trained region and actions without a feasible plan
+    fall back to the exact solve.
+
+    Returns:
+        dict with the closed-loop costs, the relative regret, the number of
+        fallbacks and the evaluation and solve times in seconds
+    """
+    def horizon(step):
+        return {key: values[:, step:step + n_horizon]
+                for key, values in profiles.items()}
+
+    def soc_init(res):
+        return {"soc": {n: {"tes": res.tes_soc(n)}
+                        for n in res.building_ids}}
+
+    exact_cost, policy_cost = 0.0, 0.0
+    exact_init, policy_init = None, None
+    n_fallbacks, n_infeasible = 0, 0
+    solve_times, eval_times = [], []
+    for step in range(start, start + n_steps):
+        demands_and_pv = horizon(step)
+        start_time = time.perf_counter()
+        res = solve_central(demands_and_pv=demands_and_pv,
+                            buildings=buildings,
+                            n_horizon=n_horizon,
+                            param_mpc=param_mpc,
+                            init_val=exact_init,
+                            backend=backend)
+        solve_times.append(time.perf_counter() - start_time)
+        exact_cost += step_cost(res, param_mpc)
+        exact_init = soc_init(res)
+
+        start_time = time.perf_counter()
+        action = policy.act(demands_and_pv=demands_and_pv,
+                            init_val=policy_init,
+                            buildings=buildings)
+        eval_times.append(time.perf_counter() - start_time)
+        plan = None
+        if action is None:
+            n_fallbacks += 1
+        else:
+            plan = _solve_with_action(action=action,
+                                      demands_and_pv=demands_and_pv,
+                                      buildings=buildings,
+                                      n_horizon=n_horizon,
+                                      param_mpc=param_mpc,
+                                      init_val=policy_init,
+                                      backend=backend)
+            n_infeasible += plan is None
+        if plan is None:
+            plan = solve_central(demands_and_pv=demands_and_pv,
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=policy_init,
+                                 backend=backend)
+        policy_cost += step_cost(plan, param_mpc)
+        policy_init = soc_init(plan)
+
+    eval_times = np.array(eval_times)
+    return {"steps": n_steps,
+            "exact_cost": exact_cost,
+            "policy_cost": policy_cost,
+            "regret": (policy_cost - exact_cost) / abs(exact_cost),
+            "fallbacks": n_fallbacks,
+            "infeasible_actions": n_infeasible,
+            "eval_mean": eval_times.mean(),
+            "eval_p99": np.percentile(eval_times, 99),
+            "solve_mean": float(np.mean(solve_times))}
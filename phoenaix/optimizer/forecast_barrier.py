@@ -0,0 +1,176 @@
+"""
+Barrier of the MPC on the forecasts of all buildings.
+
+Every MPC cycle requests a forecast per building on /predict<id> and may
+only read its inputs once every forecast agent has answered on /predicted.
+The answers arrive in the MQTT callback thread. ForecastBarrier records
+them under a condition variable, so the waiting MPC thread wakes up as soon
+as the last one is in. Buildings that have not answered after retry_after
+seconds are requested again, and a building whose deadline has passed is
+given up, so that the MPC runs on its last published forecast.
+"""
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which a missing forecast is requested again
+RETRY_AFTER = 5.0
+# Number of repeated requests per building and cycle
+MAX_RETRIES = 3
+
+
+class ForecastBarrier:
+    """
+    Forecasts of the current cycle that have arrived.
+
+    Args:
+        building_ids: buildings that deliver a forecast in every cycle
+        deadline: seconds after the start of a cycle after which a missing
+            forecast is given up, None to wait for it without limit
+        deadlines: deadlines of single buildings instead of deadline
+        retry_after: seconds between two requests of a missing forecast
+        max_retries: repeated requests of a building per cycle
+    """
+
+    def __init__(self,
+                 building_ids,
+                 deadline: float = None,
+                 deadlines: dict = None,
+                 retry_after: float = RETRY_AFTER,
+                 max_retries: int = MAX_RETRIES):
+        self.building_ids = list(building_ids)
+        self.deadlines = {building_id: deadline
+                          for building_id in self.building_ids}
+        self.deadlines.update(deadlines or {})
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+
+        self._cond = threading.Condition()
+        self._received = {building_id: False
+                          for building_id in self.building_ids}
+        # time step of the last forecast of every building
+        self.counter = {building_id: 0 for building_id in self.building_ids}
+        self._cycle_start = time.perf_counter()
+
+        self.n_cycles = 0
+        self.n_retries = 0
+        self.n_given_up = 0
+        # seconds from the start of a cycle until all forecasts arrived or
+        # the missing ones were given up, of the last cycles
+        self.times_to_barrier = deque(maxlen=1000)
+
+    def start_cycle(self):
+        """
+        Forget the forecasts of the last cycle. Call it before the
+        forecasts are requested, so that no fast answer is lost.
+        """
+        with self._cond:
+            for building_id in self._received:
+                self._received[building_id] = False
+            self._cycle_start = time.perf_counter()
+
+    def arrive(self, building_id, current_ix: int = None):
+        """Record the forecast of a building, from the MQTT callback"""
+        with self._cond:
+            if building_id not in self._received:
+                logger.warning(f'Forecast of unknown building {building_id}')
+                return
+            self._received[building_id] = True
+            if current_ix is not None:
+                self.counter[building_id] = current_ix
+            self._cond.notify_all()
+
+    def missing(self) -> list:
+        with self._cond:
+            return [building_id
+                    for building_id, received in self._received.items()
+                    if not received]
+
+    def wait(self, request=None) -> list:
+        """
+        Block until all forecasts of the cycle arrived or the missing ones
+        passed their deadlines.
+
+        Args:
+            request: function of a building id that requests its forecast
+                again, no retries if None
+
+        Returns:
+            buildings whose forecasts were given up
+        """
+        retries = {building_id: 0 for building_id in self.building_ids}
+        with self._cond:
+            cycle_start = self._cycle_start
+        next_retry = {building_id: cycle_start + self.retry_after
+                      for building_id in self.building_ids}
+
+        while True:
+            with self._cond:
+                missing = [building_id
+                           for building_id, received in self._received.items()
+                           if not received]
+                now = time.perf_counter()
+                given_up = [building_id for building_id in missing
+                            if self._expired(building_id, cycle_start, now)]
+                waiting = [building_id for building_id in missing
+                           if building_id not in given_up]
+                if not waiting:
+                    break
+                due = [building_id for building_id in waiting
+                       if request is not None
+                       and retries[building_id] < self.max_retries
+                       and now >= next_retry[building_id]]
+                if not due:
+                    self._cond.wait(timeout=self._wake_up(
+                        waiting, cycle_start, next_retry, retries,
+                        request is not None) - now)
+                    continue
+
+            for building_id in due:
+                logger.info(f'Requesting the forecast of building '
+                            f'{building_id} again')
+                request(building_id)
+                retries[building_id] += 1
+                next_retry[building_id] = now + self.retry_after
+                self.n_retries += 1
+
+        time_to_barrier = time.perf_counter() - cycle_start
+        self.times_to_barrier.append(time_to_barrier)
+        self.n_cycles += 1
+        self.n_given_up += len(given_up)
+        if given_up:
+            logger.warning(f'Gave up the forecasts of buildings {given_up} '
+                           f'after {time_to_barrier:.2f} s')
+        return given_up
+
+    def _expired(self, building_id, cycle_start, now) -> bool:
+        deadline = self.deadlines.get(building_id)
+        return deadline is not None and now - cycle_start >= deadline
+
+    def _wake_up(self, waiting, cycle_start, next_retry, retries,
+                 retry) -> float:
+        """Point in time of the next retry or deadline of a building"""
+        times = [cycle_start + self.deadlines[building_id]
+                 for building_id in waiting
+                 if self.deadlines.get(building_id) is not None]
+        if retry:
+            times += [next_retry[building_id] for building_id in waiting
+                      if retries[building_id] < self.max_retries]
+        # without retries and deadlines only an arrival wakes the MPC, the
+        # timeout merely bounds a lost notification
+        return min(times, default=time.perf_counter() + self.retry_after)
+
+    def stats(self) -> dict:
+        stats = {"cycles": self.n_cycles,
+                 "retries": self.n_retries,
+                 "given_up": self.n_given_up}
+        if self.times_to_barrier:
+            times = np.array(self.times_to_barrier)
+            stats["time_to_barrier_mean"] = times.mean()
+            stats["time_to_barrier_p99"] = np.percentile(times, 99)
+            stats["time_to_barrier_max"] = times.max()
+        return stats
@@ -0,0 +1,585 @@
+from pathlib import Path
+from datetime import datetime
+import numpy as np
+import gurobipy as gp
+from phoenaix.optimizer.buildings import building_arrays
+
+# Define subsets
+HEATER = ("boi", "eh", "hp")
+STORAGE = ("tes",)
+SOLAR = ("pv",)
+DEVICE = HEATER + STORAGE + SOLAR
+
+DT = 1  # in hours
+
+# Heat pump: Carnot efficiency, supply temperature and the outdoor
+# temperature used when no temperature forecast is given (all in °C)
+ETA_CARNOT_HP = 0.4
+T_SUPPLY_HP = 35
+T_AIR_DEFAULT = 5
+# Lower limit of the temperature lift, keeps the CoP finite for warm days
+MIN_LIFT_HP = 5
+
+# Names of the constraint groups whose right-hand side depends on the
+# forecasts or on the initial state of the storages
+PARAMETER_CONSTRS = ("pv", "eh", "dch", "elec", "storage_init")
+
+
+def parameter_rhs(demands_and_pv,
+                  buildings,
+                  n_horizon,
+                  init_val,
+                  time_grid=None):
+    """
+    Right-hand sides of all constraints that change between two MPC steps.
+
+    Args:
+        demands_and_pv: forecasts as {quantity: {building: [values]}} or
+            as {quantity: array of shape (building, time)} in the order of
+            buildings
+        buildings: device parameters of every building, a
+            buildings.BuildingTable or nested dicts
+        n_horizon: number of time steps
+        init_val: initial SOCs as {'soc': {building: {'tes': value}}} or
+            None to start at half the storage capacity
+        time_grid: time_grid.TimeGrid of the horizon, the forecasts are
+            averaged over its steps. None for n_horizon steps of DT.
+
+    Returns:
+        dict with arrays of shape (building, time) for every constraint
+        group in PARAMETER_CONSTRS, except 'storage_init' with shape
+        (building,)
+    """
+    devs = building_arrays(buildings)
+    n_values = n_horizon if time_grid is None else time_grid.n_values
+
+    def _values(key):
+        values = demands_and_pv[key]
+        if isinstance(values, np.ndarray):
+            values = values[:, :n_values].astype(float)
+        else:
+            values = np.array([values[n][:n_values] for n in buildings],
+                              dtype=float)
+        if time_grid is not None:
+            values = time_grid.aggregate(values)
+        return values
+
+    heating = _values("heating")
+    dhw = _values("dhw")
+
+    # eletric heater covers 50% of the dhw
+    has_eh = devs["cap_eh"] != 0.0
+    eh = np.where(has_eh[:, None], 0.5 * dhw, 0.0)
+
+    # Initialization: only if initial values have been generated in previous
+    # prediction horizon, otherwise the storages start half full
+    if init_val is not None:
+        soc_prev = np.array([init_val["soc"][n]["tes"] for n in buildings],
+                            dtype=float)
+    else:
+        soc_prev = devs["cap_tes"] * 0.5
+
+    # storage losses over the first step
+    first_step = DT if time_grid is None else time_grid.durations[0]
+    return {
+        "pv": _values("pv_power"),
+        "eh": eh,
+        "dch": (heating + dhw - eh) / devs["eta_dch"][:, None],
+        "elec": _values("elec"),
+        "storage_init": soc_prev * devs["eta_tes"] ** (first_step / DT),
+    }
+
+
+def cop_profile(demands_and_pv,
+                n_horizon,
+                time_grid=None):
+    """
+    CoP of the heat pumps at every time step.
+
+    The CoP is a parameter of the optimization, calculated from the outdoor
+    temperature forecast 't_air' in demands_and_pv if it is given and
+    constant otherwise.
+
+    Returns:
+        array of shape (time,)
+    """
+    t_air = demands_and_pv.get("t_air") if demands_and_pv else None
+    if t_air is None:
+        n_steps = n_horizon if time_grid is None else time_grid.n_steps
+        t_air = np.full(n_steps, T_AIR_DEFAULT, dtype=float)
+    elif time_grid is None:
+        t_air = np.array([t_air[t] for t in range(n_horizon)], dtype=float)
+    else:
+        t_air = time_grid.aggregate([t_air[t]
+                                     for t in range(time_grid.n_values)])
+    lift = np.maximum(T_SUPPLY_HP - t_air, MIN_LIFT_HP)
+    return ETA_CARNOT_HP * (273.15 + T_SUPPLY_HP) / lift
+
+
+def build_central_model(demands_and_pv,
+                        buildings,
+                        n_horizon,
+                        param_mpc,
+                        init_val,
+                        env=None,
+                        bilinear_cop=False):
+    """
+    Build the central MILP of the neighborhood.
+
+    All constraints that depend on the forecasts or on the initial SOC are
+    written as '<linear expression> == <constant>' so that a later step only
+    has to overwrite their right-hand side. The CoP of the heat pumps enters
+    as the coefficient of their power in 'heat - cop * power == 0'.
+
+    bilinear_cop restores the former formulation with the CoP as a decision
+    variable fixed by an equality, which makes the heat pump equation
+    quadratic. It is only kept to benchmark both forms.
+
+    Returns:
+        tuple of the gurobi model and a dict with the handles of all
+        variables and of the parameter dependent constraints
+    """
+    model = gp.Model("Design computation", env=env)
+
+    N_HORIZON = n_horizon
+    time_steps = range(N_HORIZON)
+
+    rhs = parameter_rhs(demands_and_pv=demands_and_pv,
+                        buildings=buildings,
+                        n_horizon=n_horizon,
+                        init_val=init_val)
+
+    # Define variables
+    # Costs and Revenues
+    c_dem = {dev: model.addVar(vtype="C", name="c_dem_" + dev)
+             for dev in ("gas", "grid")}
+
+    revenue = {"grid_pv": model.addVar(vtype="C", name="revenue_" + "grid_pv")
+               }
+
+    # SOC, charging, discharging, power and heat
+    soc = {}
+    p_ch = {}
+    p_dch = {}
+    power = {}
+    heat = {}
+    for n in buildings:
+        soc[n] = {}
+        p_ch[n] = {}
+        p_dch[n] = {}
+        for dev in STORAGE:  # All storage devices
+            soc[n][dev] = {}
+            p_ch[n][dev] = {}
+            p_dch[n][dev] = {}
+            for t in time_steps:  # All time steps of all days
+                soc[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="SOC_" + dev + "_" + str(t))
+                p_ch[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="P_ch_" + dev + "_" + str(t))
+                p_dch[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="P_dch_" + dev + "_" + str(t))
+
+    for n in buildings:
+        power[n] = {}
+        heat[n] = {}
+        for dev in ["hp", "boi"]:
+            power[n][dev] = {}
+            heat[n][dev] = {}
+            for t in time_steps:
+                power[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="P_" + dev + "_" + str(t))
+                heat[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="Q_" + dev + "_" + str(t))
+
+    cop_hp = cop_profile(demands_and_pv=demands_and_pv,
+                         n_horizon=n_horizon)
+    cop = {}
+    if bilinear_cop:
+        for n in buildings:
+            cop[n] = {}
+            for dev in ["hp"]:
+                cop[n][dev] = {}
+                for t in time_steps:
+                    cop[n][dev][t] = model.addVar(
+                        vtype="C", lb=0, name="CoP_" + dev + "_" + str(t))
+
+    for n in buildings:
+        for dev in ["eh"]:
+            power[n][dev] = {}
+            for t in time_steps:
+                power[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="P_" + dev + "_" + str(t))
+
+    for n in buildings:
+        for dev in ["pv"]:
+            power[n][dev] = {}
+            for t in time_steps:
+                power[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="P_" + dev + "_" + str(t))
+
+    # mapping storage sizes
+    soc_nom = {}
+    for n in buildings:
+        soc_nom[n] = {}
+        for dev in STORAGE:
+            soc_nom[n][dev] = buildings[n][dev]["cap"]
+
+    # Electricity imports, sold and self-used electricity
+    p_imp = {}
+    p_use = {}
+    p_sell = {}
+    y_imp = {}
+    for n in buildings:
+        p_imp[n] = {}
+        y_imp[n] = {}
+        p_use[n] = {}
+        p_sell[n] = {}
+        for t in time_steps:
+            p_imp[n][t] = model.addVar(
+                vtype="C", lb=0, name="P_imp_" + str(t))
+            y_imp[n][t] = model.addVar(
+                vtype="B", lb=0.0, ub=1.0, name="y_imp_exp_" + str(t))
+        for dev in ["pv"]:
+
+            p_use[n][dev] = {}
+            p_sell[n][dev] = {}
+            for t in time_steps:
+                p_use[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="P_use_" + dev + "_" + str(t))
+                p_sell[n][dev][t] = model.addVar(vtype="C", lb=0,
+                                                 name="P_sell_" + dev + "_" + str(t))
+
+    # Gas imports to devices
+    gas = {}
+    for n in buildings:
+        gas[n] = {}
+        for dev in ["boi"]:
+
+            gas[n][dev] = {}
+            for t in time_steps:
+                gas[n][dev][t] = model.addVar(
+                    vtype="C", lb=0, name="gas" + dev + "_" + str(t))
+
+    # activation variable for trafo load
+    yTrafo = model.addVars(time_steps, vtype="B", name="yTrafo")
+
+    #  BALANCING UNIT VARIABLES
+
+    # Residual network demand
+    residual = {}
+    residual["demand"] = {}  # Residual network electricity demand
+    residual["feed_pv"] = {}  # Residual feed in pv
+    power["from_grid"] = {}
+    power["to_grid"] = {}
+    gas_dom = {}
+
+    for t in time_steps:
+        residual["demand"][t] = model.addVar(
+            vtype="C", lb=0, name="residual_demand_t" + str(t))
+        residual["feed_pv"][t] = model.addVar(
+            vtype="C", lb=0, name="residual_feed_pv_t" + str(t))
+        power["from_grid"][t] = model.addVar(
+            vtype="C", lb=0, name="district_demand_t" + str(t))
+        power["to_grid"][t] = model.addVar(
+            vtype="C", lb=0, name="district_feed_t" + str(t))
+        gas_dom[t] = model.addVar(
+            vtype="C", lb=0, name="gas_demand_t" + str(t))
+
+    # Electrical power to/from devices
+    for device in ["el_from_grid", "el_to_grid", "gas_from_grid"]:
+        power[device] = {}
+        for t in time_steps:
+            power[device][t] = model.addVar(
+                vtype="C", lb=0, name="power_" + device + "_t" + str(t))
+
+    # total energy amounts taken from grid
+    from_grid_total_el = model.addVar(
+        vtype="C", lb=0, name="from_grid_total_el")
+    # total power to grid
+    to_grid_total_el = model.addVar(
+        vtype="C", lb=0, name="to_grid_total_el")
+    # total gas amounts taken from grid
+    from_grid_total_gas = model.addVar(
+        vtype="C", lb=0, name="from_grid_total_gas")
+
+    network_load = model.addVar(
+        vtype="c", lb=-gp.GRB.INFINITY, name="peak_network_load")
+
+    # Update
+    model.update()
+
+    # Objective
+    # TODO:
+    model.setObjective(c_dem["grid"] + c_dem["gas"] - revenue["grid_pv"]
+                       + network_load * 0.01, gp.GRB.MINIMIZE)
+
+    # Network load
+    model.addConstrs(
+        network_load >= power["from_grid"][t] for t in time_steps)
+
+    m_cons = 50_000_000
+    for n in buildings:
+        for t in time_steps:
+            model.addConstr(y_imp[n][t] * m_cons >= p_imp[n]
+                            [t], name="Max_el_imp_" + str(t))
+            # model.addConstr((1 - y_imp[n][t]) * 1000 >= p_sell[n]["pv"][t] + p_sell[n]["CHP"][t],
+            #                 name="Max_el_exp_" + str(t))
+            model.addConstr((1 - y_imp[n][t]) * m_cons >= p_sell[n]["pv"][t],
+                            name="Max_el_exp_" + str(t))
+
+    # Define constraints
+
+    # Economic constraints
+
+    # Demand related costs (gas)
+    model.addConstr(
+        c_dem["gas"] == param_mpc["eco"]["gas"] *
+        sum(DT * gas_dom[t] for t in time_steps),
+        name="Demand_costs_gas")
+    # Demand related costs (electricity)
+    model.addConstr(
+        c_dem["grid"] == param_mpc["eco"]["el_grid"] * sum(
+            DT * residual["demand"][t] for t in time_steps),
+        name="Demand_costs_el_grid")
+    # Revenues for selling electricity to the grid / neighborhood
+    model.addConstr(
+        revenue["grid_pv"] == param_mpc["eco"]["sell_pv"] * sum(
+            DT * residual["feed_pv"][t] for t in time_steps),
+        name="Feed_in_rev_pv")
+
+    # Technical constraints
+
+    # Determine nominal heat at every timestep
+    for n in buildings:
+        for t in time_steps:
+            for dev in ["hp", "boi", "eh"]:
+                # for dev in ["hp35", "hp55", "chp", "boi", "eh"]:
+
+                if dev == "eh":
+                    model.addConstr(power[n][dev][t] <=
+                                    buildings[n][dev]["cap"])
+                else:
+                    model.addConstr(heat[n][dev][t] <= buildings[n][dev]["cap"],
+                                    name="Max_heat_operation_" + dev)
+
+    # Devices operation
+    # Heat output between mod_lvl*Q_nom and Q_nom (P_nom for heat pumps)
+    # Power and Energy directly result from Heat output
+    # The CoP constraints are stored in (building, time) order
+    cop_constrs = []
+    for n in buildings:
+        for t in time_steps:
+            # Heatpumps
+            dev = "hp"
+            if bilinear_cop:
+                model.addConstr(heat[n][dev][t] == power[n][dev][t] * cop[n][dev][t],
+                                name="Power_equation_" + dev + "_" + str(t))
+                model.addConstr(cop[n][dev][t] == cop_hp[t],
+                                name="CoP_equation_" + dev + "_" + str(t))
+            else:
+                cop_constrs.append(model.addConstr(
+                    heat[n][dev][t] - cop_hp[t] * power[n][dev][t] == 0,
+                    name="Power_equation_" + dev + "_" + str(t)))
+
+            # BOILER
+            dev = "boi"
+            model.addConstr(
+                heat[n]["boi"][t] == buildings[n]["boi"]["eta_th"] *
+                gas[n]["boi"][t],
+                name="Power_equation_" + dev + "_" + str(t))
+
+    # Parameter dependent constraints, stored in (building, time) order
+    param_constrs = {name: [] for name in PARAMETER_CONSTRS}
+
+    # # Solar components
+    for i, n in enumerate(buildings):
+        for dev in SOLAR:
+            for t in time_steps:
+                param_constrs["pv"].append(model.addConstr(
+                    power[n][dev][t] == rhs["pv"][i, t],
+                    name="Solar_electrical_" + dev + "_" + str(t)))
+
+    # power of the electric heater
+    for i, n in enumerate(buildings):
+        # eletric heater covers 50% of the dhw
+        for t in time_steps:
+            param_constrs["eh"].append(model.addConstr(
+                power[n]["eh"][t] == rhs["eh"][i, t],
+                name="El_heater_act_" + str(t)))
+
+    #  BUILDING STORAGES # %% DOMESTIC FLEXIBILITIES
+
+    # TES CONSTRAINTS CONSTRAINTS
+    dev = "tes"
+    for i, n in enumerate(buildings):
+        eta_tes = buildings[n][dev]["eta_tes"]
+        eta_ch = buildings[n][dev]["eta_ch"]
+
+        for t in time_steps:
+            # Maximal charging
+            model.addConstr(p_ch[n][dev][t] == eta_ch * (heat[n]["hp"][t] + heat[n]["boi"][t]),
+                            name="Heat_charging_" + str(t))
+            # Maximal discharging
+            param_constrs["dch"].append(model.addConstr(
+                p_dch[n][dev][t] == rhs["dch"][i, t],
+                name="Heat_discharging_" + str(t)))
+
+            # Minimal and maximal soc
+            # model.addConstr(soc[n]["TES"][t] <= soc_nom[n]["TES"], name="max_cap_tes_" + str(t))
+            # model.addConstr(soc[n]["TES"][t] >= nodes[n]["buildings"]["TES"]["min_soc"] * soc_nom[n]["TES"],
+            #                name="min_cap_" + str(t))
+
+            # SOC coupled over all times steps (Energy amount balance, kWh)
+            # Initial SOC is the SOC at the beginning of the first time step,
+            # thus it equals the SOC at the end of the previous time step
+            if t == 0:
+                param_constrs["storage_init"].append(model.addConstr(
+                    soc[n][dev][t] - DT * (p_ch[n][dev][t] - p_dch[n][dev][t])
+                    == rhs["storage_init"][i],
+                    name="Storage_bal_" + dev + "_" + str(t)))
+            else:
+                model.addConstr(
+                    soc[n][dev][t] == soc[n][dev][t - 1] * eta_tes + DT *
+                    (p_ch[n][dev][t] - p_dch[n][dev][t]),
+                    name="Storage_bal_" + dev + "_" + str(t))
+
+        # TODO: soc at the end is the same like at the beginning
+        # if t == last_time_step:
+        #    model.addConstr(soc[device][t] == soc_init[device],
+        #                    name="End_TES_Storage_" + str(t))
+
+    # Electricity balance (house)
+    for i, n in enumerate(buildings):
+        for t in time_steps:
+            param_constrs["elec"].append(model.addConstr(
+                p_imp[n][t] - power[n]["hp"][t] - power[n]["eh"][t]
+                + p_use[n]["pv"][t] == rhs["elec"][i, t],
+                name="Electricity_balance_" + str(t)))
+
+    # Split CHP and PV generation into self-consumed and sold powers
+    # TODO: Following constrains commented to make model feasible
+    for n in buildings:
+        for dev in ("pv",):
+            for t in time_steps:
+                model.addConstr(p_sell[n][dev][t] + p_use[n][dev][t] == power[n][dev][t],
+                                name="power=sell+use_" + dev + "_" + str(t))
+
+    # energy balance neighborhood
+
+    # Residual loads
+    for t in time_steps:
+        # Residual network electricity demand (Power balance, MW)
+        model.addConstr(residual["demand"][t] == sum(
+            p_imp[n][t] for n in buildings))
+        model.addConstr(residual["feed_pv"][t] == sum(
+            p_sell[n]["pv"][t] for n in buildings))
+        # Gas balance (power)
+        model.addConstr(gas_dom[t] == sum(gas[n]["boi"][t] for n in buildings),
+                        name="Demand_gas_total")
+
+    # Total gas amounts taken from grid (Energy amounts, MWh)
+    model.addConstr(
+        from_grid_total_gas == sum(DT * power["gas_from_grid"][t] for t in time_steps))
+    # Total electricity amounts taken from grid (Energy amounts, MWh)
+    model.addConstr(from_grid_total_el == sum(
+        DT * power["from_grid"][t] for t in time_steps))
+    # Total electricity feed-in (Energy amounts, MWh)
+    model.addConstr(to_grid_total_el == sum(
+        DT * power["to_grid"][t] for t in time_steps))
+
+    # column indices of the result quantities, (building, time) or (time,)
+    def _columns(var_dict):
+        return np.array([[var_dict[n][t].index for t in time_steps]
+                         for n in buildings], dtype=int)
+
+    def _time_columns(vars_t):
+        return np.array([vars_t[t].index for t in time_steps], dtype=int)
+
+    columns = {
+        "soc": _columns({n: soc[n]["tes"] for n in buildings}),
+        "p_ch": _columns({n: p_ch[n]["tes"] for n in buildings}),
+        "p_dch": _columns({n: p_dch[n]["tes"] for n in buildings}),
+        "p_hp": _columns({n: power[n]["hp"] for n in buildings}),
+        "q_hp": _columns({n: heat[n]["hp"] for n in buildings}),
+        "p_boi": _columns({n: power[n]["boi"] for n in buildings}),
+        "q_boi": _columns({n: heat[n]["boi"] for n in buildings}),
+        "p_eh": _columns({n: power[n]["eh"] for n in buildings}),
+        "p_pv": _columns({n: power[n]["pv"] for n in buildings}),
+        "p_imp": _columns(p_imp),
+        "y_imp": _columns(y_imp),
+        "p_use": _columns({n: p_use[n]["pv"] for n in buildings}),
+        "p_sell": _columns({n: p_sell[n]["pv"] for n in buildings}),
+        "gas_boi": _columns({n: gas[n]["boi"] for n in buildings}),
+        "residual_demand": _time_columns(residual["demand"]),
+        "residual_feed_pv": _time_columns(residual["feed_pv"]),
+        "from_grid": _time_columns(power["from_grid"]),
+        "to_grid": _time_columns(power["to_grid"]),
+        "gas_dom": _time_columns(gas_dom),
+    }
+
+    handles = {
+        "vars": model.getVars(),
+        "columns": columns,
+        "building_ids": list(buildings),
+        "soc": soc,
+        "soc_nom": soc_nom,
+        "p_ch": p_ch,
+        "p_dch": p_dch,
+        "power": power,
+        "heat": heat,
+        "cop": cop,
+        "cop_constrs": cop_constrs,
+        "p_imp": p_imp,
+        "y_imp": y_imp,
+        "p_use": p_use,
+        "p_sell": p_sell,
+        "gas": gas,
+        "gas_dom": gas_dom,
+        "residual": residual,
+        "y_trafo": yTrafo,
+        "param_constrs": param_constrs,
+    }
+
+    return model, handles
+
+
+def set_solver_params(model,
+                      param_mpc):
+    # Set solver parameters
+    model.Params.TimeLimit = param_mpc["gp"]["time_limit"]
+    model.Params.MIPGap = param_mpc["gp"]["mip_gap"]
+    model.Params.MIPFocus = param_mpc["gp"]["numeric_focus"]
+    if "threads" in param_mpc["gp"]:
+        model.Params.Threads = param_mpc["gp"]["threads"]
+
+
+def is_infeasible(model):
+    return model.status == gp.GRB.Status.INFEASIBLE or \
+        model.status == gp.GRB.Status.INF_OR_UNBD
+
+
+def write_iis(model):
+    """
+    Compute the irreducible inconsistent subsystem of an infeasible model
+    and write it to the errors folder next to this module.
+    """
+    now = datetime.now()
+    folder_name = now.strftime("error_%Y_%m_%d_%H_%M_%S")
+    folder_path = Path(__file__).parents[0] / 'errors' / folder_name
+    folder_path.mkdir(exist_ok=True, parents=True)
+
+    IISconstr = []
+    model.computeIIS()
+
+    with open(folder_path / 'errorfile_hp.txt', 'w') as f:
+        f.write('\nThe following constraint(s) cannot be satisfied:\n')
+        for c in model.getConstrs():
+            if c.IISConstr:
+                f.write('%s' % c.constrName)
+                f.write('\n')
+                IISconstr.append(c.constrName)
+
+    # model.write("model_solution.sol")  # Writes the solution to a file
+    model_path = folder_path / 'model.ilp'
+    model.write(str(model_path))
+    return IISconstr
@@ -0,0 +1,183 @@
+"""
+Two-level MPC: a coarse plan over the whole horizon and a short problem
+that tracks it in every step.
+
+Solving the central problem over the full horizon every hour is the main
+cost of a cycle. HierarchicalPlanner solves it on a coarse time grid only
+once a day, or when the forecasts of the next hours deviate strongly from
+the ones it was planned with, and takes the SOCs of this plan as targets.
+Every step solves the same formulation over a few hourly steps only, with
+the SOCs at its end bounded below by the targets of the plan. If the
+targets cannot be reached, the short problem is solved without them.
+"""
+import numpy as np
+from phoenaix.optimizer.formulation import parameter_rhs
+from phoenaix.optimizer.matrix_model import assemble_central_milp
+from phoenaix.optimizer.results import MPCResult
+from phoenaix.optimizer.time_grid import TimeGrid
+
+# Hourly steps of the tracking problem
+SHORT_HORIZON = 6
+# Steps after which the coarse plan is renewed
+REPLAN_EVERY = 24
+# Relative deviation of the heat and net electricity forecasts of the next
+# SHORT_HORIZON hours from the planned ones that renews the plan
+DEVIATION = 0.2
+
+
+def _solve(milp, param_mpc, backend, deadline):
+    """MPCResult or None, and the status of the solve"""
+    solution = backend.solve(milp, deadline=deadline)
+    if not solution.has_solution:
+        return None, solution.status
+    res = MPCResult(values=solution.x,
+                     columns=milp.columns,
+                     building_ids=milp.building_ids,
+                     param_mpc=param_mpc,
+                     status=solution.status,
+                     obj_val=solution.obj_val,
+                     mip_gap=solution.mip_gap,
+                     info={"solve_time": solution.solve_time})
+    return res, solution.status
+
+
+class HierarchicalPlanner:
+    """
+    Coarse plan with SOC targets and a short tracking problem per step.
+
+    Args:
+        buildings: device parameters of all buildings
+        param_mpc: parameters of the MPC
+        backend: solver backend of both levels, see backends.make_backend
+        day_grid: time grid of the coarse plan, its forecast values are
+            those of the MPC input
+        n_short: hourly steps of the tracking problem
+        replan_every: steps after which the plan is renewed
+        deviation: relative forecast deviation that renews the plan
+    """
+
+    def __init__(self,
+                 buildings,
+                 param_mpc: dict,
+                 backend,
+                 day_grid: TimeGrid,
+                 n_short: int = SHORT_HORIZON,
+                 replan_every: int = REPLAN_EVERY,
+                 deviation: float = DEVIATION):
+        if n_short >= day_grid.n_values:
+            raise ValueError(f'The tracking horizon of {n_short} steps must '
+                             f'be shorter than the {day_grid.n_values} hours '
+                             f'of the coarse plan')
+        self.buildings = buildings
+        self.param_mpc = param_mpc
+        self.backend = backend
+        self.day_grid = day_grid
+        self.n_short = n_short
+        self.replan_every = replan_every
+        self.deviation = deviation
+
+        # SOCs of the plan at its start and at the end of every hour
+        self._plan_soc = None
+        # heat and net electricity demand the plan was made with
+        self._plan_loads = None
+        self.plan_age = 0
+
+        self.n_plans = 0
+        self.n_steps = 0
+        self.n_untracked = 0
+        self.replan_reasons = {"schedule": 0, "deviation": 0, "horizon": 0}
+        # status of the last solve of either level, see results.py
+        self.status = None
+
+    def solve(self,
+              demands_and_pv,
+              init_val,
+              deadline=None):
+        """
+        Setpoints of one step.
+
+        Returns:
+            MPCResult of the tracking problem, or None without a solution
+            of the plan or of the tracking problem
+        """
+        loads = self._loads(demands_and_pv, self.day_grid.n_values)
+        reason = self._replan_reason(loads)
+        if reason is not None:
+            if not self._plan(demands_and_pv, init_val, loads, deadline):
+                return None
+            self.replan_reasons[reason] += 1
+
+        milp = assemble_central_milp(demands_and_pv=demands_and_pv,
+                                     buildings=self.buildings,
+                                     n_horizon=self.n_short,
+                                     param_mpc=self.param_mpc,
+                                     init_val=init_val)
+        lb = milp.lb
+        milp.lb = lb.copy()
+        milp.lb[milp.columns["soc"][:, -1]] = \
+            self._plan_soc[:, self.plan_age + self.n_short]
+        res, self.status = _solve(milp, self.param_mpc, self.backend,
+                                  deadline)
+        if res is None:
+            self.n_untracked += 1
+            milp.lb = lb
+            res, self.status = _solve(milp, self.param_mpc, self.backend,
+                                      deadline)
+        self.plan_age += 1
+        self.n_steps += 1
+        if res is not None:
+            res.info.update({"replanned": reason,
+                             "tracked": milp.lb is not lb})
+        return res
+
+    def _loads(self, demands_and_pv, n_values):
+        rhs = parameter_rhs(demands_and_pv=demands_and_pv,
+                            buildings=self.buildings,
+                            n_horizon=n_values,
+                            init_val=None)
+        return np.stack([rhs["dch"], rhs["elec"] - rhs["pv"]])
+
+    def _replan_reason(self, loads):
+        if self._plan_soc is None or self.plan_age >= self.replan_every:
+            return "schedule"
+        if self.plan_age + self.n_short >= self._plan_soc.shape[1]:
+            return "horizon"
+        planned = self._plan_loads[:, :, self.plan_age:
+                                   self.plan_age + self.n_short]
+        error = np.abs(loads[:, :, :self.n_short] - planned).sum()
+        if error > self.deviation * max(np.abs(planned).sum(), 1e-9):
+            return "deviation"
+        return None
+
+    def _plan(self, demands_and_pv, init_val, loads, deadline):
+        milp = assemble_central_milp(demands_and_pv=demands_and_pv,
+                                     buildings=self.buildings,
+                                     n_horizon=self.day_grid.n_steps,
+                                     param_mpc=self.param_mpc,
+                                     init_val=init_val,
+                                     time_grid=self.day_grid)
+        res, self.status = _solve(milp, self.param_mpc, self.backend,
+                                  deadline)
+        if res is None:
+            return False
+        soc = res.values[milp.columns["soc"]]
+        soc_start = parameter_rhs(demands_and_pv=demands_and_pv,
+                                  buildings=self.buildings,
+                                  n_horizon=1,
+                                  init_val=init_val)["storage_init"]
+        # targets at the end of every hour, linear within coarse steps
+        ends = np.concatenate([[0.0], np.cumsum(self.day_grid.durations)])
+        hours = np.arange(self.day_grid.n_values + 1)
+        self._plan_soc = np.array([
+            np.interp(hours, ends, np.concatenate([[start], values]))
+            for start, values in zip(soc_start, soc)])
+        self._plan_loads = loads
+        self.plan_age = 0
+        self.n_plans += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"steps": self.n_steps,
+                "plans": self.n_plans,
+                "untracked": self.n_untracked,
+                **self.replan_reasons}
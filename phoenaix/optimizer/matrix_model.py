@@ -0,0 +1,384 @@
+"""
+Matrix form of the central MILP.
+
+The formulation is the same as in formulation.build_central_model, but all
+variables of one kind are a block of columns indexed by (building, time
+step) and every constraint group is one block of rows of a sparse
+coefficient matrix. The model is assembled with NumPy/SciPy only and handed
+to gurobi with a single addMVar and a single addMConstr call.
+"""
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gp
+from phoenaix.optimizer.buildings import building_arrays
+from phoenaix.optimizer.formulation import \
+    DT, \
+    PARAMETER_CONSTRS, \
+    parameter_rhs, \
+    cop_profile
+
+# Columns indexed by (building, time step)
+BT_COLUMNS = ("soc", "p_ch", "p_dch", "p_hp", "q_hp", "p_boi", "q_boi",
+              "p_eh", "p_pv", "p_imp", "y_imp", "p_use", "p_sell", "gas_boi")
+# Columns indexed by time step
+T_COLUMNS = ("residual_demand", "residual_feed_pv", "from_grid", "to_grid",
+             "gas_dom", "el_from_grid", "el_to_grid", "gas_from_grid",
+             "y_trafo")
+# Single columns
+SCALAR_COLUMNS = ("c_gas", "c_grid", "revenue", "from_grid_total_el",
+                  "to_grid_total_el", "from_grid_total_gas", "network_load")
+
+BINARY_COLUMNS = ("y_imp", "y_trafo")
+FREE_COLUMNS = ("network_load",)
+
+M_CONS = 50_000_000
+
+
+class _RowAssembler:
+    """
+    Collects the coordinates of the sparse constraint matrix block by block.
+    """
+
+    def __init__(self):
+        self.row_ix = []
+        self.col_ix = []
+        self.values = []
+        self.sense = []
+        self.rhs = []
+        self.blocks = {}
+        self.n_rows = 0
+
+    def add(self, name, terms, sense, rhs=0.0):
+        """
+        Add a block of rows.
+
+        Args:
+            name: name of the constraint group
+            terms: list of (columns, coefficients). columns has the shape
+                (rows,) or (rows, k) for k variables per row, coefficients
+                is a scalar, has the shape (rows,) or the shape of columns
+            sense: '<', '>' or '='
+            rhs: scalar or array of shape (rows,)
+        """
+        n_rows = np.shape(terms[0][0])[0]
+        if n_rows == 0:
+            return
+        rows = self.n_rows + np.arange(n_rows)
+        for cols, coeff in terms:
+            cols = np.asarray(cols)
+            if cols.ndim == 1:
+                cols = cols[:, None]
+            coeff = np.asarray(coeff, dtype=float)
+            if coeff.ndim == 1:
+                coeff = coeff[:, None]
+            coeff = np.broadcast_to(coeff, cols.shape)
+            self.row_ix.append(np.repeat(rows, cols.shape[1]))
+            self.col_ix.append(cols.ravel())
+            self.values.append(coeff.ravel())
+        self.sense.append(np.full(n_rows, sense))
+        self.rhs.append(np.broadcast_to(np.asarray(rhs, dtype=float),
+                                        (n_rows,)))
+        self.blocks[name] = rows
+        self.n_rows += n_rows
+
+    def matrix(self, n_cols):
+        return sp.csr_matrix((np.concatenate(self.values),
+                              (np.concatenate(self.row_ix),
+                               np.concatenate(self.col_ix))),
+                             shape=(self.n_rows, n_cols))
+
+
+class CentralMILP:
+    """
+    The central MILP in the solver independent form
+
+        min c @ x  s.t.  A @ x (sense) rhs,  lb <= x <= ub
+
+    Attributes:
+        columns: column indices of every variable group, shaped
+            (building, time), (time,) or () for single variables
+        rows: row indices of every constraint group
+        building_ids: keys of the buildings in the order of the first axis
+        durations: duration of every time step in hours
+    """
+
+    def __init__(self, c, A, sense, rhs, lb, ub, vtype,
+                 columns, rows, building_ids, n_horizon, durations=None):
+        self.c = c
+        self.A = A
+        self.sense = sense
+        self.rhs = rhs
+        self.lb = lb
+        self.ub = ub
+        self.vtype = vtype
+        self.columns = columns
+        self.rows = rows
+        self.building_ids = building_ids
+        self.n_horizon = n_horizon
+        if durations is None:
+            durations = np.full(n_horizon, float(DT))
+        self.durations = durations
+
+    @property
+    def n_cols(self):
+        return self.c.shape[0]
+
+    @property
+    def n_rows(self):
+        return self.rhs.shape[0]
+
+    def set_parameters(self, rhs: dict):
+        """Overwrite the parameter dependent right-hand sides"""
+        for name in PARAMETER_CONSTRS:
+            self.rhs[self.rows[name]] = np.ravel(rhs[name])
+
+    def unpack(self, x):
+        """Split a solution vector into the arrays of all variable groups"""
+        x = np.asarray(x)
+        return {name: x[cols] for name, cols in self.columns.items()}
+
+
+def _column_layout(n_buildings, n_horizon):
+    columns = {}
+    offset = 0
+    for name in BT_COLUMNS:
+        size = n_buildings * n_horizon
+        columns[name] = offset + np.arange(size).reshape(n_buildings, n_horizon)
+        offset += size
+    for name in T_COLUMNS:
+        columns[name] = offset + np.arange(n_horizon)
+        offset += n_horizon
+    for name in SCALAR_COLUMNS:
+        columns[name] = np.array(offset)
+        offset += 1
+    return columns, offset
+
+
+def assemble_central_milp(demands_and_pv,
+                          buildings,
+                          n_horizon,
+                          param_mpc,
+                          init_val,
+                          time_grid=None):
+    """
+    Assemble the central MILP of the neighborhood in matrix form.
+
+    Args:
+        time_grid: time_grid.TimeGrid of the horizon, replaces n_horizon
+            steps of DT by its steps
+    """
+    if time_grid is not None:
+        n_horizon = time_grid.n_steps
+        dt = time_grid.durations
+    else:
+        dt = np.full(n_horizon, float(DT))
+    building_ids = list(buildings)
+    n_buildings = len(building_ids)
+    T = n_horizon
+
+    devs = building_arrays(buildings)
+    rhs = parameter_rhs(demands_and_pv=demands_and_pv,
+                        buildings=buildings,
+                        n_horizon=n_horizon,
+                        init_val=init_val,
+                        time_grid=time_grid)
+
+    X, n_cols = _column_layout(n_buildings, n_horizon)
+
+    def bt(name):
+        return X[name].ravel()
+
+    def per_building(values):
+        # parameter of every building repeated for its time steps
+        return np.repeat(values, T)
+
+    # Bounds and types
+    lb = np.zeros(n_cols)
+    ub = np.full(n_cols, np.inf)
+    vtype = np.full(n_cols, "C")
+    for name in BINARY_COLUMNS:
+        ub[X[name]] = 1.0
+        vtype[X[name]] = "B"
+    for name in FREE_COLUMNS:
+        lb[X[name]] = -np.inf
+
+    # Objective
+    c = np.zeros(n_cols)
+    c[X["c_grid"]] = 1.0
+    c[X["c_gas"]] = 1.0
+    c[X["revenue"]] = -1.0
+    c[X["network_load"]] = 0.01
+
+    rows = _RowAssembler()
+
+    # Network load
+    rows.add("network_load",
+             [(np.full(T, X["network_load"]), 1.0),
+              (X["from_grid"], -1.0)],
+             ">")
+
+    # Either import or export per building
+    rows.add("max_el_imp",
+             [(bt("y_imp"), M_CONS), (bt("p_imp"), -1.0)],
+             ">")
+    rows.add("max_el_exp",
+             [(bt("y_imp"), M_CONS), (bt("p_sell"), 1.0)],
+             "<", M_CONS)
+
+    # Economic constraints
+    rows.add("demand_costs_gas",
+             [(X["c_gas"][None], 1.0),
+              (X["gas_dom"][None, :], -param_mpc["eco"]["gas"] * dt[None, :])],
+             "=")
+    rows.add("demand_costs_el_grid",
+             [(X["c_grid"][None], 1.0),
+              (X["residual_demand"][None, :],
+               -param_mpc["eco"]["el_grid"] * dt[None, :])],
+             "=")
+    rows.add("feed_in_rev_pv",
+             [(X["revenue"][None], 1.0),
+              (X["residual_feed_pv"][None, :],
+               -param_mpc["eco"]["sell_pv"] * dt[None, :])],
+             "=")
+
+    # Nominal heat at every timestep
+    rows.add("max_heat_hp", [(bt("q_hp"), 1.0)], "<",
+             per_building(devs["cap_hp"]))
+    rows.add("max_heat_boi", [(bt("q_boi"), 1.0)], "<",
+             per_building(devs["cap_boi"]))
+    rows.add("max_power_eh", [(bt("p_eh"), 1.0)], "<",
+             per_building(devs["cap_eh"]))
+
+    # Devices operation, the CoP is a parameter so the heat pump is linear
+    cop = cop_profile(demands_and_pv=demands_and_pv,
+                      n_horizon=n_horizon,
+                      time_grid=time_grid)
+    rows.add("power_equation_hp",
+             [(bt("q_hp"), 1.0), (bt("p_hp"), -np.tile(cop, n_buildings))],
+             "=")
+    rows.add("power_equation_boi",
+             [(bt("q_boi"), 1.0), (bt("gas_boi"), -per_building(devs["eta_th"]))],
+             "=")
+
+    # Parameter dependent constraints
+    rows.add("pv", [(bt("p_pv"), 1.0)], "=", rhs["pv"].ravel())
+    rows.add("eh", [(bt("p_eh"), 1.0)], "=", rhs["eh"].ravel())
+
+    # Thermal energy storage
+    eta_ch = per_building(devs["eta_ch"])
+    rows.add("heat_charging",
+             [(bt("p_ch"), 1.0), (bt("q_hp"), -eta_ch), (bt("q_boi"), -eta_ch)],
+             "=")
+    rows.add("dch", [(bt("p_dch"), 1.0)], "=", rhs["dch"].ravel())
+    rows.add("storage_init",
+             [(X["soc"][:, 0], 1.0),
+              (X["p_ch"][:, 0], -dt[0]),
+              (X["p_dch"][:, 0], dt[0])],
+             "=", rhs["storage_init"])
+    rows.add("storage_bal",
+             [(X["soc"][:, 1:].ravel(), 1.0),
+              (X["soc"][:, :-1].ravel(),
+               -(devs["eta_tes"][:, None] ** (dt[None, 1:] / DT)).ravel()),
+              (X["p_ch"][:, 1:].ravel(), -np.tile(dt[1:], n_buildings)),
+              (X["p_dch"][:, 1:].ravel(), np.tile(dt[1:], n_buildings))],
+             "=")
+
+    # Electricity balance (house)
+    rows.add("elec",
+             [(bt("p_imp"), 1.0), (bt("p_hp"), -1.0),
+              (bt("p_eh"), -1.0), (bt("p_use"), 1.0)],
+             "=", rhs["elec"].ravel())
+    rows.add("pv_split",
+             [(bt("p_sell"), 1.0), (bt("p_use"), 1.0), (bt("p_pv"), -1.0)],
+             "=")
+
+    # Residual loads of the neighborhood, summed over the buildings
+    rows.add("residual_demand",
+             [(X["residual_demand"], 1.0), (X["p_imp"].T, -1.0)],
+             "=")
+    rows.add("residual_feed_pv",
+             [(X["residual_feed_pv"], 1.0), (X["p_sell"].T, -1.0)],
+             "=")
+    rows.add("demand_gas_total",
+             [(X["gas_dom"], 1.0), (X["gas_boi"].T, -1.0)],
+             "=")
+
+    # Totals over the horizon
+    rows.add("from_grid_total_gas",
+             [(X["from_grid_total_gas"][None], 1.0),
+              (X["gas_from_grid"][None, :], -dt[None, :])],
+             "=")
+    rows.add("from_grid_total_el",
+             [(X["from_grid_total_el"][None], 1.0),
+              (X["from_grid"][None, :], -dt[None, :])],
+             "=")
+    rows.add("to_grid_total_el",
+             [(X["to_grid_total_el"][None], 1.0),
+              (X["to_grid"][None, :], -dt[None, :])],
+             "=")
+
+    return CentralMILP(c=c,
+                       A=rows.matrix(n_cols),
+                       sense=np.concatenate(rows.sense),
+                       rhs=np.concatenate(rows.rhs),
+                       lb=lb,
+                       ub=ub,
+                       vtype=vtype,
+                       columns=X,
+                       rows=rows.blocks,
+                       building_ids=building_ids,
+                       n_horizon=n_horizon,
+                       durations=dt)
+
+
+def to_gurobi(milp: CentralMILP,
+              env=None):
+    """
+    Create a gurobi model from the matrix form.
+
+    Returns:
+        tuple of the model, the MVar of all columns and the MConstr of all
+        rows
+    """
+    model = gp.Model("Design computation", env=env)
+    lb = np.where(np.isinf(milp.lb), -gp.GRB.INFINITY, milp.lb)
+    ub = np.where(np.isinf(milp.ub), gp.GRB.INFINITY, milp.ub)
+    x = model.addMVar(milp.n_cols, lb=lb, ub=ub, obj=milp.c, vtype=milp.vtype)
+    constrs = model.addMConstr(milp.A, x, milp.sense, milp.rhs)
+    model.ModelSense = gp.GRB.MINIMIZE
+    model.update()
+    return model, x, constrs
+
+
+def build_matrix_model(demands_and_pv,
+                       buildings,
+                       n_horizon,
+                       param_mpc,
+                       init_val,
+                       env=None):
+    """
+    Counterpart of formulation.build_central_model in matrix form.
+
+    Returns:
+        tuple of the gurobi model and a dict with the assembled CentralMILP,
+        the MVar of all columns and the parameter dependent constraints
+    """
+    milp = assemble_central_milp(demands_and_pv=demands_and_pv,
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=init_val)
+    model, x, constrs = to_gurobi(milp, env=env)
+    constr_list = constrs.tolist()
+    var_list = x.tolist()
+    handles = {
+        "milp": milp,
+        "x": x,
+        "vars": var_list,
+        "columns": milp.columns,
+        "building_ids": milp.building_ids,
+        "param_constrs": {name: [constr_list[i] for i in milp.rows[name]]
+                          for name in PARAMETER_CONSTRS},
+        "cop_constrs": [constr_list[i] for i in milp.rows["power_equation_hp"]],
+    }
+    return model, handles
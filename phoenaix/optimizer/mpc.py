@@ -1,9 +1,8 @@
 import sys
+from collections import deque
 from pathlib import Path
-from datetime import datetime
 import numpy as np
 import threading
-import paho.mqtt.client as mqtt
 import time
 import traceback
 from requests.exceptions import HTTPError
@@ -11,37 +10,194 @@ from phoenaix.utils.setup_logger import setup_logger
 from phoenaix.data_models import Device, Attribute
 from phoenaix.settings import settings
 from phoenaix.config import ROOT_DIR
+from phoenaix.optimizer.formulation import \
+    set_solver_params, \
+    is_infeasible
+from phoenaix.optimizer.persistent_model import \
+    PersistentCentralModel, \
+    BUILDERS
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central_with_status
+from phoenaix.optimizer.batch import solve_batch
+from phoenaix.optimizer.buildings import BuildingTable
+from phoenaix.optimizer.decomposition import DecomposedCentralModel
+from phoenaix.optimizer.deadline import \
+    Deadline, \
+    optimize_with_deadline
+from phoenaix.optimizer.diagnostics import submit_iis
+from phoenaix.optimizer.elastic import solve_elastic
+from phoenaix.optimizer.env_pool import shared_pool
+from phoenaix.optimizer.explicit_policy import ExplicitPolicy
+from phoenaix.optimizer.forecast_barrier import ForecastBarrier
+from phoenaix.optimizer.hierarchical import HierarchicalPlanner
+from phoenaix.optimizer.plan_cache import PlanCache
+from phoenaix.optimizer.results import \
+    INFEASIBLE, \
+    NO_SOLUTION, \
+    gurobi_status, \
+    retrieve_results
+from phoenaix.optimizer.rule_based import RuleBasedController
+from phoenaix.optimizer.solution_cache import SolutionCache
+from phoenaix.optimizer.time_grid import TimeGrid
 import pandas as pd
 import json
 import os
-import gurobipy as gp
+
+# Modes of the rule-based controller, see MPC
+RULE_BASED_MODES = (None, "primary", "fallback")
 
 
 class MPC(Device):
     def __init__(self,
                  offline_modus: bool = False,
+                 persistent_model: bool = True,
+                 builder: str = "matrix",
+                 reduce_model: bool = False,
+                 solver: str = "gurobi",
+                 deadline_aware: bool = True,
+                 reuse_plans: bool = True,
+                 elastic_retry: bool = True,
+                 decompose: bool = False,
+                 n_workers: int = None,
+                 time_grid: TimeGrid = None,
+                 cache_size: int = 0,
+                 policy: ExplicitPolicy = None,
+                 rule_based: str = None,
+                 short_horizon: int = None,
                  *args,
                  **kwargs):
         super().__init__(*args, **kwargs)
         self.offline_modus = offline_modus
 
         self.n_horizon = settings.N_HORIZON
+        # Coarser steps further ahead, see time_grid.py. The forecasts of
+        # N_HORIZON hours are averaged over its steps.
+        if time_grid is None and settings.TIME_GRID is not None:
+            time_grid = TimeGrid.from_blocks(settings.TIME_GRID)
+        if time_grid is not None:
+            if time_grid.n_values > settings.N_HORIZON:
+                raise ValueError(f'The time grid covers {time_grid.n_values} '
+                                 f'forecast values, only N_HORIZON = '
+                                 f'{settings.N_HORIZON} are available')
+            self.n_horizon = time_grid.n_steps
+        self.time_grid = time_grid
         self.buildings = self.load_buildings()
+        # buildings whose heat pump setpoints go to the simulation
+        self.fmu_building_ids = list(settings.FMU_BUILDING_IDS)
         self.mpc_params = self.load_mpc_params()
-
-        if not self.offline_modus:
-
-            self.mqtt_client = mqtt.Client()
-            self.mqtt_client.on_connect = self.on_connect
-            self.mqtt_client.on_message = self.on_message
-            self.mqtt_client.connect(host=settings.MQTT_HOST,
-                                     port=settings.MQTT_PORT)
-
-            self.mqtt_client2 = mqtt.Client()
-            self.mqtt_client2.on_connect = self.on_connect2
-            self.mqtt_client2.on_message = self.on_message2
-            self.mqtt_client2.connect(host=settings.MQTT_HOST,
-                                      port=settings.MQTT_PORT)
+        self.builder = builder
+        self.reduce_model = reduce_model
+        self.solver = solver
+        # Bound the solve by the remainder of the cycle, see deadline.py
+        self.deadline_aware = deadline_aware
+        # Latency from the start of predict until the results are set, of
+        # the last steps
+        self.latencies = deque(maxlen=1000)
+        self.deadline_misses = 0
+        # Setpoints from the last feasible plan if a solve fails or is late
+        # A plan shifted by one step only fits the grid of the next one
+        # within the leading hourly steps of a time grid
+        max_age = time_grid.n_fine if time_grid is not None else None
+        self.plan_cache = PlanCache(max_age=max_age) if reuse_plans else None
+        # Plans of repeated situations in long offline runs, keyed on the
+        # quantised inputs, see solution_cache.py. May be replaced by a
+        # cache shared between several MPCs.
+        self.solution_cache = SolutionCache(max_size=cache_size) \
+            if cache_size > 0 else None
+        # First-step setpoints from a lookup table of solved samples, the
+        # problem is only solved for inputs outside of its trained region,
+        # see explicit_policy.py
+        if policy is None and settings.EXPLICIT_POLICY is not None:
+            policy = ExplicitPolicy.load(settings.EXPLICIT_POLICY)
+        self.policy = policy
+        # Dispatch by fixed rules without a solver, see rule_based.py:
+        # 'primary' in every step, 'fallback' if the solve fails and no
+        # earlier plan is left, not at all if None
+        if rule_based is None:
+            rule_based = settings.RULE_BASED
+        if rule_based not in RULE_BASED_MODES:
+            raise ValueError(f'Unknown rule-based mode {rule_based}, '
+                             f'use one of {RULE_BASED_MODES}')
+        self.rule_based = rule_based
+        self.rule_based_controller = RuleBasedController(
+            buildings=self.buildings,
+            param_mpc=self.mpc_params) if rule_based is not None else None
+        self.n_rule_based = 0
+        # Retry infeasible problems with slacks on the storage balances and
+        # the demand coverage, see elastic.py. Solves that ran out of time
+        # are not retried.
+        self.elastic_retry = elastic_retry
+        self.n_elastic = 0
+        self._elastic_backend = None
+
+        # Gurobi solves of all MPCs in the process take their environment
+        # from one pool, which caps the concurrent solves and their threads
+        if solver == "gurobi":
+            self.env_pool = shared_pool(settings.MAX_CONCURRENT_SOLVES)
+            self._backend_kwargs = {"pool": self.env_pool}
+        else:
+            self.env_pool = None
+            self._backend_kwargs = {}
+
+        # Two-level MPC: the full horizon is planned on the time grid once a
+        # day and tracked by a problem of short_horizon hourly steps, see
+        # hierarchical.py
+        if short_horizon is None:
+            short_horizon = settings.SHORT_HORIZON
+        if short_horizon is not None and cache_size > 0:
+            raise ValueError('The solution cache does not know the state of '
+                             'the two-level MPC, use one of both')
+
+        # Reduced problems, other solvers than gurobi, time grids and the
+        # two-level MPC go through a solver backend on the matrix form
+        if reduce_model or solver != "gurobi" or time_grid is not None or \
+                short_horizon is not None:
+            self.backend = make_backend(solver, self.mpc_params,
+                                        **self._backend_kwargs)
+        else:
+            self.backend = None
+
+        if short_horizon is not None:
+            self.hierarchy = HierarchicalPlanner(
+                buildings=self.buildings,
+                param_mpc=self.mpc_params,
+                backend=self.backend,
+                day_grid=time_grid or TimeGrid.uniform(self.n_horizon),
+                n_short=short_horizon)
+            # the plans of the tracking problem are hourly
+            if self.plan_cache is not None:
+                self.plan_cache = PlanCache()
+        else:
+            self.hierarchy = None
+
+        # Large neighborhoods are solved as subproblems per building in a
+        # process pool, see decomposition.py
+        if decompose:
+            self.decomposition = DecomposedCentralModel(
+                buildings=self.buildings,
+                n_horizon=self.n_horizon,
+                param_mpc=self.mpc_params,
+                solver=solver,
+                n_workers=n_workers,
+                time_grid=time_grid)
+        else:
+            self.decomposition = None
+
+        # The structure of the central problem is the same in every step,
+        # so it is built once and only its right-hand sides are updated.
+        # Which columns the reduction removes depends on the forecasts, so
+        # a reduced model is built anew in every step.
+        if persistent_model and self.backend is None and not decompose:
+            self.central_model = PersistentCentralModel(
+                buildings=self.buildings,
+                n_horizon=self.n_horizon,
+                param_mpc=self.mpc_params,
+                builder=self.builder,
+                env=self.env_pool.new_env(),
+                pool=self.env_pool)
+        else:
+            self.central_model = None
 
         self.attr_translation = {
             'electricityDemand': 'elec',
@@ -54,71 +210,56 @@ class MPC(Device):
         self.topic = '/mpc'
         self.logger = setup_logger(name=kwargs['entity_id'])
 
+        if not self.offline_modus:
+            self.bus.subscribe(self.topic, self.on_message)
+            # only records the arrival, see forecast_barrier.py
+            self.bus.subscribe('/predicted', self.on_message2, inline=True)
+
         self.attributes = {}
-        for name in ['relativePower1',
-                     'relativePower2',
-                     'relativePower3',
-                     'SOCpred1',
-                     'SOCpred2',
-                     'SOCpred3']:
-            self.attributes[name] = Attribute(
-                device=self,
-                name=name,
-                initial_value=None
-            )
-
-        self.got_predictions = {
-            0: False,
-            1: False,
-            2: False,
-            3: False,
-            4: False
-        }
+        for building_id in self.fmu_building_ids:
+            for name in [f'relativePower{building_id}',
+                         f'SOCpred{building_id}']:
+                self.attributes[name] = Attribute(
+                    device=self,
+                    name=name,
+                    initial_value=None
+                )
+
+        # Wakes predict as soon as the last forecast arrived
+        self.forecast_barrier = ForecastBarrier(
+            building_ids=self.buildings,
+            deadline=settings.FORECAST_DEADLINE,
+            deadlines=settings.FORECAST_DEADLINES)
 
-        self.prediction_counter = {
-            0: 0,
-            1: 0,
-            2: 0,
-            3: 0,
-            4: 0
-        }
-        
         self.stop_event = kwargs.get("stop_event", None)
 
     @staticmethod
-    def load_buildings():
+    def load_buildings(building_ids: list = None):
+        """
+        Device parameters of the configured buildings from their rows in
+        Devs.xlsx.
+
+        Args:
+            building_ids: row indices in Devs.xlsx, settings.BUILDING_IDS by
+                default
+
+        Returns:
+            buildings.BuildingTable
+        """
         path = ROOT_DIR / 'data' / '01_input' / \
             '03_building_devs' / 'Devs.xlsx'
 
-        n_buildings = 5
-        building_params = pd.read_excel(path)
-        devs = {}
-        for n in range(n_buildings):
-            devs[n] = {}
-            # BOILER
-            devs[n]["boi"] = dict(cap=0.0, eta_th=0.97)
-            # HEATPUMP
-            # TODO: mod_lvl
-            devs[n]["hp"] = dict(cap=0.0, dT_max=15, exists=0, mod_lvl=1)
-            # ELECTRIC HEATER
-            devs[n]["eh"] = dict(cap=0.0)
-            # THERMAL ENERGY STORAGE
-            # TODO: k_loss
-            devs[n]["tes"] = dict(cap=0.0, dT_max=35, min_soc=0.0,
-                                  eta_tes=0.98, eta_ch=1, eta_dch=1)
-
-            # Wärmererzeuger und Wärmespeicher
-            if building_params["heater"][n] == "boi":
-                devs[n]["boi"]["cap"] = building_params["design_heat"][n]
-                devs[n]["eh"]["cap"] = building_params["design_dhw"][n]
-                devs[n]["tes"]["cap"] = building_params['design_tes'][n]
-
-            elif building_params["heater"][n] == "hp":
-                devs[n]["eh"]["cap"] = building_params["design_dhw"][n]
-                devs[n]["hp"]["cap"] = building_params["design_heat"][n]
-                devs[n]["tes"]["cap"] = building_params['design_tes'][n]
-
-        return devs
+        if building_ids is None:
+            building_ids = settings.BUILDING_IDS
+        building_params = pd.read_excel(path).loc[building_ids]
+
+        # TODO: mod_lvl of the heat pumps, k_loss of the storages
+        return BuildingTable.from_design(
+            ids=building_ids,
+            heater=building_params["heater"].to_numpy(),
+            design_heat=building_params["design_heat"].to_numpy(),
+            design_dhw=building_params["design_dhw"].to_numpy(),
+            design_tes=building_params["design_tes"].to_numpy())
 
     def load_mpc_params(self):
         # TODO put this into json
@@ -143,7 +284,7 @@ class MPC(Device):
 
     def get_input_dict_from_fiware(self):
         input_dict = {}
-        for building_ix in range(5):
+        for building_ix in self.buildings:
             entity_id = f'BuildingEnergyForecast:DEQ:MVP:{"{:03}".format(building_ix)}'
             attrs = self.cb_client.get_entity_attributes(entity_id=entity_id,
                                                          response_format='keyValues')
@@ -164,126 +305,55 @@ class MPC(Device):
         try:
             ent = self.cb_client.get_entity_attributes(entity_id='ModelicaAgent:DEQ:MVP:000',
                                                        response_format='keyValues')
-            soc_init = {'soc': {
-                0: {'tes': 0},
-                1: {'tes': ent['SOC1']},
-                2: {'tes': ent['SOC2']},
-                3: {'tes': ent['SOC3']},
-                4: {'tes': 0},
-            }}
+            socs = [ent.get(f'SOC{building_id}')
+                    for building_id in self.fmu_building_ids]
             self.logger.info('Got SOC init from fiware')
 
-            if any(i is None for i in [ent['SOC1'], ent['SOC2'], ent['SOC3']]):
+            if any(i is None for i in socs):
                 self.logger.info(
                     'None values in SOC init from fiware. Using default')
                 return None
 
-            if any(i is None for i in [ent['SOC1'], ent['SOC2'], ent['SOC3']]):
-                self.logger.info(
-                    'None values in SOC init from fiware. Using default')
-                return None
+            # Storages of buildings without a house model start empty
+            soc_init = {'soc': {building_id: {'tes': 0}
+                                for building_id in self.buildings}}
+            for building_id, soc in zip(self.fmu_building_ids, socs):
+                soc_init['soc'][building_id]['tes'] = soc
             return soc_init
         except HTTPError:
             self.logger.warning('Couldnt get SOC_init, using default')
             return None
 
-    def on_connect(self, client, userdata, flags, rc):
-        print(f"Connected {self.__class__.__name__} with result code "+str(rc))
-        # Subscribe to the /predict topic
-        client.subscribe(self.topic)
-
-    def on_connect2(self, client, userdata, flags, rc):
-        print(
-            f"Connected {self.__class__.__name__} 2 with result code "+str(rc))
-        # Subscribe to the /predict topic
-        client.subscribe('/predicted')
-
     def _publish(self, building_ix):
-        mqtt_client = mqtt.Client()
-        mqtt_client.connect(host=settings.MQTT_HOST,
-                            port=settings.MQTT_PORT)
-        mqtt_client.publish(f'/predict{building_ix}')
-        mqtt_client.disconnect()
+        self.bus.publish(f'/predict{building_ix}')
 
     def on_message(self, client, userdata, msg):
-        threads = []
-        for building_ix in range(5):
-            thread = threading.Thread(
-                target=self._publish, args=(building_ix,))
-            threads.append(thread)
-            thread.start()
-
-        for thread in threads:
-            thread.join()
+        self.forecast_barrier.start_cycle()
+        # all forecast requests go out at once over the shared connection
+        self.bus.publish_many((f'/predict{building_ix}', None)
+                              for building_ix in self.buildings)
 
         threading.Thread(target=self.predict).start()
 
     def on_message2(self, client, userdata, msg):
         data = json.loads(msg.payload)
-        building_id = data['building_id']
-        current_ix = data['current_ix']
-        self.got_predictions[building_id] = True
-        self.prediction_counter[building_id] = current_ix
-
-    def run_client1(self):
-        if self.stop_event is not None:
-            self.mqtt_client.loop_start()
-            while not self.stop_event.is_set():
-                time.sleep(1)
-            self.mqtt_client.loop_stop()
-
-        else:
-            self.mqtt_client.loop_forever()
-       # self.mqtt_client.loop_forever()
-
-    def run_client2(self):
-        if self.stop_event is not None:
-            self.mqtt_client2.loop_start()
-            while not self.stop_event.is_set():
-                time.sleep(1)
-            self.mqtt_client2.loop_stop()
-
-        else:
-            self.mqtt_client.loop_forever()
-        #self.mqtt_client2.loop_forever()
+        self.forecast_barrier.arrive(building_id=data['building_id'],
+                                     current_ix=data['current_ix'])
 
     def run(self):
-        threading.Thread(target=self.run_client1).start()
-        threading.Thread(target=self.run_client2).start()
-
-    def _got_predictions(self):
-
-        if np.all(list(self.got_predictions.values())):
-            return True
-        else:
-            return False
-
-    def _reset_predictions(self):
-        for key in self.got_predictions:
-            self.got_predictions[key] = False
+        self.bus.run(stop_event=self.stop_event)
 
     def _online_pre_predict_process(self):
-        log_waiting = True
-        start_time = time.perf_counter()
-        while not self._got_predictions():
-            time.sleep(0.5)
-            print(self.prediction_counter)
-            this_time = time.perf_counter()
-            if this_time - start_time > 5:
-                for key, val in self.got_predictions.items():
-                    if val:
-                        continue
-
-                    self.logger.info(f'Sending {key} again')
-                    threading.Thread(target=self._publish, args=(key,)).start()
-
-                start_time = this_time
-            if log_waiting:
-                self.logger.info('Waiting for all predictions...')
-            log_waiting = False
-
-        if not log_waiting:
-            self.logger.info('Got all predictions!')
+        self.logger.info('Waiting for all predictions...')
+        given_up = self.forecast_barrier.wait(request=self._publish)
+        if given_up:
+            self.logger.warning(f'Using the last forecasts of buildings '
+                                f'{given_up}')
+        else:
+            self.logger.info(
+                f'Got all predictions after '
+                f'{self.forecast_barrier.times_to_barrier[-1]:.2f} s, '
+                f'time steps {self.forecast_barrier.counter}')
 
         try:
             input_dict = self.get_input_dict_from_fiware()
@@ -296,8 +366,6 @@ class MPC(Device):
                 f"OperationalError occurred: {error_message}\nStack Trace:\n{stack_trace}")
             return
 
-        self._reset_predictions()
-
         soc_init = self.get_soc_init()
 
         return (input_dict,
@@ -307,48 +375,63 @@ class MPC(Device):
                 input_dict: dict = None,
                 soc_init: dict = None):
 
+        cycle_start = time.perf_counter()
         if not self.offline_modus:
             (input_dict,
              soc_init) = self._online_pre_predict_process()
 
-        res = self.run_central_optimization(
-            demands_and_pv=input_dict,
-            n_horizon=self.n_horizon,
-            param_mpc=self.mpc_params,
-            init_val=soc_init,
-            buildings=self.buildings,
-            silence=True
-        )
+        deadline = None
+        if self.deadline_aware:
+            deadline = Deadline.from_cycle(cycle_start=cycle_start,
+                                           cycle_time=settings.CYCLE_TIME)
+        res = None
+        if self.policy is not None:
+            res = self.policy.act(demands_and_pv=input_dict,
+                                  init_val=soc_init,
+                                  buildings=self.buildings)
+        if res is None and self.rule_based == "primary":
+            res = self._rule_based(input_dict=input_dict,
+                                   soc_init=soc_init)
+        if res is not None:
+            # only the first step is used, it is not kept as a plan
+            self._record_latency(cycle_start=cycle_start,
+                                 deadline=deadline,
+                                 res=res)
+        else:
+            try:
+                res = self.solve(input_dict=input_dict,
+                                 soc_init=soc_init,
+                                 deadline=deadline)
+            except Exception:
+                # e.g. no gurobi license for the size of the problem
+                if self.rule_based != "fallback":
+                    raise
+                self.logger.exception('MPC solve failed')
+            self._record_latency(cycle_start=cycle_start,
+                                 deadline=deadline,
+                                 res=res)
+            res = self._select_plan(res)
+            if res is None and self.rule_based == "fallback":
+                self.logger.warning('No MPC plan, using the rule-based '
+                                    'controller')
+                res = self._rule_based(input_dict=input_dict,
+                                       soc_init=soc_init)
 
         if res is None:
-            self.logger.error('MPC infeasible! Not pushing attributes.')
+            self.logger.error('No MPC plan! Not pushing attributes.')
             if self.offline_modus:
                 return None
-            self.mqtt_client.publish('/fmu')
-
-        res_power = res[1]
-        res_soc = res[3]
-
-        self.attributes['relativePower1'].value = res_power[1]['hp'][0] / \
-            settings.NORM_POWER
-        self.attributes['relativePower2'].value = res_power[2]['hp'][0] / \
-            settings.NORM_POWER
-        self.attributes['relativePower3'].value = res_power[3]['hp'][0] / \
-            settings.NORM_POWER
-        self.attributes['SOCpred1'].value = res_soc[1]['tes'][0]
-        self.attributes['SOCpred2'].value = res_soc[2]['tes'][0]
-        self.attributes['SOCpred3'].value = res_soc[3]['tes'][0]
+            self.bus.publish('/fmu')
+            return
 
         offline_dict = {}
-        offline_dict['relativePower1'] = res_power[1]['hp'][0] / \
-            settings.NORM_POWER
-        offline_dict['relativePower2'] = res_power[2]['hp'][0] / \
-            settings.NORM_POWER
-        offline_dict['relativePower3'] = res_power[3]['hp'][0] / \
-            settings.NORM_POWER
-        offline_dict['SOCpred1'] = res_soc[1]['tes'][0]
-        offline_dict['SOCpred2'] = res_soc[2]['tes'][0]
-        offline_dict['SOCpred3'] = res_soc[3]['tes'][0]
+        for building_ix in self.fmu_building_ids:
+            offline_dict[f'relativePower{building_ix}'] = \
+                res.hp_power(building_ix) / settings.NORM_POWER
+            offline_dict[f'SOCpred{building_ix}'] = res.tes_soc(building_ix)
+
+        for name, value in offline_dict.items():
+            self.attributes[name].value = value
 
         if self.offline_modus:
             return offline_dict
@@ -358,7 +441,230 @@ class MPC(Device):
 
         self.logger.info('Pushed all attributes')
 
-        self.mqtt_client.publish('/fmu')
+        self.bus.publish('/fmu')
+
+    def _select_plan(self, res):
+        """
+        Cache a new feasible plan and return it, or return the cached plan
+        shifted to the current step if the solve failed or missed its
+        deadline.
+        """
+        if self.plan_cache is None:
+            return res
+        late = res is not None and not res.info.get("deadline_met", True)
+        if res is not None and not late:
+            self.plan_cache.store(res)
+            return res
+
+        plan = self.plan_cache.fallback()
+        # A late plan is still the newest one for the next steps
+        if res is not None:
+            self.plan_cache.store(res)
+        if plan is None:
+            return res
+
+        self.logger.warning(f'Using the plan of {plan.info["plan_age"]} '
+                            f'steps ago, reuse counters '
+                            f'{self.plan_cache.stats()}')
+        return plan
+
+    def _rule_based(self, input_dict, soc_init):
+        self.n_rule_based += 1
+        return self.rule_based_controller.act(demands_and_pv=input_dict,
+                                              init_val=soc_init)
+
+    def _record_latency(self, cycle_start, deadline, res):
+        latency = time.perf_counter() - cycle_start
+        self.latencies.append(latency)
+        if deadline is not None and deadline.remaining() < 0:
+            self.deadline_misses += 1
+            self.logger.warning(f'Missed the deadline by '
+                                f'{-deadline.remaining():.2f} s')
+        if res is not None:
+            self.logger.info(f'MPC step took {1e3 * latency:.0f} ms, status '
+                             f'{res.status}, MIP gap {res.mip_gap}')
+
+    def latency_summary(self):
+        """Mean, 99th percentile and maximum latency of the last steps"""
+        if not self.latencies:
+            return {}
+        latencies = np.array(self.latencies)
+        return {"mean": latencies.mean(),
+                "p99": np.percentile(latencies, 99),
+                "max": latencies.max(),
+                "steps": len(latencies),
+                "deadline_misses": self.deadline_misses,
+                "solver_pool": self.env_pool.stats()
+                if self.env_pool is not None else {},
+                "forecast_barrier": self.forecast_barrier.stats(),
+                "policy": self.policy.stats()
+                if self.policy is not None else {},
+                "rule_based": {**self.rule_based_controller.stats(),
+                               "steps": self.n_rule_based}
+                if self.rule_based_controller is not None else {}}
+
+    def solve_batch(self,
+                    inputs: list,
+                    init_vals: list = None,
+                    n_workers: int = None):
+        """
+        Solve independent horizons in parallel, e.g. for an open-loop
+        evaluation on precomputed forecasts, see batch.solve_batch.
+
+        Args:
+            inputs: forecasts of every horizon in the input format of predict
+            init_vals: initial SOCs of every horizon, default SOCs if None
+            n_workers: number of worker processes, all cores by default
+
+        Returns:
+            batch.BatchResult
+        """
+        batch = solve_batch(inputs=inputs,
+                            init_vals=init_vals,
+                            buildings=self.buildings,
+                            n_horizon=self.n_horizon,
+                            param_mpc=self.mpc_params,
+                            solver=self.solver,
+                            reduce_model=self.reduce_model,
+                            n_workers=n_workers,
+                            time_grid=self.time_grid)
+        self.logger.info(f'Solved {len(batch)} horizons with '
+                         f'{batch.n_workers} workers, '
+                         f'{batch.throughput:.1f} horizons/s')
+        return batch
+
+    def solve(self,
+              input_dict: dict,
+              soc_init: dict = None,
+              deadline: Deadline = None):
+        """
+        Solve the central problem with the configured model.
+
+        Args:
+            deadline: stop at the best incumbent by this deadline, its
+                budget and whether it was met are returned in
+                MPCResult.info
+
+        Returns:
+            MPCResult or None if the problem is infeasible or no solution
+            was found in time
+        """
+        res = None
+        status = None
+        if self.solution_cache is not None:
+            key = self.solution_cache.key(
+                demands_and_pv=input_dict,
+                init_val=soc_init,
+                buildings=self.buildings,
+                param_mpc=self.mpc_params,
+                time_grid=self.time_grid or TimeGrid.uniform(self.n_horizon))
+            res = self.solution_cache.get(key)
+        if res is None:
+            res, status = self._solve(input_dict=input_dict,
+                                      soc_init=soc_init,
+                                      deadline=deadline)
+            if self.solution_cache is not None:
+                self.solution_cache.store(key, res)
+        if res is None and status == INFEASIBLE:
+            if self.elastic_retry:
+                res = self._solve_elastic(input_dict=input_dict,
+                                          soc_init=soc_init,
+                                          deadline=deadline)
+        elif res is None:
+            # out of time, a larger problem would not be solved in time
+            # either, the plan cache and the rule-based controller take over
+            self.logger.warning(f'No MPC solution, status {status}')
+        if res is not None and deadline is not None:
+            res.info.update(deadline.report())
+        return res
+
+    def _solve_elastic(self, input_dict, soc_init, deadline):
+        if self._elastic_backend is None:
+            self._elastic_backend = self.backend or \
+                make_backend(self.solver, self.mpc_params,
+                             **self._backend_kwargs)
+        res = solve_elastic(demands_and_pv=input_dict,
+                            buildings=self.buildings,
+                            n_horizon=self.n_horizon,
+                            param_mpc=self.mpc_params,
+                            init_val=soc_init,
+                            backend=self._elastic_backend,
+                            deadline=deadline,
+                            time_grid=self.time_grid)
+        self.n_elastic += 1
+        if res is not None:
+            self.logger.warning(f'MPC infeasible, using the elastic problem '
+                                f'with a total slack of {res.info["slack"]:.1f}')
+        return res
+
+    def _solve(self, input_dict, soc_init, deadline):
+        """
+        Returns:
+            MPCResult or None, and the status of the solve, see results.py
+        """
+        if self.hierarchy is not None:
+            res = self.hierarchy.solve(demands_and_pv=input_dict,
+                                       init_val=soc_init,
+                                       deadline=deadline)
+            if res is not None and res.info["replanned"] is not None:
+                self.logger.info(f'Renewed the day plan '
+                                 f'({res.info["replanned"]}), '
+                                 f'{self.hierarchy.stats()}')
+            return res, self.hierarchy.status
+
+        if self.decomposition is not None:
+            res = self.decomposition.solve(demands_and_pv=input_dict,
+                                           init_val=soc_init,
+                                           deadline=deadline)
+            if res is not None:
+                metrics = res.info["decomposition"]
+                self.logger.debug(
+                    f'Decomposition took {metrics["iterations"]} iterations '
+                    f'in {metrics["wall_time"]:.2f} s, converged '
+                    f'{metrics["converged"]}')
+            return res, self.decomposition.status
+
+        if self.backend is not None:
+            res, status = solve_central_with_status(
+                demands_and_pv=input_dict,
+                buildings=self.buildings,
+                n_horizon=self.n_horizon,
+                param_mpc=self.mpc_params,
+                init_val=soc_init,
+                backend=self.backend,
+                reduce_model=self.reduce_model,
+                deadline=deadline,
+                time_grid=self.time_grid)
+            if res is not None and self.reduce_model:
+                self.logger.debug(
+                    f'Reduction removed {res.info["rows_removed"]} of '
+                    f'{res.info["rows"]} rows and {res.info["cols_removed"]} '
+                    f'of {res.info["cols"]} columns, skipped buildings '
+                    f'{res.info["skipped_buildings"]}')
+            return res, status
+
+        if self.central_model is not None:
+            res = self.central_model.solve(demands_and_pv=input_dict,
+                                           init_val=soc_init,
+                                           deadline=deadline)
+            return res, self.central_model.status
+
+        try:
+            with self.env_pool.acquire(deadline) as env:
+                return self.run_central_optimization(
+                    demands_and_pv=input_dict,
+                    n_horizon=self.n_horizon,
+                    param_mpc=self.mpc_params,
+                    init_val=soc_init,
+                    buildings=self.buildings,
+                    silence=True,
+                    builder=self.builder,
+                    deadline=deadline,
+                    env=env,
+                    return_status=True)
+        except TimeoutError as e:
+            self.logger.warning(f'Solve skipped: {e}')
+            return None, NO_SOLUTION
 
     def run_central_optimization(self,
                                  demands_and_pv,
@@ -366,25 +672,51 @@ class MPC(Device):
                                  n_horizon,
                                  param_mpc,
                                  init_val,
-                                 silence=False):
+                                 silence=False,
+                                 builder="dict",
+                                 deadline=None,
+                                 env=None,
+                                 return_status=False):
+        """
+        Build and solve the central problem in a new model.
+
+        Args:
+            return_status: also return the status of the solve, see
+                results.py
+
+        Returns:
+            MPCResult or None without a solution, and the status if
+            return_status
+        """
         if not silence:
-            return self._run_central_optimization(demands_and_pv=demands_and_pv,
-                                                  buildings=buildings,
-                                                  n_horizon=n_horizon,
-                                                  param_mpc=param_mpc,
-                                                  init_val=init_val)
-        original_stdout = sys.stdout
-        try:
-            sys.stdout = open(os.devnull, 'w')
-            res = self._run_central_optimization(demands_and_pv=demands_and_pv,
-                                                 buildings=buildings,
-                                                 n_horizon=n_horizon,
-                                                 param_mpc=param_mpc,
-                                                 init_val=init_val)
-        finally:
-            sys.stdout.close()
-            sys.stdout = original_stdout
-
+            res, status = self._run_central_optimization(
+                demands_and_pv=demands_and_pv,
+                buildings=buildings,
+                n_horizon=n_horizon,
+                param_mpc=param_mpc,
+                init_val=init_val,
+                builder=builder,
+                deadline=deadline,
+                env=env)
+        else:
+            original_stdout = sys.stdout
+            try:
+                sys.stdout = open(os.devnull, 'w')
+                res, status = self._run_central_optimization(
+                    demands_and_pv=demands_and_pv,
+                    buildings=buildings,
+                    n_horizon=n_horizon,
+                    param_mpc=param_mpc,
+                    init_val=init_val,
+                    builder=builder,
+                    deadline=deadline,
+                    env=env)
+            finally:
+                sys.stdout.close()
+                sys.stdout = original_stdout
+
+        if return_status:
+            return res, status
         return res
 
     @staticmethod
@@ -392,492 +724,38 @@ class MPC(Device):
                                   buildings,
                                   n_horizon,
                                   param_mpc,
-                                  init_val):
-        # Define subsets
-        heater = ("boi", "eh", "hp")
-        storage = ("tes",)
-        solar = ("pv",)
-        device = heater + storage + solar
-
-        model = gp.Model("Design computation")
-
-        N_HORIZON = n_horizon
-        DT = 1  # in hours
-        time_steps = range(N_HORIZON)
-
-        # Initialization: only if initial values have been generated in previous prediction horizon
-        soc_init_rh = {}
-        if init_val is not None:
-            # initial SOCs
-            # Buildings
-            for n in buildings:
-                soc_init_rh[n] = {}
-                for dev in storage:
-                    soc_init_rh[n][dev] = init_val["soc"][n][dev]
-
-        # Define variables
-        # Costs and Revenues
-        c_dem = {dev: model.addVar(vtype="C", name="c_dem_" + dev)
-                 for dev in ("gas", "grid")}
-
-        revenue = {"grid_pv": model.addVar(vtype="C", name="revenue_" + "grid_pv")
-                   }
-
-        # SOC, charging, discharging, power and heat
-        soc = {}
-        p_ch = {}
-        p_dch = {}
-        power = {}
-        heat = {}
-        for n in buildings:
-            soc[n] = {}
-            p_ch[n] = {}
-            p_dch[n] = {}
-            for dev in storage:  # All storage devices
-                soc[n][dev] = {}
-                p_ch[n][dev] = {}
-                p_dch[n][dev] = {}
-                for t in time_steps:  # All time steps of all days
-                    soc[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="SOC_" + dev + "_" + str(t))
-                    p_ch[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="P_ch_" + dev + "_" + str(t))
-                    p_dch[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="P_dch_" + dev + "_" + str(t))
-
-        for n in buildings:
-            power[n] = {}
-            heat[n] = {}
-            for dev in ["hp", "boi"]:
-                power[n][dev] = {}
-                heat[n][dev] = {}
-                for t in time_steps:
-                    power[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="P_" + dev + "_" + str(t))
-                    heat[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="Q_" + dev + "_" + str(t))
-
-        cop = {}
-        for n in buildings:
-            cop[n] = {}
-            for dev in ["hp"]:
-                cop[n][dev] = {}
-                for t in time_steps:
-                    cop[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="CoP_" + dev + "_" + str(t))
-
-        for n in buildings:
-            for dev in ["eh"]:
-                power[n][dev] = {}
-                for t in time_steps:
-                    power[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="P_" + dev + "_" + str(t))
-
-        for n in buildings:
-            for dev in ["pv"]:
-                power[n][dev] = {}
-                for t in time_steps:
-                    power[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="P_" + dev + "_" + str(t))
-
-        # mapping storage sizes
-        soc_nom = {}
-        for n in buildings:
-            soc_nom[n] = {}
-            for dev in storage:
-                soc_nom[n][dev] = buildings[n][dev]["cap"]
-        # Storage initial SOC's
-        soc_init = {}
-        for n in buildings:
-            soc_init[n] = {}
-            soc_init[n]["tes"] = soc_nom[n]["tes"] * \
-                0.5  # kWh   Initial SOC TES
-
-        # storage devices: soc_end = soc_init
-        # boolSOC = True
-        # if boolSOC:
-        #    if par_rh["end_time_org"] in par_rh["org_time_steps"][n_opt]:
-        #        index_end = par_rh["org_time_steps"][n_opt].index(par_rh["end_time_org"])
-        #        time_step_end = par_rh["time_steps"][n_opt][index_end]
-
-        #        for n in nodes:
-        #            for dev in storage:
-        #                model.addConstr(soc[n][dev][time_step_end] == soc_init[n][dev],
-        #                                name = "soc_end == soc_init for " + str(dev) + " in BES: " +str(n) + " for n_opt: " + str(n_opt))
-
-        # Electricity imports, sold and self-used electricity
-        p_imp = {}
-        p_use = {}
-        p_sell = {}
-        y_imp = {}
-        for n in buildings:
-            p_imp[n] = {}
-            y_imp[n] = {}
-            p_use[n] = {}
-            p_sell[n] = {}
-            for t in time_steps:
-                p_imp[n][t] = model.addVar(
-                    vtype="C", lb=0, name="P_imp_" + str(t))
-                y_imp[n][t] = model.addVar(
-                    vtype="B", lb=0.0, ub=1.0, name="y_imp_exp_" + str(t))
-            for dev in ["pv"]:
-
-                p_use[n][dev] = {}
-                p_sell[n][dev] = {}
-                for t in time_steps:
-                    p_use[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="P_use_" + dev + "_" + str(t))
-                    p_sell[n][dev][t] = model.addVar(vtype="C", lb=0,
-                                                     name="P_sell_" + dev + "_" + str(t))
-
-        # Gas imports to devices
-        gas = {}
-        for n in buildings:
-            gas[n] = {}
-            for dev in ["boi"]:
-
-                gas[n][dev] = {}
-                for t in time_steps:
-                    gas[n][dev][t] = model.addVar(
-                        vtype="C", lb=0, name="gas" + dev + "_" + str(t))
-
-        # activation variable for trafo load
-        yTrafo = model.addVars(time_steps, vtype="B", name="yTrafo_" + str(t))
-
-        #  BALANCING UNIT VARIABLES
-
-        # Residual network demand
-        residual = {}
-        residual["demand"] = {}  # Residual network electricity demand
-        residual["feed_pv"] = {}  # Residual feed in pv
-        power["from_grid"] = {}
-        power["to_grid"] = {}
-        gas_dom = {}
-
-        for t in time_steps:
-            residual["demand"][t] = model.addVar(
-                vtype="C", lb=0, name="residual_demand_t" + str(t))
-            residual["feed_pv"][t] = model.addVar(
-                vtype="C", lb=0, name="residual_feed_pv_t" + str(t))
-            power["from_grid"][t] = model.addVar(
-                vtype="C", lb=0, name="district_demand_t" + str(t))
-            power["to_grid"][t] = model.addVar(
-                vtype="C", lb=0, name="district_feed_t" + str(t))
-            gas_dom[t] = model.addVar(
-                vtype="C", lb=0, name="gas_demand_t" + str(t))
-
-        # Electrical power to/from devices
-        for device in ["el_from_grid", "el_to_grid", "gas_from_grid"]:
-            power[device] = {}
-            for t in time_steps:
-                power[device][t] = model.addVar(
-                    vtype="C", lb=0, name="power_" + device + "_t" + str(t))
-
-        # total energy amounts taken from grid
-        from_grid_total_el = model.addVar(
-            vtype="C", lb=0, name="from_grid_total_el")
-        # total power to grid
-        to_grid_total_el = model.addVar(
-            vtype="C", lb=0, name="to_grid_total_el")
-        # total gas amounts taken from grid
-        from_grid_total_gas = model.addVar(
-            vtype="C", lb=0, name="from_grid_total_gas")
-
-        network_load = model.addVar(
-            vtype="c", lb=-gp.GRB.INFINITY, name="peak_network_load")
-
-        # Update
-        model.update()
-
-        # Objective
-        # TODO:
-        model.setObjective(c_dem["grid"] + c_dem["gas"] - revenue["grid_pv"]
-                           + network_load * 0.01, gp.GRB.MINIMIZE)
-
-        # Network load
-        model.addConstrs(
-            network_load >= power["from_grid"][t] for t in time_steps)
-
-        m_cons = 50_000_000
-        for n in buildings:
-            for t in time_steps:
-                model.addConstr(y_imp[n][t] * m_cons >= p_imp[n]
-                                [t], name="Max_el_imp_" + str(t))
-                # model.addConstr((1 - y_imp[n][t]) * 1000 >= p_sell[n]["pv"][t] + p_sell[n]["CHP"][t],
-                #                 name="Max_el_exp_" + str(t))
-                model.addConstr((1 - y_imp[n][t]) * m_cons >= p_sell[n]["pv"][t],
-                                name="Max_el_exp_" + str(t))
-
-        # Define constraints
-
-        # Economic constraints
-
-        # Demand related costs (gas)
-        model.addConstr(
-            c_dem["gas"] == param_mpc["eco"]["gas"] *
-            sum(DT * gas_dom[t] for t in time_steps),
-            name="Demand_costs_gas")
-        # Demand related costs (electricity)
-        model.addConstr(
-            c_dem["grid"] == param_mpc["eco"]["el_grid"] * sum(
-                DT * residual["demand"][t] for t in time_steps),
-            name="Demand_costs_el_grid")
-        # Revenues for selling electricity to the grid / neighborhood
-        model.addConstr(
-            revenue["grid_pv"] == param_mpc["eco"]["sell_pv"] * sum(
-                DT * residual["feed_pv"][t] for t in time_steps),
-            name="Feed_in_rev_pv")
-
-        # Technical constraints
-
-        # Determine nominal heat at every timestep
-        for n in buildings:
-            for t in time_steps:
-                for dev in ["hp", "boi", "eh"]:
-                    # for dev in ["hp35", "hp55", "chp", "boi", "eh"]:
-
-                    if dev == "eh":
-                        model.addConstr(power[n][dev][t] <=
-                                        buildings[n][dev]["cap"])
-                    else:
-                        model.addConstr(heat[n][dev][t] <= buildings[n][dev]["cap"],
-                                        name="Max_heat_operation_" + dev)
-
-        # Devices operation
-        # Heat output between mod_lvl*Q_nom and Q_nom (P_nom for heat pumps)
-        # Power and Energy directly result from Heat output
-        for n in buildings:
-            for t in time_steps:
-                # Heatpumps
-                dev = "hp"
-                model.addConstr(heat[n][dev][t] == power[n][dev][t] * cop[n][dev][t],
-                                name="Power_equation_" + dev + "_" + str(t))
-
-                # model.addConstr(cop[n][dev][t] == 0.4 * (273.15 + 35) / (35 - T_air[t]),
-                #                 name="CoP_equation_" + dev + "_" + str(t))
-                model.addConstr(cop[n][dev][t] == 0.4 * (273.15 + 35) / (35 - 5),
-                                name="CoP_equation_" + dev + "_" + str(t))
-
-                # BOILER
-                dev = "boi"
-                model.addConstr(
-                    heat[n]["boi"][t] == buildings[n]["boi"]["eta_th"] *
-                    gas[n]["boi"][t],
-                    name="Power_equation_" + dev + "_" + str(t))
-
-        # # Solar components
-        for n in buildings:
-            for dev in solar:
-                for t in time_steps:
-                    model.addConstr(power[n][dev][t] == demands_and_pv["pv_power"][n][t],
-                                    name="Solar_electrical_" + dev + "_" + str(t))
-
-        # power of the electric heater
-        for n in buildings:
-            # eletric heater covers 50% of the dhw
-            for t in time_steps:
-                if buildings[n]["eh"]["cap"] == 0.0:
-                    model.addConstr(power[n]["eh"][t] == 0,
-                                    name="El_heater_act_" + str(t))
-                else:
-                    model.addConstr(power[n]["eh"][t] == 0.5 * demands_and_pv["dhw"][n][t],
-                                    name="El_heater_act_" + str(t))
-
-        #  BUILDING STORAGES # %% DOMESTIC FLEXIBILITIES
-
-        # TES CONSTRAINTS CONSTRAINTS
-        dev = "tes"
-        for n in buildings:
-            eta_tes = buildings[n][dev]["eta_tes"]
-            eta_ch = buildings[n][dev]["eta_ch"]
-            eta_dch = buildings[n][dev]["eta_dch"]
-
-            for t in time_steps:
-                # Initial SOC is the SOC at the beginning of the first time step, thus it equals the SOC at the end of the previous time step
-                if t == 0:
-                    try:
-                        soc_prev = soc_init_rh[n][dev]
-                    except KeyError:
-                        soc_prev = soc_init[n][dev]
-                else:
-                    soc_prev = soc[n][dev][t - 1]
-
-                # Maximal charging
-                model.addConstr(p_ch[n][dev][t] == eta_ch * (heat[n]["hp"][t] + heat[n]["boi"][t]),
-                                name="Heat_charging_" + str(t))
-                # Maximal discharging
-                if buildings[n]["eh"]["cap"] == 0.0:
-                    model.addConstr(p_dch[n][dev][t] == (1 / eta_dch) * (
-                        demands_and_pv["heating"][n][t] + demands_and_pv["dhw"][n][t]),
-                        name="Heat_discharging_" + str(t))
-                else:
-                    model.addConstr(p_dch[n][dev][t] == (1 / eta_dch) * (
-                        demands_and_pv["heating"][n][t] + 0.5 * demands_and_pv["dhw"][n][t]),
-                        name="Heat_discharging_" + str(t))
-
-                # Minimal and maximal soc
-                # model.addConstr(soc[n]["TES"][t] <= soc_nom[n]["TES"], name="max_cap_tes_" + str(t))
-                # model.addConstr(soc[n]["TES"][t] >= nodes[n]["buildings"]["TES"]["min_soc"] * soc_nom[n]["TES"],
-                #                name="min_cap_" + str(t))
-
-                # SOC coupled over all times steps (Energy amount balance, kWh)
-                model.addConstr(
-                    soc[n][dev][t] == soc_prev * eta_tes + DT *
-                    (p_ch[n][dev][t] - p_dch[n][dev][t]),
-                    name="Storage_bal_" + dev + "_" + str(t))
-
-            # TODO: soc at the end is the same like at the beginning
-            # if t == last_time_step:
-            #    model.addConstr(soc[device][t] == soc_init[device],
-            #                    name="End_TES_Storage_" + str(t))
-
-        # Electricity balance (house)
-        for n in buildings:
-            for t in time_steps:
-                model.addConstr(demands_and_pv["elec"][n][t]
-                                + power[n]["hp"][t] + power[n]["eh"][t]
-                                - p_use[n]["pv"][t]
-                                == p_imp[n][t],
-                                name="Electricity_balance_" + str(t))
-
-        # Split CHP and PV generation into self-consumed and sold powers
-        # TODO: Following constrains commented to make model feasible
-        for n in buildings:
-            for dev in ("pv",):
-                for t in time_steps:
-                    model.addConstr(p_sell[n][dev][t] + p_use[n][dev][t] == power[n][dev][t],
-                                    name="power=sell+use_" + dev + "_" + str(t))
-
-        # energy balance neighborhood
-
-        # Residual loads
-        for t in time_steps:
-            # Residual network electricity demand (Power balance, MW)
-            model.addConstr(residual["demand"][t] == sum(
-                p_imp[n][t] for n in buildings))
-            model.addConstr(residual["feed_pv"][t] == sum(
-                p_sell[n]["pv"][t] for n in buildings))
-            # Gas balance (power)
-            model.addConstr(gas_dom[t] == sum(gas[n]["boi"][t] for n in buildings),
-                            name="Demand_gas_total")
-
-        # Total gas amounts taken from grid (Energy amounts, MWh)
-        model.addConstr(
-            from_grid_total_gas == sum(DT * power["gas_from_grid"][t] for t in time_steps))
-        # Total electricity amounts taken from grid (Energy amounts, MWh)
-        model.addConstr(from_grid_total_el == sum(
-            DT * power["from_grid"][t] for t in time_steps))
-        # Total electricity feed-in (Energy amounts, MWh)
-        model.addConstr(to_grid_total_el == sum(
-            DT * power["to_grid"][t] for t in time_steps))
-
-        # Set solver parameters
-        model.Params.TimeLimit = param_mpc["gp"]["time_limit"]
-        model.Params.MIPGap = param_mpc["gp"]["mip_gap"]
-        model.Params.MIPFocus = param_mpc["gp"]["numeric_focus"]
-
-        # Execute calculation
-        model.optimize()
-        if model.status == gp.GRB.Status.INFEASIBLE or model.status == gp.GRB.Status.INF_OR_UNBD:
-            now = datetime.now()
-            folder_name = now.strftime("error_%Y_%m_%d_%H_%M_%S")
-            folder_path = Path(__file__).parents[0] / 'errors' / folder_name
-            folder_path.mkdir(exist_ok=True, parents=True)
-
-            IISconstr = []
-            model.computeIIS()
-
-            with open(folder_path / 'errorfile_hp.txt', 'w') as f:
-                f.write('\nThe following constraint(s) cannot be satisfied:\n')
-                for c in model.getConstrs():
-                    if c.IISConstr:
-                        print(c.constrName)
-                        f.write('%s' % c.constrName)
-                        f.write('\n')
-                        IISconstr.append(c.constrName)
-
-            # model.write("model_solution.sol")  # Writes the solution to a file
-            model_path = folder_path / 'model.ilp'
-            model.write(str(model_path))
-            return None
-        model.update()
-
-        # Retrieve results
-        t = 0
-        res_y = {}
-        res_power = {}
-        res_heat = {}
-        res_soc = {}
-        res_p_ch = {}
-        res_p_dch = {}
-        res_p_imp = {}
-        res_gas = {}
-        res_c_dem = {}
-        res_soc_nom = {}
-        res_p_use = {}
-        res_p_sell = {}
-        res_rev = {}
-        for n in buildings:
-            res_y[n] = {}
-            res_power[n] = {}
-            res_heat[n] = {}
-            res_soc[n] = {}
-            res_p_ch[n] = {}
-            res_p_dch[n] = {}
-            res_p_imp[n] = {}
-            res_gas[n] = {}
-            res_c_dem[n] = {}
-            res_soc_nom[n] = {}
-            res_p_use[n] = {}
-            res_p_sell[n] = {}
-            res_rev[n] = {}
-
-            # for dev in ["BAT", "EV", "house_load"]:
-            res_y[n] = [y_imp[n][t].X for t in time_steps]
-            for dev in ["hp", "boi"]:
-                res_power[n][dev] = [power[n][dev][t].X for t in time_steps]
-                res_heat[n][dev] = [heat[n][dev][t].X for t in time_steps]
-            for dev in ["pv"]:
-                res_power[n][dev] = [power[n][dev][t].X for t in time_steps]
-            for dev in storage:
-                res_soc[n][dev] = [soc[n][dev][t].X for t in time_steps]
-            for dev in storage:
-                res_p_ch[n][dev] = [p_ch[n][dev][t].X for t in time_steps]
-                res_p_dch[n][dev] = [p_dch[n][dev][t].X for t in time_steps]
-            for dev in ["boi"]:
-                res_gas[n][dev] = [gas[n][dev][t].X for t in time_steps]
-
-            res_c_dem[n]["c_gas"] = [param_mpc["eco"]["gas"]
-                                     * gas[n]["boi"][t].X for t in time_steps]
-            res_c_dem[n]["house_c_dem"] = [p_imp[n][t].X *
-                                           param_mpc["eco"]["el_grid"] for t in time_steps]
-            res_rev[n]["house_rev"] = [p_sell[n]["pv"][t].X *
-                                       param_mpc["eco"]["sell_pv"] for t in time_steps]
-
-            res_soc_nom[n] = {dev: soc_nom[n][dev] for dev in storage}
-            for dev in ("pv",):
-                res_p_use[n][dev] = [p_use[n][dev][t].X for t in time_steps]
-                res_p_sell[n][dev] = [p_sell[n][dev][t].X for t in time_steps]
-            res_p_imp[n] = [p_imp[n][t].X for t in time_steps]
-
-        res_c_dem["ONT_c_dem"] = [power["from_grid"][t].X *
-                                  param_mpc["eco"]["el_grid"] for t in time_steps]
-
-        res_p_to_grid = [power["to_grid"][t].X for t in time_steps]
-        res_p_from_grid = [power["from_grid"][t].X for t in time_steps]
-        res_gas_from_grid = [gas_dom[t].X for t in time_steps]
-        res_p_feed_pv = [residual["feed_pv"][t].X for t in time_steps]
-        res_p_demand = [residual["demand"][t].X for t in time_steps]
-
-        # obj = model.ObjVal
-        # print("Obj: " + str(model.ObjVal))
-
-        # Return results
-        return (res_y, res_power, res_heat, res_soc, res_p_imp,
-                res_p_ch, res_p_dch, res_p_use, res_p_sell, res_gas,
-                res_c_dem, res_rev,
-                res_p_to_grid, res_p_from_grid,
-                res_gas_from_grid, res_p_feed_pv, res_p_demand)
+                                  init_val,
+                                  builder="dict",
+                                  deadline=None,
+                                  env=None):
+        model, handles = BUILDERS[builder](demands_and_pv=demands_and_pv,
+                                           buildings=buildings,
+                                           n_horizon=n_horizon,
+                                           param_mpc=param_mpc,
+                                           init_val=init_val,
+                                           env=env)
+
+        set_solver_params(model, param_mpc)
+
+        # Execute calculation, the model is disposed so that its
+        # environment can be handed to the next solve
+        try:
+            optimize_with_deadline(model=model,
+                                   deadline=deadline,
+                                   time_limit=param_mpc["gp"]["time_limit"])
+            if is_infeasible(model):
+                submit_iis(model)
+                return None, INFEASIBLE
+            status = gurobi_status(model)
+            if model.SolCount == 0:
+                return None, status
+            model.update()
+
+            return retrieve_results(model=model,
+                                    handles=handles,
+                                    param_mpc=param_mpc), status
+        finally:
+            model.dispose()
 
 
 if __name__ == '__main__':
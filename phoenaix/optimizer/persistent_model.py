@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+import numpy as np
+from phoenaix.optimizer.formulation import \
+    build_central_model, \
+    parameter_rhs, \
+    cop_profile, \
+    set_solver_params, \
+    is_infeasible
+from phoenaix.optimizer.matrix_model import build_matrix_model
+from phoenaix.optimizer.deadline import optimize_with_deadline
+from phoenaix.optimizer.diagnostics import submit_iis
+from phoenaix.optimizer.results import \
+    INFEASIBLE, \
+    NO_SOLUTION, \
+    gurobi_status, \
+    retrieve_results, \
+    time_series_vars
+
+BUILDERS = {
+    "dict": build_central_model,
+    "matrix": build_matrix_model,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentCentralModel:
+    """
+    Central MPC problem that is built once and re-optimized in every step of
+    the receding horizon.
+
+    The structure of the problem never changes between two steps, only the
+    forecasts and the initial SOCs do. These enter the model exclusively
+    through the right-hand sides of the constraint groups returned by
+    formulation.parameter_rhs, so an update overwrites those and
+    re-optimizes, starting from the previous solution shifted by one step.
+    A temperature dependent CoP of the heat pumps is updated in the
+    coefficients of the heat pump equations, only if it changed.
+
+    The model is either built variable by variable ('dict', see
+    formulation.build_central_model) or in matrix form ('matrix', see
+    matrix_model.build_matrix_model).
+
+    Solves of the model are serialized. With an env_pool.EnvPool every
+    solve also waits for one of its slots, so the model counts against the
+    concurrent solves of the pool; the model itself lives in env.
+    """
+
+    def __init__(self,
+                 buildings: dict,
+                 n_horizon: int,
+                 param_mpc: dict,
+                 warm_start: bool = True,
+                 silence: bool = True,
+                 builder: str = "matrix",
+                 env=None,
+                 pool=None):
+        self.buildings = buildings
+        self.n_horizon = n_horizon
+        self.param_mpc = param_mpc
+        self.warm_start = warm_start
+        self.silence = silence
+        self.env = env
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._build_model = BUILDERS[builder]
+
+        self.model = None
+        self.handles = None
+        self._series = None
+        self._start = None
+        self._cop = None
+
+        # timings of the last step in seconds
+        self.build_time = None
+        self.update_time = None
+        self.solve_time = None
+        self.n_solves = 0
+        # status of the last solve, see results.py
+        self.status = None
+
+    def build(self,
+              demands_and_pv: dict,
+              init_val: dict = None):
+        start_time = time.perf_counter()
+        self.model, self.handles = self._build_model(
+            demands_and_pv=demands_and_pv,
+            buildings=self.buildings,
+            n_horizon=self.n_horizon,
+            param_mpc=self.param_mpc,
+            init_val=init_val,
+            env=self.env)
+        set_solver_params(self.model, self.param_mpc)
+        if self.silence:
+            self.model.Params.OutputFlag = 0
+        self._series = time_series_vars(self.handles)
+        self._start = None
+        self._cop = cop_profile(demands_and_pv=demands_and_pv,
+                                n_horizon=self.n_horizon)
+        self.build_time = time.perf_counter() - start_time
+        self.update_time = 0.0
+
+    def update(self,
+               demands_and_pv: dict,
+               init_val: dict = None):
+        """
+        Overwrite the parameter dependent right-hand sides and set the
+        shifted previous solution as MIP start.
+        """
+        start_time = time.perf_counter()
+        rhs = parameter_rhs(demands_and_pv=demands_and_pv,
+                            buildings=self.buildings,
+                            n_horizon=self.n_horizon,
+                            init_val=init_val)
+        for name, constrs in self.handles["param_constrs"].items():
+            self.model.setAttr("RHS", constrs, rhs[name].ravel().tolist())
+
+        cop = cop_profile(demands_and_pv=demands_and_pv,
+                          n_horizon=self.n_horizon)
+        if not np.array_equal(cop, self._cop):
+            self._update_cop(cop)
+
+        if self.warm_start and self._start is not None:
+            self.model.setAttr("Start",
+                               [var for vars_t in self._series for var in vars_t],
+                               self._start.ravel().tolist())
+        self.update_time = time.perf_counter() - start_time
+
+    def _update_cop(self, cop):
+        var_list = self.handles["vars"]
+        p_hp = self.handles["columns"]["p_hp"]
+        constrs = self.handles["cop_constrs"]
+        n_steps = self.n_horizon
+        for i in range(p_hp.shape[0]):
+            for t in range(n_steps):
+                self.model.chgCoeff(constrs[i * n_steps + t],
+                                    var_list[p_hp[i, t]],
+                                    -cop[t])
+        self._cop = cop
+
+    def _store_shifted_solution(self):
+        flat = [var for vars_t in self._series for var in vars_t]
+        values = np.array(self.model.getAttr("X", flat)).reshape(
+            len(self._series), self.n_horizon)
+        # step t of the next horizon is step t + 1 of this one, the last
+        # step is held
+        self._start = np.concatenate([values[:, 1:], values[:, -1:]], axis=1)
+
+    def solve(self,
+              demands_and_pv: dict,
+              init_val: dict = None,
+              deadline=None):
+        """
+        Solve the central optimization for the given forecasts and initial
+        SOCs. Builds the model on the first call.
+
+        Args:
+            deadline: deadline.Deadline of the solve or None
+
+        Returns:
+            MPCResult or None if no solution was found
+        """
+        with self._lock:
+            return self._solve(demands_and_pv=demands_and_pv,
+                               init_val=init_val,
+                               deadline=deadline)
+
+    def _solve(self, demands_and_pv, init_val, deadline):
+        if self.model is None:
+            self.build(demands_and_pv=demands_and_pv, init_val=init_val)
+        else:
+            self.build_time = 0.0
+            self.update(demands_and_pv=demands_and_pv, init_val=init_val)
+
+        start_time = time.perf_counter()
+        if self.pool is None:
+            self._optimize(deadline)
+        else:
+            try:
+                with self.pool.acquire(deadline):
+                    self._optimize(deadline)
+            except TimeoutError as e:
+                logger.warning(f'Solve skipped: {e}')
+                self.solve_time = time.perf_counter() - start_time
+                self.status = NO_SOLUTION
+                return None
+        self.solve_time = time.perf_counter() - start_time
+        self.n_solves += 1
+        self.status = gurobi_status(self.model)
+
+        if is_infeasible(self.model):
+            submit_iis(self.model)
+            self._start = None
+            self.status = INFEASIBLE
+            return None
+
+        if self.model.SolCount == 0:
+            self._start = None
+            return None
+
+        if self.warm_start:
+            self._store_shifted_solution()
+
+        return retrieve_results(model=self.model,
+                                handles=self.handles,
+                                param_mpc=self.param_mpc)
+
+    def _optimize(self, deadline):
+        optimize_with_deadline(model=self.model,
+                               deadline=deadline,
+                               time_limit=self.param_mpc["gp"]["time_limit"])
+
+    def dispose(self):
+        if self.model is not None:
+            self.model.dispose()
+        self.model = None
+        self.handles = None
+        self._series = None
+        self._start = None
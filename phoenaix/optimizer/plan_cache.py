@@ -0,0 +1,60 @@
+"""
+Reuse of the last feasible horizon plan of the MPC.
+
+Every solve plans the whole horizon, but only its first step is applied.
+If a later solve fails or is late, the cached plan shifted by the number of
+steps since it was made provides the setpoints without a solver call.
+"""
+
+
+class PlanCache:
+    """
+    Last feasible plan of the MPC and counters of its reuse.
+
+    Args:
+        max_age: number of steps a plan may be reused, by default until the
+            end of its horizon
+    """
+
+    def __init__(self, max_age: int = None):
+        self.max_age = max_age
+        self.plan = None
+        # steps since the cached plan was made
+        self.age = 0
+        self.n_stored = 0
+        self.n_reused = 0
+        self.n_missing = 0
+
+    def store(self, res):
+        """Cache a new feasible plan"""
+        self.plan = res
+        self.age = 0
+        self.n_stored += 1
+
+    def fallback(self):
+        """
+        Plan of the next step from the cached plan.
+
+        Returns:
+            MPCResult shifted by the age of the plan, with 'plan_age' in its
+            info, or None if there is no plan or it is too old
+        """
+        age = self.age + 1
+        max_age = self.plan.n_horizon - 1 if self.plan is not None else 0
+        if self.max_age is not None:
+            max_age = min(max_age, self.max_age)
+        if self.plan is None or age > max_age:
+            self.n_missing += 1
+            return None
+
+        self.age = age
+        self.n_reused += 1
+        res = self.plan.shifted(age)
+        res.info["plan_age"] = age
+        return res
+
+    def stats(self) -> dict:
+        return {"plan_age": self.age,
+                "stored": self.n_stored,
+                "reused": self.n_reused,
+                "missing": self.n_missing}
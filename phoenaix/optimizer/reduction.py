@@ -0,0 +1,378 @@
+"""
+Reduction of the central MILP before it is handed to the solver.
+
+Many variables of the central MILP are fully determined by the inputs (PV
+power, electric heater, discharging power), others are never linked to
+anything (trafo activation, district exchange, totals) and buildings without
+a heat pump have no dispatch freedom at all. The reduction fixes or
+eliminates all of them on the matrix form of matrix_model, so that the
+solver only sees the flexible part of the problem. Every step is exact, the
+optimal objective of the reduced problem plus its constant offset equals the
+one of the full problem.
+"""
+import time
+import numpy as np
+from phoenaix.optimizer.buildings import building_arrays
+from phoenaix.optimizer.formulation import DT
+from phoenaix.optimizer.matrix_model import CentralMILP
+
+TOL = 1e-9
+
+
+class ReducedMILP:
+    """
+    A CentralMILP with fixed and dead columns removed.
+
+    It has the same c, A, sense, rhs, lb, ub and vtype attributes as
+    CentralMILP, so it can be passed to matrix_model.to_gurobi. expand maps
+    a solution of the reduced problem back to all columns of the full one.
+    """
+
+    def __init__(self, milp, c, A, sense, rhs, lb, ub, vtype,
+                 cols, fixed, recoveries, obj_offset, skipped_buildings,
+                 reduce_time):
+        self.milp = milp
+        self.c = c
+        self.A = A
+        self.sense = sense
+        self.rhs = rhs
+        self.lb = lb
+        self.ub = ub
+        self.vtype = vtype
+        self.cols = cols
+        self.fixed = fixed
+        self.recoveries = recoveries
+        self.obj_offset = obj_offset
+        self.skipped_buildings = skipped_buildings
+        self.reduce_time = reduce_time
+
+    @property
+    def n_cols(self):
+        return self.c.shape[0]
+
+    @property
+    def n_rows(self):
+        return self.rhs.shape[0]
+
+    def expand(self, x):
+        """Solution of all columns of the full problem"""
+        values = np.nan_to_num(self.fixed, nan=0.0)
+        values[self.cols] = x
+        A = self.milp.A
+        for row, col, coeff in reversed(self.recoveries):
+            start, end = A.indptr[row], A.indptr[row + 1]
+            values[col] = 0.0
+            values[col] = (self.milp.rhs[row] -
+                           A.data[start:end] @ values[A.indices[start:end]]) / coeff
+        return values
+
+    def summary(self):
+        return {
+            "rows": self.milp.n_rows,
+            "cols": self.milp.n_cols,
+            "rows_removed": self.milp.n_rows - self.n_rows,
+            "cols_removed": self.milp.n_cols - self.n_cols,
+            "skipped_buildings": self.skipped_buildings,
+            "reduce_time": self.reduce_time,
+        }
+
+
+def _activity_bounds(sub, lb, ub, rows, cols, coeff):
+    """
+    Lowest and highest activity of the given rows without the entries
+    (rows[i], cols[i]) with coefficients coeff[i], based on the bounds of
+    all other columns.
+    """
+    row_of_entry = np.repeat(np.arange(sub.shape[0]), np.diff(sub.indptr))
+    with np.errstate(invalid="ignore"):
+        low = np.where(sub.data > 0, sub.data * lb[sub.indices],
+                       sub.data * ub[sub.indices])
+        high = np.where(sub.data > 0, sub.data * ub[sub.indices],
+                        sub.data * lb[sub.indices])
+        own_low = np.where(coeff > 0, coeff * lb[cols], coeff * ub[cols])
+        own_high = np.where(coeff > 0, coeff * ub[cols], coeff * lb[cols])
+
+    result = []
+    for values, own, infinite in ((low, own_low, -np.inf),
+                                  (high, own_high, np.inf)):
+        finite = np.isfinite(values)
+        sums = np.bincount(row_of_entry, weights=np.where(finite, values, 0.0),
+                           minlength=sub.shape[0])
+        n_inf = np.bincount(row_of_entry, weights=~finite,
+                            minlength=sub.shape[0])
+        own_finite = np.isfinite(own)
+        result.append(np.where(n_inf[rows] - ~own_finite > 0, infinite,
+                               sums[rows] - np.where(own_finite, own, 0.0)))
+    return result
+
+
+def _fix_rigid_buildings(milp, buildings, param_mpc, fixed):
+    """
+    Fix all columns of the buildings without dispatch freedom.
+
+    Without a heat pump, the storage of a building is only charged by its
+    boiler at a constant gas price. Storing heat then never pays off, so the
+    optimum uses the stored heat first and lets the boiler cover the rest
+    in every step. As buying electricity costs more than selling it earns,
+    PV covers as much of the fixed electrical load as possible. Buildings
+    are only fixed if their boiler and electric heater can cover this.
+
+    Returns:
+        list of the ids of all fixed buildings
+    """
+    eco = param_mpc["eco"]
+    if eco["el_grid"] < eco["sell_pv"]:
+        return []
+
+    devs = building_arrays(buildings)
+    X = milp.columns
+    n_buildings, T = X["soc"].shape
+
+    def _rhs(name):
+        return milp.rhs[milp.rows[name]].reshape(n_buildings, T)
+
+    pv = _rhs("pv")
+    eh = _rhs("eh")
+    dch = _rhs("dch")
+    elec = _rhs("elec")
+    storage_init = milp.rhs[milp.rows["storage_init"]]
+    dt = milp.durations
+
+    skipped = []
+    for i, n in enumerate(milp.building_ids):
+        if devs["cap_hp"][i] != 0.0 or devs["eta_tes"][i] > 1.0 or \
+                devs["eta_ch"][i] <= 0.0 or devs["eta_th"][i] <= 0.0:
+            continue
+        if np.any(eh[i] > devs["cap_eh"][i] + TOL):
+            continue
+
+        soc = np.zeros(T)
+        p_ch = np.zeros(T)
+        soc_prev = storage_init[i]
+        for t in range(T):
+            need = dt[t] * dch[i, t] - soc_prev
+            if need > 0:
+                p_ch[t] = need / dt[t]
+            else:
+                soc[t] = -need
+            if t + 1 < T:
+                soc_prev = devs["eta_tes"][i] ** (dt[t + 1] / DT) * soc[t]
+        q_boi = p_ch / devs["eta_ch"][i]
+        if np.any(q_boi > devs["cap_boi"][i] + TOL):
+            continue
+
+        load = elec[i] + eh[i]
+        p_use = np.minimum(pv[i], load)
+        p_imp = load - p_use
+        values = {
+            "soc": soc,
+            "p_ch": p_ch,
+            "p_dch": dch[i],
+            "p_hp": 0.0,
+            "q_hp": 0.0,
+            "p_boi": 0.0,
+            "q_boi": q_boi,
+            "p_eh": eh[i],
+            "p_pv": pv[i],
+            "p_imp": p_imp,
+            "y_imp": (p_imp > TOL).astype(float),
+            "p_use": p_use,
+            "p_sell": pv[i] - p_use,
+            "gas_boi": q_boi / devs["eta_th"][i],
+        }
+        for name, value in values.items():
+            fixed[X[name][i]] = value
+        skipped.append(n)
+    return skipped
+
+
+def reduce_central_milp(milp: CentralMILP,
+                        buildings: dict,
+                        param_mpc: dict,
+                        skip_buildings: bool = True):
+    """
+    Remove fixed and dead columns and redundant rows of the central MILP.
+
+    The reduction repeats the following rules until none applies:
+
+    - rows without free columns are dropped
+    - equality rows with a single column fix it, inequality rows with a
+      single column become its bound
+    - columns that can be moved towards their cheaper bound without
+      violating any row are fixed at that bound
+    - continuous columns that only appear in one equality row, whose bounds
+      are implied by that row, are substituted by the row
+
+    Args:
+        milp: assembled central MILP
+        buildings: device parameters of all buildings
+        param_mpc: MPC parameters
+        skip_buildings: fix all columns of buildings without dispatch
+            freedom before the general rules are applied
+
+    Returns:
+        ReducedMILP
+    """
+    start_time = time.perf_counter()
+    A = milp.A.tocsr()
+    n_rows, n_cols = A.shape
+    c = milp.c.astype(float).copy()
+    lb = milp.lb.astype(float).copy()
+    ub = milp.ub.astype(float).copy()
+    is_int = milp.vtype != "C"
+
+    fixed = np.full(n_cols, np.nan)
+    row_active = np.ones(n_rows, dtype=bool)
+    col_active = np.ones(n_cols, dtype=bool)
+    recoveries = []
+    obj_offset = 0.0
+
+    skipped = []
+    if skip_buildings:
+        skipped = _fix_rigid_buildings(milp=milp,
+                                       buildings=buildings,
+                                       param_mpc=param_mpc,
+                                       fixed=fixed)
+        col_active[~np.isnan(fixed)] = False
+
+    changed = True
+    while changed:
+        changed = False
+        rows = np.flatnonzero(row_active)
+        cols = np.flatnonzero(col_active)
+        rhs = (milp.rhs - A @ np.nan_to_num(fixed, nan=0.0))[rows]
+        sense = milp.sense[rows]
+        sub = A[rows][:, cols].tocsr()
+        row_nnz = np.diff(sub.indptr)
+
+        # Rows without free columns
+        empty = np.flatnonzero(row_nnz == 0)
+        feasible = np.where(sense[empty] == "=", np.abs(rhs[empty]) <= TOL,
+                            np.where(sense[empty] == "<", rhs[empty] >= -TOL,
+                                     rhs[empty] <= TOL))
+        row_active[rows[empty[feasible]]] = False
+
+        # Rows with a single free column. Equality rows fix the column,
+        # only the first one per column is used in this pass.
+        single = np.flatnonzero(row_nnz == 1)
+        coeff = sub.data[sub.indptr[single]]
+        j = cols[sub.indices[sub.indptr[single]]]
+        bound = rhs[single] / coeff
+        equal = sense[single] == "="
+
+        k_eq, j_eq, b_eq = single[equal], j[equal], bound[equal]
+        _, first = np.unique(j_eq, return_index=True)
+        k_eq, j_eq, b_eq = k_eq[first], j_eq[first], b_eq[first]
+        integral = ~is_int[j_eq] | (np.abs(b_eq - np.round(b_eq)) <= TOL)
+        b_eq = np.where(is_int[j_eq], np.round(b_eq), b_eq)
+        ok = integral & (b_eq >= lb[j_eq] - TOL) & (b_eq <= ub[j_eq] + TOL)
+        k_eq, j_eq = k_eq[ok], j_eq[ok]
+        fixed[j_eq] = np.clip(b_eq[ok], lb[j_eq], ub[j_eq])
+        col_active[j_eq] = False
+        row_active[rows[k_eq]] = False
+
+        # Inequality rows become bounds
+        free = ~equal & col_active[j]
+        upper = free & ((sense[single] == "<") == (coeff > 0))
+        lower = free & ~upper
+        b_ub = np.where(is_int[j], np.floor(bound + TOL), bound)
+        b_lb = np.where(is_int[j], np.ceil(bound - TOL), bound)
+        upper &= b_ub >= lb[j] - TOL
+        lower &= b_lb <= ub[j] + TOL
+        np.minimum.at(ub, j[upper], np.maximum(b_ub, lb[j])[upper])
+        np.maximum.at(lb, j[lower], np.minimum(b_lb, ub[j])[lower])
+        row_active[rows[single[upper | lower]]] = False
+
+        changed = bool(feasible.any() or k_eq.size or upper.any() or
+                       lower.any())
+        if changed:
+            continue
+
+        # Columns that can be moved towards their cheaper bound
+        csc = sub.tocsc()
+        col_nnz = np.diff(csc.indptr)
+        entry_col = np.repeat(np.arange(cols.size), col_nnz)
+        entry_sense = sense[csc.indices]
+        relax_down = ((entry_sense == "<") & (csc.data > 0)) | \
+            ((entry_sense == ">") & (csc.data < 0))
+        relax_up = ((entry_sense == "<") & (csc.data < 0)) | \
+            ((entry_sense == ">") & (csc.data > 0))
+        down_ok = np.bincount(entry_col, weights=~relax_down,
+                              minlength=cols.size) == 0
+        up_ok = np.bincount(entry_col, weights=~relax_up,
+                            minlength=cols.size) == 0
+        c_cols = c[cols]
+        lb_cols = lb[cols]
+        ub_cols = ub[cols]
+        to_lb = down_ok & (c_cols >= 0) & np.isfinite(lb_cols)
+        to_ub = ~to_lb & up_ok & (c_cols <= 0) & np.isfinite(ub_cols)
+        to_zero = ~to_lb & ~to_ub & (col_nnz == 0) & (c_cols == 0)
+        for mask, values in ((to_lb, lb_cols),
+                             (to_ub, ub_cols),
+                             (to_zero, np.zeros(cols.size))):
+            fixed[cols[mask]] = values[mask]
+            col_active[cols[mask]] = False
+            changed = changed or bool(mask.any())
+
+        if changed:
+            continue
+
+        # Continuous columns in a single equality row with implied bounds
+        candidates = np.flatnonzero((col_nnz == 1) & ~is_int[cols])
+        entries = csc.indptr[candidates]
+        k_cand = csc.indices[entries]
+        equal = sense[k_cand] == "="
+        candidates, entries, k_cand = \
+            candidates[equal], entries[equal], k_cand[equal]
+        coeff = csc.data[entries]
+        low, high = _activity_bounds(sub=sub,
+                                     lb=lb[cols],
+                                     ub=ub[cols],
+                                     rows=k_cand,
+                                     cols=candidates,
+                                     coeff=coeff)
+        implied_a = (rhs[k_cand] - high) / coeff
+        implied_b = (rhs[k_cand] - low) / coeff
+        j_cand = cols[candidates]
+        implied = (np.minimum(implied_a, implied_b) >= lb[j_cand] - TOL) & \
+            (np.maximum(implied_a, implied_b) <= ub[j_cand] + TOL)
+
+        for j, k, coeff in zip(j_cand[implied], k_cand[implied],
+                               coeff[implied]):
+            if not row_active[rows[k]]:
+                continue
+
+            # x_j = (rhs - sum(a_k * x_k)) / a_j, also in the objective
+            row = rows[k]
+            start, end = A.indptr[row], A.indptr[row + 1]
+            row_cols = A.indices[start:end]
+            row_coeff = A.data[start:end]
+            other = row_cols != j
+            c[row_cols[other]] -= c[j] * row_coeff[other] / coeff
+            obj_offset += c[j] * milp.rhs[row] / coeff
+            c[j] = 0.0
+            recoveries.append((row, j, coeff))
+            row_active[row] = False
+            col_active[j] = False
+            changed = True
+
+    rows = np.flatnonzero(row_active)
+    cols = np.flatnonzero(col_active)
+    is_fixed = ~np.isnan(fixed)
+    A_rows = A[rows]
+    obj_offset += c[is_fixed] @ fixed[is_fixed]
+
+    return ReducedMILP(milp=milp,
+                       c=c[cols],
+                       A=A_rows[:, cols].tocsr(),
+                       sense=milp.sense[rows],
+                       rhs=milp.rhs[rows] - A_rows[:, is_fixed] @ fixed[is_fixed],
+                       lb=lb[cols],
+                       ub=ub[cols],
+                       vtype=milp.vtype[cols],
+                       cols=cols,
+                       fixed=fixed,
+                       recoveries=recoveries,
+                       obj_offset=obj_offset,
+                       skipped_buildings=skipped,
+                       reduce_time=time.perf_counter() - start_time)
@@ -0,0 +1,297 @@
+from functools import cached_property
+import numpy as np
+import gurobipy as gp
+
+# Device axis of the (building, device, time) arrays
+POWER_DEVICES = ("hp", "boi", "eh", "pv")
+HEAT_DEVICES = ("hp", "boi")
+STORAGE_DEVICES = ("tes",)
+
+# Column groups a builder has to expose in handles['columns'], shaped
+# (building, time) or (time,)
+RESULT_BT_COLUMNS = ("soc", "p_ch", "p_dch", "p_hp", "q_hp", "p_boi", "q_boi",
+                     "p_eh", "p_pv", "p_imp", "y_imp", "p_use", "p_sell",
+                     "gas_boi")
+RESULT_T_COLUMNS = ("residual_demand", "residual_feed_pv", "from_grid",
+                    "to_grid", "gas_dom")
+
+# Solver independent status of a solve. TIME_LIMIT means that the solver
+# stopped early with a feasible solution, NO_SOLUTION that it stopped
+# without one.
+OPTIMAL = "optimal"
+TIME_LIMIT = "time_limit"
+INFEASIBLE = "infeasible"
+NO_SOLUTION = "no_solution"
+
+GUROBI_STATUS = {
+    gp.GRB.OPTIMAL: OPTIMAL,
+    gp.GRB.SUBOPTIMAL: TIME_LIMIT,
+    gp.GRB.TIME_LIMIT: TIME_LIMIT,
+    gp.GRB.INTERRUPTED: TIME_LIMIT,
+    gp.GRB.INFEASIBLE: INFEASIBLE,
+    gp.GRB.INF_OR_UNBD: INFEASIBLE,
+}
+
+
+class MPCResult:
+    """
+    Solution of one central optimization.
+
+    The solution is fetched from the solver as one vector. The arrays of the
+    single quantities are cut out of it on first access, so a caller that
+    only needs the setpoints of the first time step does not pay for the
+    rest.
+
+    Args:
+        values: solution vector of all columns
+        columns: column indices of every variable group, see
+            RESULT_BT_COLUMNS and RESULT_T_COLUMNS
+        building_ids: keys of the buildings along the first axis
+        param_mpc: MPC parameters, used for the cost fields
+        status: how the values were obtained, one of the status strings
+            of this module or of the plans that stand in for a solve:
+
+            - OPTIMAL: solved to the MIP gap of param_mpc
+            - TIME_LIMIT: stopped early at a feasible solution, also a
+              decomposition that did not converge
+            - NO_SOLUTION: an unsolved horizon of batch.BatchResult, whose
+              values are NaN. MPC.solve returns None for an infeasible
+              problem or one without a solution instead.
+            - explicit_policy.POLICY: the first-step setpoints of the
+              explicit policy, see explicit_policy.PolicyAction
+            - rule_based.RULE_BASED: the setpoints of the rule-based
+              controller, see rule_based.RuleBasedPlan
+
+            A result of the elastic problem (elastic.solve_elastic) has
+            the status of its solve and info['elastic'] set.
+        obj_val: objective value
+        mip_gap: relative gap of the returned solution
+        info: additional information on how the solution was obtained
+    """
+
+    def __init__(self,
+                 values: np.ndarray,
+                 columns: dict,
+                 building_ids: list,
+                 param_mpc: dict,
+                 status: str = None,
+                 obj_val: float = None,
+                 mip_gap: float = None,
+                 info: dict = None):
+        self.values = values
+        self.columns = columns
+        self.building_ids = list(building_ids)
+        self.param_mpc = param_mpc
+        self.status = status
+        self.obj_val = obj_val
+        self.mip_gap = mip_gap
+        self.info = info if info is not None else {}
+        self._building_index = {n: i for i, n in enumerate(self.building_ids)}
+
+    @property
+    def n_horizon(self) -> int:
+        return self.columns["soc"].shape[1]
+
+    def _get(self, name) -> np.ndarray:
+        return self.values[self.columns[name]]
+
+    def _stack(self, names) -> np.ndarray:
+        return np.stack([self._get(name) for name in names], axis=1)
+
+    def building_index(self, building_id) -> int:
+        return self._building_index[building_id]
+
+    # (building, device, time)
+    @cached_property
+    def power(self) -> np.ndarray:
+        """Electrical power of all devices in POWER_DEVICES"""
+        return self._stack(("p_hp", "p_boi", "p_eh", "p_pv"))
+
+    @cached_property
+    def heat(self) -> np.ndarray:
+        """Heat output of all devices in HEAT_DEVICES"""
+        return self._stack(("q_hp", "q_boi"))
+
+    @cached_property
+    def soc(self) -> np.ndarray:
+        return self._stack(("soc",))
+
+    @cached_property
+    def p_ch(self) -> np.ndarray:
+        return self._stack(("p_ch",))
+
+    @cached_property
+    def p_dch(self) -> np.ndarray:
+        return self._stack(("p_dch",))
+
+    # (building, time)
+    @cached_property
+    def y_imp(self) -> np.ndarray:
+        return self._get("y_imp")
+
+    @cached_property
+    def p_imp(self) -> np.ndarray:
+        return self._get("p_imp")
+
+    @cached_property
+    def p_use(self) -> np.ndarray:
+        """Self-consumed PV power"""
+        return self._get("p_use")
+
+    @cached_property
+    def p_sell(self) -> np.ndarray:
+        """Sold PV power"""
+        return self._get("p_sell")
+
+    @cached_property
+    def gas(self) -> np.ndarray:
+        """Gas consumption of the boilers"""
+        return self._get("gas_boi")
+
+    # (time,)
+    @cached_property
+    def p_to_grid(self) -> np.ndarray:
+        return self._get("to_grid")
+
+    @cached_property
+    def p_from_grid(self) -> np.ndarray:
+        return self._get("from_grid")
+
+    @cached_property
+    def gas_from_grid(self) -> np.ndarray:
+        return self._get("gas_dom")
+
+    @cached_property
+    def p_feed_pv(self) -> np.ndarray:
+        return self._get("residual_feed_pv")
+
+    @cached_property
+    def p_demand(self) -> np.ndarray:
+        return self._get("residual_demand")
+
+    def shifted(self, steps: int):
+        """
+        The plan as seen the given number of time steps later: step t of the
+        returned result is step t + steps of this one, the last step is held.
+        Only the column indices are shifted, the values are shared.
+        """
+        columns = {}
+        for name, cols in self.columns.items():
+            if cols.ndim == 0:
+                columns[name] = cols
+                continue
+            index = np.minimum(np.arange(cols.shape[-1]) + steps,
+                               cols.shape[-1] - 1)
+            columns[name] = cols[..., index]
+        return MPCResult(values=self.values,
+                         columns=columns,
+                         building_ids=self.building_ids,
+                         param_mpc=self.param_mpc,
+                         status=self.status,
+                         obj_val=self.obj_val,
+                         mip_gap=self.mip_gap,
+                         info=dict(self.info))
+
+    def hp_power(self, building_id, step: int = 0) -> float:
+        """Electrical power of the heat pump of one building"""
+        return float(self.values[self.columns["p_hp"][
+            self.building_index(building_id), step]])
+
+    def tes_soc(self, building_id, step: int = 0) -> float:
+        """SOC of the thermal energy storage of one building"""
+        return float(self.values[self.columns["soc"][
+            self.building_index(building_id), step]])
+
+    def as_tuple(self):
+        """
+        Results in the nested dict format returned by
+        MPC._run_central_optimization before the result object existed.
+        """
+        eco = self.param_mpc["eco"]
+        res_y = {}
+        res_power = {}
+        res_heat = {}
+        res_soc = {}
+        res_p_ch = {}
+        res_p_dch = {}
+        res_p_imp = {}
+        res_gas = {}
+        res_c_dem = {}
+        res_p_use = {}
+        res_p_sell = {}
+        res_rev = {}
+        for i, n in enumerate(self.building_ids):
+            res_y[n] = self.y_imp[i].tolist()
+            res_power[n] = {dev: self.power[i, POWER_DEVICES.index(dev)].tolist()
+                            for dev in ("hp", "boi", "pv")}
+            res_heat[n] = {dev: self.heat[i, j].tolist()
+                           for j, dev in enumerate(HEAT_DEVICES)}
+            res_soc[n] = {dev: self.soc[i, j].tolist()
+                          for j, dev in enumerate(STORAGE_DEVICES)}
+            res_p_ch[n] = {dev: self.p_ch[i, j].tolist()
+                           for j, dev in enumerate(STORAGE_DEVICES)}
+            res_p_dch[n] = {dev: self.p_dch[i, j].tolist()
+                            for j, dev in enumerate(STORAGE_DEVICES)}
+            res_gas[n] = {"boi": self.gas[i].tolist()}
+            res_c_dem[n] = {"c_gas": (eco["gas"] * self.gas[i]).tolist(),
+                            "house_c_dem": (self.p_imp[i] * eco["el_grid"]).tolist()}
+            res_rev[n] = {"house_rev": (self.p_sell[i] * eco["sell_pv"]).tolist()}
+            res_p_use[n] = {"pv": self.p_use[i].tolist()}
+            res_p_sell[n] = {"pv": self.p_sell[i].tolist()}
+            res_p_imp[n] = self.p_imp[i].tolist()
+
+        res_c_dem["ONT_c_dem"] = (self.p_from_grid * eco["el_grid"]).tolist()
+
+        return (res_y, res_power, res_heat, res_soc, res_p_imp,
+                res_p_ch, res_p_dch, res_p_use, res_p_sell, res_gas,
+                res_c_dem, res_rev,
+                self.p_to_grid.tolist(), self.p_from_grid.tolist(),
+                self.gas_from_grid.tolist(), self.p_feed_pv.tolist(),
+                self.p_demand.tolist())
+
+
+def time_series_vars(handles):
+    """
+    All variables that are indexed by time, as an array of shape
+    (series, time), used to shift a previous solution into a warm start.
+    """
+    var_list = handles["vars"]
+    columns = handles["columns"]
+    series = [columns[name] for name in RESULT_BT_COLUMNS] + \
+        [columns[name][None, :] for name in RESULT_T_COLUMNS]
+    series = np.concatenate(series, axis=0)
+    return [[var_list[i] for i in row] for row in series]
+
+
+def gurobi_status(model):
+    """Solver independent status of a gurobi model after optimize"""
+    status = GUROBI_STATUS.get(model.Status, NO_SOLUTION)
+    if status == TIME_LIMIT and model.SolCount == 0:
+        return NO_SOLUTION
+    return status
+
+
+def retrieve_results(model,
+                     handles,
+                     param_mpc):
+    """
+    Fetch the solution of a solved model with one bulk call.
+
+    Args:
+        model: solved gurobi model
+        handles: handles of a builder, with the list of all variables in
+            'vars', their column layout in 'columns' and the building keys
+            in 'building_ids'
+
+    Returns:
+        MPCResult
+    """
+    values = np.array(model.getAttr("X", handles["vars"]))
+    mip_gap = model.MIPGap if model.IsMIP else 0.0
+    return MPCResult(values=values,
+                     columns=handles["columns"],
+                     building_ids=handles["building_ids"],
+                     param_mpc=param_mpc,
+                     status=gurobi_status(model),
+                     obj_val=model.ObjVal,
+                     mip_gap=mip_gap)
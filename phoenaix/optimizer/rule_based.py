@@ -0,0 +1,216 @@
+"""
+Rule-based dispatch of the heaters and storages, without a solver.
+
+The MPC has no setpoints at all if gurobi is unavailable, its license too
+small for the neighborhood or the solve too slow. RuleBasedController
+dispatches the same forecasts and SOCs by fixed rules in a numba compiled
+loop over buildings and time steps, in well below a millisecond for the
+demonstrator:
+
+    - the electric heater covers its share of the dhw, the storage the
+      rest of the heat demand
+    - the heater recharges the storage to the upper end of the SOC band
+      once it falls below the lower end
+    - heat pumps also charge the storage with the PV surplus of their
+      building, up to the upper end of the band
+
+The MPC uses it either instead of the optimization or as a fallback if the
+solve fails and no earlier plan is left, see MPC.predict.
+"""
+import time
+from collections import deque
+import numpy as np
+from numba import njit
+from phoenaix.optimizer.buildings import building_arrays
+from phoenaix.optimizer.formulation import \
+    DT, \
+    cop_profile, \
+    parameter_rhs
+
+# Status of the plans of the controller, see results.OPTIMAL
+RULE_BASED = "rule_based"
+# SOC band relative to the storage capacity
+SOC_LOW = 0.2
+SOC_HIGH = 0.9
+
+
+@njit(cache=True)
+def _dispatch(dch, eh, elec, pv, soc_init, cap_tes, cap_hp, cap_boi, eta_th,
+              eta_ch, eta_tes, cop, soc_low, soc_high, dt):
+    """
+    Setpoints of all buildings over the horizon.
+
+    Args:
+        dch: heat taken from the storages, shape (building, time)
+        eh: power of the electric heaters, shape (building, time)
+        elec: electricity demand, shape (building, time)
+        pv: PV power, shape (building, time)
+        soc_init: SOCs before the first step, shape (building,)
+        cop: CoP of the heat pumps, shape (time,)
+        soc_low, soc_high: SOC band relative to cap_tes
+        dt: duration of the time steps in hours
+
+    Returns:
+        arrays of shape (building, time): heat pump power, gas of the
+        boilers, SOC at the end of the step, grid import, PV feed-in
+    """
+    n_buildings, n_steps = dch.shape
+    p_hp = np.zeros((n_buildings, n_steps))
+    gas = np.zeros((n_buildings, n_steps))
+    soc = np.zeros((n_buildings, n_steps))
+    p_imp = np.zeros((n_buildings, n_steps))
+    p_sell = np.zeros((n_buildings, n_steps))
+    for n in range(n_buildings):
+        level = soc_init[n]
+        low = soc_low * cap_tes[n]
+        high = soc_high * cap_tes[n]
+        charging = False
+        for t in range(n_steps):
+            loss = eta_tes[n] ** (dt / DT)
+            level_free = level * loss - dt * dch[n, t]
+            if level_free < low:
+                charging = True
+            # heat to the storage that reaches the upper end of the band,
+            # and at least the one that keeps it from running empty
+            q_high = max(high - level_free, 0.0) / (dt * eta_ch[n])
+            q_min = max(-level_free, 0.0) / (dt * eta_ch[n])
+
+            q = 0.0
+            if cap_hp[n] > 0.0:
+                q_max = cap_hp[n]
+                if charging:
+                    q = q_high
+                else:
+                    surplus = pv[n, t] - elec[n, t] - eh[n, t]
+                    q = min(max(surplus, 0.0) * cop[t], q_high)
+                q = min(max(q, q_min), q_max)
+                p_hp[n, t] = q / cop[t]
+            elif cap_boi[n] > 0.0:
+                q = min(max(q_high if charging else 0.0, q_min), cap_boi[n])
+                gas[n, t] = q / eta_th[n]
+
+            level = level_free + dt * eta_ch[n] * q
+            soc[n, t] = level
+            if level >= high:
+                charging = False
+
+            load = elec[n, t] + eh[n, t] + p_hp[n, t]
+            use = min(load, pv[n, t])
+            p_imp[n, t] = load - use
+            p_sell[n, t] = pv[n, t] - use
+    return p_hp, gas, soc, p_imp, p_sell
+
+
+class RuleBasedPlan:
+    """
+    Setpoints of the controller over the horizon, with the accessors and
+    the neighborhood totals of MPCResult.
+    """
+    status = RULE_BASED
+    mip_gap = None
+
+    def __init__(self, p_hp, gas, soc, p_imp, p_sell, building_ids,
+                 param_mpc, dt):
+        self.p_hp = p_hp
+        self.soc = soc
+        self.building_ids = list(building_ids)
+        self._index = {n: i for i, n in enumerate(self.building_ids)}
+        self.gas_from_grid = gas.sum(axis=0)
+        self.p_demand = p_imp.sum(axis=0)
+        self.p_feed_pv = p_sell.sum(axis=0)
+        eco = param_mpc["eco"]
+        self.obj_val = float(dt * (eco["gas"] * self.gas_from_grid +
+                                   eco["el_grid"] * self.p_demand -
+                                   eco["sell_pv"] * self.p_feed_pv).sum())
+        self.info = {}
+
+    def hp_power(self, building_id, step: int = 0) -> float:
+        return float(self.p_hp[self._index[building_id], step])
+
+    def tes_soc(self, building_id, step: int = 0) -> float:
+        return float(self.soc[self._index[building_id], step])
+
+
+class RuleBasedController:
+    """
+    SOC band control of the heaters with PV surplus charging of the heat
+    pumps.
+
+    Args:
+        buildings: device parameters of all buildings
+        param_mpc: parameters of the MPC, for the costs of the plans
+        soc_low, soc_high: SOC band relative to the storage capacity
+    """
+
+    def __init__(self,
+                 buildings,
+                 param_mpc: dict,
+                 soc_low: float = SOC_LOW,
+                 soc_high: float = SOC_HIGH):
+        self.buildings = buildings
+        self.param_mpc = param_mpc
+        self.soc_low = soc_low
+        self.soc_high = soc_high
+        self.building_ids = list(buildings)
+        self.devs = building_arrays(buildings)
+        # seconds per call of act of the last steps
+        self.latencies = deque(maxlen=1000)
+        # compile the dispatch now rather than in the first step
+        zeros = np.zeros((len(self.building_ids), 1))
+        _dispatch(zeros, zeros, zeros, zeros, zeros[:, 0],
+                  self.devs["cap_tes"], self.devs["cap_hp"],
+                  self.devs["cap_boi"], self.devs["eta_th"],
+                  self.devs["eta_ch"], self.devs["eta_tes"], np.ones(1),
+                  soc_low, soc_high, float(DT))
+
+    def act(self,
+            demands_and_pv,
+            init_val,
+            n_horizon: int = 1) -> RuleBasedPlan:
+        """
+        Setpoints for the inputs of the MPC.
+
+        Args:
+            n_horizon: number of time steps to dispatch, the MPC only
+                needs the first one
+        """
+        start_time = time.perf_counter()
+        rhs = parameter_rhs(demands_and_pv=demands_and_pv,
+                            buildings=self.buildings,
+                            n_horizon=n_horizon,
+                            init_val=init_val)
+        cop = cop_profile(demands_and_pv=demands_and_pv,
+                          n_horizon=n_horizon)
+        devs = self.devs
+        # parameter_rhs returns the SOCs after the losses of the first step,
+        # the losses are applied in the dispatch
+        if init_val is not None:
+            soc_init = np.array([init_val["soc"][n]["tes"]
+                                 for n in self.building_ids], dtype=float)
+        else:
+            soc_init = 0.5 * devs["cap_tes"]
+        p_hp, gas, soc, p_imp, p_sell = _dispatch(
+            rhs["dch"], rhs["eh"], rhs["elec"], rhs["pv"], soc_init,
+            devs["cap_tes"], devs["cap_hp"], devs["cap_boi"],
+            devs["eta_th"], devs["eta_ch"], devs["eta_tes"],
+            np.ascontiguousarray(cop, dtype=float),
+            self.soc_low, self.soc_high, float(DT))
+        plan = RuleBasedPlan(p_hp=p_hp,
+                             gas=gas,
+                             soc=soc,
+                             p_imp=p_imp,
+                             p_sell=p_sell,
+                             building_ids=self.building_ids,
+                             param_mpc=self.param_mpc,
+                             dt=DT)
+        self.latencies.append(time.perf_counter() - start_time)
+        return plan
+
+    def stats(self) -> dict:
+        if not self.latencies:
+            return {}
+        latencies = np.array(self.latencies)
+        return {"mean": latencies.mean(),
+                "p99": np.percentile(latencies, 99),
+                "max": latencies.max(),
+                "steps": len(latencies)}
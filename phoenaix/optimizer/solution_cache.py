@@ -0,0 +1,148 @@
+"""
+Cache of MPC solutions keyed on quantised inputs.
+
+Long offline simulations and parameter studies solve the central problem
+again and again for situations that differ only by noise in the last
+digits, e.g. at night or while the heat pumps are idle. SolutionCache
+stores the plans of the last solves under a hash of the forecasts and the
+initial SOCs rounded to a resolution, the device and MPC parameters and
+the time grid. A repeated situation returns the stored plan without a
+solver call.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import numpy as np
+from phoenaix.optimizer.buildings import BuildingTable
+from phoenaix.optimizer.results import OPTIMAL
+
+# Resolution of the forecasts and the initial SOCs in W and Wh
+RESOLUTION = 10.0
+SOC_RESOLUTION = 1.0
+# Quantities of the forecasts in other units
+RESOLUTIONS = {"t_air": 0.1}
+
+
+class SolutionCache:
+    """
+    LRU cache of MPCResults and counters of its use.
+
+    Args:
+        max_size: number of plans kept, the least recently used plan is
+            evicted first
+        resolution: forecasts that round to the same multiple of it share a
+            plan, see also RESOLUTIONS
+        soc_resolution: same for the initial SOCs
+    """
+
+    def __init__(self,
+                 max_size: int = 1000,
+                 resolution: float = RESOLUTION,
+                 soc_resolution: float = SOC_RESOLUTION):
+        if max_size < 1:
+            raise ValueError("The cache must hold at least one plan")
+        self.max_size = max_size
+        self.resolution = resolution
+        self.soc_resolution = soc_resolution
+        self._plans = OrderedDict()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    def __len__(self):
+        return len(self._plans)
+
+    def key(self,
+            demands_and_pv,
+            init_val,
+            buildings,
+            param_mpc,
+            time_grid):
+        """
+        Hash of everything a plan depends on.
+
+        Args:
+            demands_and_pv: forecasts in the input format of MPC.predict
+            init_val: initial SOCs or None
+            buildings: buildings.BuildingTable or nested dicts
+            param_mpc: MPC parameters
+            time_grid: time_grid.TimeGrid of the horizon, only the forecast
+                values it covers are hashed
+        """
+        n_values = time_grid.n_values
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(time_grid.durations.tobytes())
+        for quantity in sorted(demands_and_pv):
+            values = demands_and_pv[quantity]
+            if isinstance(values, np.ndarray):
+                values = values[:, :n_values]
+            else:
+                values = [values[n][:n_values] for n in buildings]
+            resolution = RESOLUTIONS.get(quantity, self.resolution)
+            digest.update(quantity.encode())
+            digest.update(_quantise(values, resolution).tobytes())
+
+        if init_val is not None:
+            soc = [init_val["soc"][n]["tes"] for n in buildings]
+            digest.update(_quantise(soc, self.soc_resolution).tobytes())
+
+        if not isinstance(buildings, BuildingTable):
+            buildings = BuildingTable.from_dict(buildings)
+        digest.update(buildings.ids.tobytes())
+        for name in sorted(buildings.columns):
+            digest.update(buildings.columns[name].tobytes())
+        digest.update(json.dumps(param_mpc, sort_keys=True,
+                                 default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Cached plan of a key.
+
+        Returns:
+            copy of the MPCResult with 'cache_hit' in its info, or None
+        """
+        res = self._plans.get(key)
+        if res is None:
+            self.n_misses += 1
+            return None
+        self._plans.move_to_end(key)
+        self.n_hits += 1
+        return _copy(res)
+
+    def store(self, key, res):
+        """Cache a plan, only optimal plans are kept"""
+        if res is None or res.status != OPTIMAL:
+            return
+        self._plans[key] = res
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+            self.n_evictions += 1
+
+    def clear(self):
+        self._plans.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.n_hits + self.n_misses
+        return self.n_hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {"size": len(self._plans),
+                "hits": self.n_hits,
+                "misses": self.n_misses,
+                "evictions": self.n_evictions,
+                "hit_rate": self.hit_rate}
+
+
+def _quantise(values, resolution):
+    return np.round(np.asarray(values, dtype=float) / resolution).astype(
+        np.int64)
+
+
+def _copy(res):
+    """Result sharing the solution of res with an info of its own"""
+    copy = res.shifted(0)
+    copy.info["cache_hit"] = True
+    return copy
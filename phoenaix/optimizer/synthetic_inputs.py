@@ -0,0 +1,119 @@
+"""
+Synthetic neighborhoods and forecasts for the MPC benchmarks and tests.
+
+The benchmarks and tests must run without the FIWARE platform and without
+the LFS-tracked input data, so buildings and demands are generated here with
+the same structure as MPC.load_buildings and the forecasts of
+BuildingEnergyForecast.
+"""
+import numpy as np
+from phoenaix.optimizer.buildings import BuildingTable
+
+# heater types of the five buildings of the demonstrator, repeated for
+# larger neighborhoods
+HEATERS = ("boi", "hp", "hp", "hp", "boi")
+
+
+def mpc_params():
+    """Same values as MPC.load_mpc_params"""
+    param_mpc = {}
+    param_mpc["eco"] = {}
+    param_mpc["gp"] = {}
+    param_mpc["eco"]["sell_pv"] = 0.082
+    param_mpc["eco"]["el_grid"] = 0.42
+    param_mpc["eco"]["gas"] = 0.134
+    param_mpc["gp"]["mip_gap"] = 0.01
+    param_mpc["gp"]["time_limit"] = 100
+    param_mpc["gp"]["numeric_focus"] = 3
+    return param_mpc
+
+
+def make_buildings(n_buildings: int = 5):
+    """Device parameters in the format of MPC.load_buildings"""
+    devs = {}
+    for n in range(n_buildings):
+        heater = HEATERS[n % len(HEATERS)]
+        is_mfh = n % len(HEATERS) == len(HEATERS) - 1
+        design_heat = 30000.0 if is_mfh else 9000.0 + 500.0 * (n % 3)
+
+        devs[n] = {}
+        devs[n]["boi"] = dict(cap=0.0, eta_th=0.97)
+        devs[n]["hp"] = dict(cap=0.0, dT_max=15, exists=0, mod_lvl=1)
+        devs[n]["eh"] = dict(cap=0.0)
+        devs[n]["tes"] = dict(cap=0.0, dT_max=35, min_soc=0.0,
+                              eta_tes=0.98, eta_ch=1, eta_dch=1)
+
+        if heater == "boi":
+            devs[n]["boi"]["cap"] = design_heat
+            devs[n]["eh"]["cap"] = 0.0 if is_mfh else 2000.0
+        else:
+            devs[n]["hp"]["cap"] = design_heat
+            devs[n]["eh"]["cap"] = 2000.0
+            devs[n]["tes"]["cap"] = 12000.0
+    return devs
+
+
+def make_building_table(n_buildings: int = 5):
+    """Device parameters of make_buildings as buildings.BuildingTable"""
+    return BuildingTable.from_dict(make_buildings(n_buildings))
+
+
+def make_profiles(buildings: dict,
+                  n_steps: int,
+                  seed: int = 0):
+    """
+    Hourly demand and PV profiles of all buildings.
+
+    Returns:
+        dict with arrays of shape (building, n_steps) for every quantity of
+        the MPC input
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(n_steps)
+    daily = np.sin(2 * np.pi * hours / 24 - np.pi / 2)
+    winter = 0.5 * (1 + np.cos(2 * np.pi * hours / 8760))
+    sun = np.clip(np.sin(2 * np.pi * (hours - 6) / 24), 0, None) * \
+        (1.2 - winter)
+
+    profiles = {key: [] for key in ("elec", "heating", "cooling", "dhw",
+                                    "pv_power")}
+    for n in buildings:
+        design_heat = max(buildings[n]["boi"]["cap"], buildings[n]["hp"]["cap"])
+        noise = rng.normal(0, 0.05, size=(4, n_steps))
+        profiles["heating"].append(
+            design_heat * np.clip(0.45 * winter + 0.1 * daily + noise[0], 0, 0.65))
+        profiles["dhw"].append(
+            1500 * np.clip(0.3 + 0.3 * daily + noise[1], 0, None))
+        profiles["elec"].append(
+            800 * np.clip(0.6 + 0.4 * daily + noise[2], 0.1, None))
+        profiles["cooling"].append(np.zeros(n_steps))
+        profiles["pv_power"].append(
+            5000 * np.clip(sun + noise[3], 0, None))
+
+    return {key: np.array(values) for key, values in profiles.items()}
+
+
+def horizon(profiles: dict,
+            start: int,
+            n_horizon: int,
+            as_arrays: bool = False):
+    """
+    Cut one forecast horizon in the input format of MPC.predict, as arrays
+    of shape (building, time) if as_arrays is set
+    """
+    if as_arrays:
+        return {key: values[:, start:start + n_horizon]
+                for key, values in profiles.items()}
+    demands_and_pv = {}
+    for key, values in profiles.items():
+        demands_and_pv[key] = {
+            n: list(values[n, start:start + n_horizon])
+            for n in range(values.shape[0])}
+    return demands_and_pv
+
+
+def soc_init_from_results(res):
+    """Initial SOCs of the next step from the first step of an MPCResult"""
+    if res is None:
+        return None
+    return {'soc': {n: {'tes': res.tes_soc(n)} for n in res.building_ids}}
@@ -0,0 +1,88 @@
+"""
+Non-uniform time grid of the MPC horizon (move blocking).
+
+The central problem has one set of variables per time step, so a longer
+look-ahead with hourly steps grows the MILP linearly. A TimeGrid keeps fine
+steps near the present and merges later hours into coarse blocks, e.g.
+12 steps of 1 h, 6 of 2 h and 6 of 8 h look 72 h ahead with 24 steps. The
+hourly forecasts are averaged over every block, powers stay in W, and all
+energies, costs and storage losses of a step are scaled by its duration.
+"""
+import numpy as np
+from phoenaix.optimizer.formulation import DT
+
+
+class TimeGrid:
+    """
+    Durations of the steps of an MPC horizon.
+
+    Args:
+        durations: duration of every step in hours, whole multiples of the
+            forecast resolution DT
+    """
+
+    def __init__(self, durations):
+        self.durations = np.asarray(durations, dtype=float)
+        n_values = self.durations / DT
+        if np.any(n_values < 1) or \
+                np.any(np.abs(n_values - np.round(n_values)) > 1e-9):
+            raise ValueError("Step durations must be whole multiples of "
+                             f"DT = {DT} h")
+        self._n_values = np.round(n_values).astype(int)
+        # first forecast value of every step
+        self._starts = np.concatenate([[0], np.cumsum(self._n_values)[:-1]])
+
+    @classmethod
+    def uniform(cls, n_horizon: int, duration: float = DT):
+        """n_horizon steps of the same duration"""
+        return cls(np.full(n_horizon, duration))
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """
+        Grid from a list of (number of steps, duration in hours), e.g.
+        [(12, 1), (6, 2), (6, 8)]
+        """
+        return cls(np.concatenate([np.full(int(n_steps), duration, dtype=float)
+                                   for n_steps, duration in blocks]))
+
+    @property
+    def n_steps(self) -> int:
+        return self.durations.size
+
+    @property
+    def n_values(self) -> int:
+        """Number of forecast values the grid covers"""
+        return int(self._n_values.sum())
+
+    @property
+    def hours(self) -> float:
+        """Length of the horizon in hours"""
+        return float(self.durations.sum())
+
+    @property
+    def is_uniform(self) -> bool:
+        return bool(np.all(self.durations == DT))
+
+    @property
+    def n_fine(self) -> int:
+        """Number of leading steps of duration DT"""
+        coarse = np.flatnonzero(self.durations != DT)
+        return int(coarse[0]) if coarse.size else self.n_steps
+
+    def aggregate(self, values) -> np.ndarray:
+        """
+        Mean of the forecast values within every step.
+
+        Args:
+            values: array of shape (..., n_values)
+
+        Returns:
+            array of shape (..., n_steps)
+        """
+        values = np.asarray(values, dtype=float)[..., :self.n_values]
+        return np.add.reduceat(values, self._starts, axis=-1) / self._n_values
+
+    def expand(self, values) -> np.ndarray:
+        """Values of every step repeated for all forecast values it covers"""
+        return np.repeat(np.asarray(values), self._n_values, axis=-1)
@@ -4,6 +4,7 @@ from dotenv import find_dotenv
 from filip.models.base import FiwareHeader
 from phoenaix.config import ROOT_DIR
 from pathlib import Path
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -27,6 +28,49 @@ class Settings(BaseSettings):
     NORM_POWER: int = Field(env='NORM_POWER')
     CYCLE_TIME: int = Field(env='CYCLE_TIME')
 
+    # Neighborhood settings, ids of all buildings (rows of Devs.xlsx) and of
+    # the buildings with a house model 'haus_<id>' in the FMU that follow
+    # the heat pump setpoints of the MPC
+    BUILDING_IDS: List[int] = Field(env='BUILDING_IDS',
+                                    default=[0, 1, 2, 3, 4])
+    FMU_BUILDING_IDS: List[int] = Field(env='FMU_BUILDING_IDS',
+                                        default=[1, 2, 3])
+
+    # Non-uniform time grid of the MPC as [[number of steps, hours], ...],
+    # e.g. [[12, 1], [6, 2], [6, 8]], see optimizer/time_grid.py. It may
+    # not cover more hours than N_HORIZON. Hourly steps if not set.
+    TIME_GRID: Optional[List[List[float]]] = Field(env='TIME_GRID',
+                                                   default=None)
+
+    # Number of gurobi solves at the same time of all MPCs in the process,
+    # the cores are split evenly among them, see optimizer/env_pool.py
+    MAX_CONCURRENT_SOLVES: int = Field(env='MAX_CONCURRENT_SOLVES',
+                                       default=1)
+
+    # Seconds after the start of a cycle after which the MPC stops waiting
+    # for the forecast of a building and uses its last one, for all
+    # buildings and per building id. Wait without limit if not set.
+    FORECAST_DEADLINE: Optional[float] = Field(env='FORECAST_DEADLINE',
+                                               default=None)
+    FORECAST_DEADLINES: Dict[int, float] = Field(env='FORECAST_DEADLINES',
+                                                 default={})
+
+    # File of an explicit MPC policy saved by ExplicitPolicy.save, see
+    # optimizer/explicit_policy.py. The problem is solved in every step if
+    # not set.
+    EXPLICIT_POLICY: Optional[str] = Field(env='EXPLICIT_POLICY',
+                                           default=None)
+
+    # Rule-based controller of the MPC, see optimizer/rule_based.py:
+    # 'primary' instead of the optimization, 'fallback' if the solve fails
+    # and no earlier plan is left. Not used if not set.
+    RULE_BASED: Optional[str] = Field(env='RULE_BASED', default=None)
+
+    # Hourly steps of the tracking problem of the two-level MPC, which plans
+    # the full horizon (on TIME_GRID if set) only once a day, see
+    # optimizer/hierarchical.py. Single-level MPC if not set.
+    SHORT_HORIZON: Optional[int] = Field(env='SHORT_HORIZON', default=None)
+
     @property
     def fiware_header(self):
         return FiwareHeader(service=self.SCENARIO_NAME.strip().lower(),
@@ -0,0 +1,139 @@
+"""
+On-disk cache of extracted FMUs and their model descriptions.
+
+fmpy.extract unzips the whole FMU into a new temporary directory and
+fmpy.read_model_description parses its modelDescription.xml, on every
+FMUHandler.initialize, i.e. on every start of an agent and every run of a
+parameter study. Both only depend on the content of the FMU file. An FMU
+is extracted once into CACHE_DIR/<hash of the file>, next to a pickle of
+its model description, and every later start of any process reuses them.
+The hash is computed once per process and file version (path, size and
+modification time).
+
+The cache holds binaries that are loaded and pickles that are unpickled,
+so whoever can write to it can run code in every agent. It lives in the
+home directory of the user, and a cache directory that belongs to another
+user or that others may write to is refused. The pickles are kept per
+fmpy version and anything that fails to unpickle is parsed again.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import threading
+from pathlib import Path
+import fmpy
+
+# Default location of the extracted FMUs, private to the user
+CACHE_DIR = Path.home() / '.cache' / 'phoenaix'
+# Bytes read at once while hashing an FMU
+CHUNK_SIZE = 2 ** 20
+# a pickled ModelDescription only fits the fmpy version that wrote it
+MODEL_DESCRIPTION_FILE = f'model_description-{fmpy.__version__}.pkl'
+
+_lock = threading.Lock()
+# hashes by (path, size, modification time) and model descriptions by hash
+_digests = {}
+_model_descriptions = {}
+
+
+def fmu_digest(fmu_path) -> str:
+    """Hash of the content of an FMU file"""
+    path = Path(fmu_path).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        digest = _digests.get(key)
+    if digest is None:
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with _lock:
+            _digests[key] = digest
+    return digest
+
+
+def cache_root(cache_dir=CACHE_DIR) -> Path:
+    """
+    The cache directory, created accessible to the user only.
+
+    Raises:
+        PermissionError: if the directory belongs to another user or is
+            writable by others
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        # no POSIX owners and modes, e.g. on Windows
+        return cache_dir
+    info = cache_dir.stat()
+    if info.st_uid != os.getuid():
+        raise PermissionError(f'FMU cache {cache_dir} belongs to another '
+                              f'user')
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f'FMU cache {cache_dir} is writable by other '
+                              f'users')
+    return cache_dir
+
+
+def extract_fmu(fmu_path, cache_dir=CACHE_DIR) -> str:
+    """
+    Directory with the extracted FMU, extracted on the first call for its
+    content.
+
+    Returns:
+        path of the directory, which must not be removed by the caller
+    """
+    unzipdir = cache_root(cache_dir) / fmu_digest(fmu_path)
+    if unzipdir.is_dir():
+        return str(unzipdir)
+    # extract next to the target and rename, so that other processes never
+    # see a partly extracted FMU
+    tmpdir = tempfile.mkdtemp(dir=unzipdir.parent)
+    fmpy.extract(str(fmu_path), unzipdir=tmpdir)
+    try:
+        os.rename(tmpdir, unzipdir)
+    except OSError:
+        # extracted by another process in the meantime
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return str(unzipdir)
+
+
+def read_model_description(fmu_path, cache_dir=CACHE_DIR):
+    """
+    Model description of an FMU, parsed on the first call for its content
+    and unpickled from the cache afterwards.
+    """
+    digest = fmu_digest(fmu_path)
+    with _lock:
+        model_description = _model_descriptions.get(digest)
+    if model_description is not None:
+        return model_description
+
+    path = cache_root(cache_dir) / digest / MODEL_DESCRIPTION_FILE
+    try:
+        with open(path, 'rb') as f:
+            model_description = pickle.load(f)
+    except Exception:
+        # missing, truncated or written by an incompatible version
+        model_description = fmpy.read_model_description(
+            extract_fmu(fmu_path, cache_dir))
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(model_description, f)
+        os.replace(tmp_path, path)
+
+    with _lock:
+        _model_descriptions[digest] = model_description
+    return model_description
+
+
+def clear_memory():
+    """Forget the hashes and model descriptions held in this process"""
+    with _lock:
+        _digests.clear()
+        _model_descriptions.clear()
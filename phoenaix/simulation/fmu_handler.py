@@ -1,13 +1,144 @@
-import copy
 import shutil
+from ctypes import byref
 from typing import Union
+import numpy as np
 import fmpy
 import fmpy.fmi2
+from fmpy.fmi2 import \
+    fmi2Boolean, \
+    fmi2Integer, \
+    fmi2Real, \
+    fmi2ValueReference
+from phoenaix.simulation import fmu_cache
+
+# Handling of the FMU state between two steps
+# - the FMU keeps its state, nothing is saved
+STATE_NONE = "none"
+# - serialized after every step and restored from the bytes before the next
+STATE_SERIALIZED = "serialized"
+# - one native state handle, overwritten after every step and serialized
+#   only by checkpoint
+STATE_NATIVE = "native"
+STATE_MODES = (STATE_NONE, STATE_SERIALIZED, STATE_NATIVE)
+
+# FMI type of the values of every variable type
+VALUE_TYPES = {"Real": "Real",
+               "Integer": "Integer",
+               "Enumeration": "Integer",
+               "Boolean": "Boolean"}
+C_TYPES = {"Real": fmi2Real,
+           "Integer": fmi2Integer,
+           "Boolean": fmi2Boolean}
+
+
+def _value_type(variable):
+    if variable.type not in VALUE_TYPES:
+        raise Exception("Unsupported type: %s" % variable.type)
+    return VALUE_TYPES[variable.type]
+
+
+class IOPlan:
+    """
+    Reads and writes a fixed list of variables with one call of the FMU per
+    value type.
+
+    The value references of every type and the buffers of their values are
+    built once, see FMUHandler.io_plan. A plan belongs to one instance of
+    the FMU and is invalid after FMUHandler.initialize.
+
+    Args:
+        fmu: instantiated fmpy.fmi2.FMU2Slave
+        variables: model variables by name
+        names: names of the variables of the plan
+    """
+
+    def __init__(self, fmu, variables: dict, names: list):
+        self.fmu = fmu
+        self.names = list(names)
+        positions = {}
+        for i, name in enumerate(self.names):
+            value_type = _value_type(variables[name])
+            positions.setdefault(value_type, []).append(i)
+
+        # value type, positions in names, value references, value buffer
+        # and a NumPy view of it, getter and setter of the FMU
+        self._groups = []
+        for value_type, group in positions.items():
+            n_values = len(group)
+            vrs = (fmi2ValueReference * n_values)(
+                *[variables[self.names[i]].valueReference for i in group])
+            buffer = (C_TYPES[value_type] * n_values)()
+            self._groups.append((value_type,
+                                 np.array(group),
+                                 vrs,
+                                 buffer,
+                                 np.ctypeslib.as_array(buffer),
+                                 getattr(fmu, f"fmi2Get{value_type}"),
+                                 getattr(fmu, f"fmi2Set{value_type}")))
+
+    def __len__(self):
+        return len(self.names)
+
+    def read(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Values of all variables in the order of names.
+
+        Args:
+            out: array of shape (len(names),) to write the values to
+        """
+        values = np.empty(len(self.names)) if out is None else out
+        for _, group, vrs, buffer, view, get, _ in self._groups:
+            get(self.fmu.component, vrs, len(vrs), buffer)
+            values[group] = view
+        return values
+
+    def read_dict(self) -> dict:
+        """Values by name, as int and bool for Integer and Boolean"""
+        values = {}
+        for value_type, group, vrs, buffer, view, get, _ in self._groups:
+            get(self.fmu.component, vrs, len(vrs), buffer)
+            group_values = view.tolist()
+            if value_type == "Boolean":
+                group_values = [value != 0 for value in group_values]
+            values.update(zip((self.names[i] for i in group), group_values))
+        return {name: values[name] for name in self.names}
+
+    def write(self, values):
+        """
+        Set all variables.
+
+        Args:
+            values: sequence in the order of names, Booleans are True for
+                1, True and "True"
+        """
+        if any(isinstance(value, str) for value in values):
+            values = [value == "True" if value in ("True", "False") else value
+                      for value in values]
+        values = np.asarray(values, dtype=float)
+        for value_type, group, vrs, buffer, view, _, set_ in self._groups:
+            group_values = values[group]
+            if value_type == "Boolean":
+                view[:] = group_values == 1.0
+            elif value_type == "Integer":
+                view[:] = group_values.astype(int)
+            else:
+                view[:] = group_values
+            set_(self.fmu.component, vrs, len(vrs), buffer)
 
 
 class FMUHandler:
     """
     The fmu handler class
+
+    Args:
+        use_local: keep the state only in the FMU, the same as
+            state_mode=STATE_NONE
+        state_mode: one of STATE_MODES, STATE_SERIALIZED or STATE_NONE
+            depending on use_local if None
+        cache_dir: directory of the extracted FMUs and model descriptions,
+            see fmu_cache.py. None to extract into a temporary directory
+            that is removed with the instance.
+        instance_name: name of the FMU instance, e.g. of a scenario
     """
 
     def __init__(self,
@@ -15,45 +146,84 @@ class FMUHandler:
                  step_size,
                  tolerance=0.0001,
                  use_local=False,
-                 init_values=None):
+                 init_values=None,
+                 state_mode=None,
+                 cache_dir=fmu_cache.CACHE_DIR,
+                 instance_name=__name__):
         self.fmu_path = fmu_path
         self.step_size = step_size
         self.use_local = use_local
         self.tolerance = tolerance
+        if state_mode is None:
+            state_mode = STATE_NONE if use_local else STATE_SERIALIZED
+        if state_mode not in STATE_MODES:
+            raise ValueError(f'Unknown state mode {state_mode}, use one of '
+                             f'{STATE_MODES}')
+        self.state_mode = state_mode
+        self.cache_dir = cache_dir
+        self.instance_name = instance_name
 
         self.model_description = None
         self.variables = {}
         self.unzipdir = None
         self.fmu = None
+        # value type and reference of every variable, by name
+        self._refs = {}
+        # IOPlans by tuple of names and results of find_vars by arguments
+        self._plans = {}
+        self._found = {}
+        # serialized state after the last step, STATE_SERIALIZED only
         self.fmu_state = None
+        # native state handle after the last step, STATE_NATIVE only
+        self._state_handle = None
 
         self.current_time = 0
         self.init_values = init_values
 
     def initialize(self):
+        # an existing instance is only reset
+        if self.fmu is not None:
+            self.reset()
+            return
         self.fmu_state = None
-        if self.unzipdir is not None:
-            self.terminate_and_free_instance()
 
         # read the model description
-        self.model_description = fmpy.read_model_description(self.fmu_path)
+        if self.cache_dir is None:
+            self.model_description = fmpy.read_model_description(
+                self.fmu_path)
+        else:
+            self.model_description = fmu_cache.read_model_description(
+                self.fmu_path, self.cache_dir)
 
         # Collect all variables
         self.variables = {}
+        self._refs = {}
         for variable in self.model_description.modelVariables:
             self.variables[variable.name] = variable
+            if variable.type in VALUE_TYPES:
+                self._refs[variable.name] = (VALUE_TYPES[variable.type],
+                                             [variable.valueReference])
+        self._plans = {}
+        self._found = {}
 
         # extract the FMU
-        self.unzipdir = fmpy.extract(self.fmu_path)
+        if self.cache_dir is None:
+            self.unzipdir = fmpy.extract(self.fmu_path)
+        else:
+            self.unzipdir = fmu_cache.extract_fmu(self.fmu_path,
+                                                  self.cache_dir)
 
         # create fmu obj
         self.fmu = fmpy.fmi2.FMU2Slave(guid=self.model_description.guid,
                                        unzipDirectory=self.unzipdir,
                                        modelIdentifier=self.model_description.coSimulation.modelIdentifier,
-                                       instanceName=__name__)
+                                       instanceName=self.instance_name)
 
         # instantiate fmu
         self.fmu.instantiate()
+        self._setup_experiment()
+
+    def _setup_experiment(self):
         self.fmu.setupExperiment(startTime=0,
                                  tolerance=self.tolerance)
 
@@ -64,6 +234,17 @@ class FMUHandler:
             self.set_values(self.init_values)
             print('Values set')
 
+    def reset(self):
+        """
+        Set the instance back to the start of the simulation with
+        fmi2Reset, without instantiating the FMU again.
+        """
+        self._free_state()
+        self.fmu_state = None
+        self.fmu.reset()
+        self.current_time = 0
+        self._setup_experiment()
+
     def find_vars(self, 
                   find_str: Union[str, list], 
                   exclude_str: Union[str, list] = None):
@@ -78,50 +259,64 @@ class FMUHandler:
 
         if isinstance(exclude_str, str):
             exclude_str = [exclude_str]
-        key = list(self.variables.keys())
-        key_list = []
-        for i in range(len(key)):
-            all_included = all(j in key[i] for j in find_str)
-            any_excluded = any(j in key[i] for j in exclude_str)
-            if all_included and not any_excluded:
-                key_list.append(key[i])
 
-        return key_list
+        # the variables do not change until the next initialize
+        key = ("find", tuple(find_str), tuple(exclude_str))
+        if key not in self._found:
+            self._found[key] = [
+                name for name in self.variables
+                if all(j in name for j in find_str)
+                and not any(j in name for j in exclude_str)]
+        return list(self._found[key])
 
     def find_vars_end(self, end_str: str):
         """
         Retruns all variables ending with start_str
         """
-        key = list(self.variables.keys())
-        key_list = []
-        for i in range(len(key)):
-            if key[i].endswith(end_str):
-                key_list.append(key[i])
-        return key_list
+        key = ("end", end_str)
+        if key not in self._found:
+            self._found[key] = [name for name in self.variables
+                                if name.endswith(end_str)]
+        return list(self._found[key])
+
+    def io_plan(self, names) -> IOPlan:
+        """
+        IOPlan of the variables names, built on the first call for these
+        names.
+        """
+        names = tuple(names)
+        plan = self._plans.get(names)
+        if plan is None:
+            plan = IOPlan(fmu=self.fmu,
+                          variables=self.variables,
+                          names=names)
+            self._plans[names] = plan
+        return plan
 
     def get_value(self, var_name: str):
         """
         Get a single variable.
         """
+        if var_name not in self._refs:
+            raise Exception("Unsupported type: %s"
+                            % self.variables[var_name].type)
+        value_type, vr = self._refs[var_name]
 
-        variable = self.variables[var_name]
-        vr = [variable.valueReference]
-
-        if variable.type == 'Real':
+        if value_type == 'Real':
             return self.fmu.getReal(vr)[0]
-        elif variable.type in ['Integer', 'Enumeration']:
+        elif value_type == 'Integer':
             return self.fmu.getInteger(vr)[0]
-        elif variable.type == 'Boolean':
+        else:
             value = self.fmu.getBoolean(vr)[0]
             return value != 0
-        else:
-            raise Exception("Unsupported type: %s" % variable.type)
 
     def set_values(self, var_val_dict):
         if var_val_dict is None:
             return
-        for var, val in var_val_dict.items():
-            self.set_value(var, val)
+        values = {var: val for var, val in var_val_dict.items()
+                  if val is not None}
+        if values:
+            self.io_plan(values).write(list(values.values()))
 
     def set_value(self, var_name, value):
         """
@@ -130,21 +325,20 @@ class FMUHandler:
         """
         if value is None:
             return
+        if var_name not in self._refs:
+            raise Exception("Unsupported type: %s"
+                            % self.variables[var_name].type)
+        value_type, vr = self._refs[var_name]
 
-        variable = self.variables[var_name]
-        vr = [variable.valueReference]
-
-        if variable.type == 'Real':
+        if value_type == 'Real':
             self.fmu.setReal(vr, [float(value)])
-        elif variable.type in ['Integer', 'Enumeration']:
+        elif value_type == 'Integer':
             self.fmu.setInteger(vr, [int(value)])
-        elif variable.type == 'Boolean':
-            self.fmu.setBoolean(vr, [value == 1.0 or value == True or value == "True"])
         else:
-            raise Exception("Unsupported type: %s" % variable.type)
+            self.fmu.setBoolean(vr, [value == 1.0 or value == True or value == "True"])
 
     def do_step(self, set_var_dict):
-        if not self.use_local and self.fmu_state is not None:
+        if self.state_mode == STATE_SERIALIZED and self.fmu_state is not None:
             fmu_state = self.fmu.deserializeFMUState(self.fmu_state)
             self.fmu.setFMUState(fmu_state)
             self.fmu.freeFMUState(fmu_state)
@@ -155,16 +349,153 @@ class FMUHandler:
             communicationStepSize=self.step_size)
         # augment current time step
 
-        if not self.use_local:
-            fmu_state = copy.deepcopy(self.fmu.serializeFMUstate(self.fmu.getFMUState()))
+        if self.state_mode == STATE_SERIALIZED:
+            fmu_state = self.fmu.getFMUState()
+            self.fmu_state = self.fmu.serializeFMUState(fmu_state)
+            self.fmu.freeFMUState(fmu_state)
+            return self.fmu_state
+        if self.state_mode == STATE_NATIVE:
+            self._save_state()
+        return None
+
+    def simulate_trajectory(self,
+                            inputs: np.ndarray,
+                            outputs: list,
+                            input_names: list = None,
+                            n_substeps: int = 1,
+                            every_substep: bool = False) -> np.ndarray:
+        """
+        Simulate a whole schedule of inputs from the current time on, e.g.
+        for open-loop studies where the inputs are known in advance.
+
+        The inputs of a step are held over its step_size, which may be
+        divided into n_substeps communication steps of the FMU. The state
+        handling of do_step is done once at the end, not after every step,
+        and current_time is advanced to the end of the schedule.
+
+        Args:
+            inputs: values of shape (step, input), or a structured array
+                with one field per input as for fmpy.simulate_fmu, a field
+                'time' is ignored
+            outputs: names of the variables to return
+            input_names: names of the columns of a plain array
+            n_substeps: communication steps per step
+            every_substep: return the outputs after every substep instead
+                of after every step
+
+        Returns:
+            array of shape (step, output), or (step * n_substeps, output)
+            if every_substep is set
+        """
+        if inputs.dtype.names is not None:
+            input_names = [name for name in inputs.dtype.names
+                           if name != 'time']
+            inputs = np.stack([inputs[name].astype(float)
+                               for name in input_names], axis=-1)
+        elif input_names is None:
+            raise ValueError('input_names are needed for a plain array of '
+                             'inputs')
+        inputs = np.asarray(inputs, dtype=float).reshape(len(inputs), -1)
+        if inputs.shape[1] != len(input_names):
+            raise ValueError(f'{inputs.shape[1]} input columns for '
+                             f'{len(input_names)} input names')
+        if n_substeps < 1:
+            raise ValueError('n_substeps must be at least 1')
+
+        input_plan = self.io_plan(input_names)
+        output_plan = self.io_plan(outputs)
+        n_rows = len(inputs) * (n_substeps if every_substep else 1)
+        results = np.empty((n_rows, len(outputs)))
+
+        if self.state_mode == STATE_SERIALIZED and self.fmu_state is not None:
+            fmu_state = self.fmu.deserializeFMUState(self.fmu_state)
+            self.fmu.setFMUState(fmu_state)
+            self.fmu.freeFMUState(fmu_state)
+
+        do_step = self.fmu.doStep
+        write = input_plan.write
+        read = output_plan.read
+        h = self.step_size / n_substeps
+        start_time = self.current_time
+        row = 0
+        for step, values in enumerate(inputs):
+            write(values)
+            step_time = start_time + step * self.step_size
+            for substep in range(n_substeps):
+                do_step(currentCommunicationPoint=step_time + substep * h,
+                        communicationStepSize=h)
+                if every_substep:
+                    read(results[row])
+                    row += 1
+            if not every_substep:
+                read(results[row])
+                row += 1
+        self.current_time = start_time + len(inputs) * self.step_size
+
+        if self.state_mode == STATE_SERIALIZED:
+            fmu_state = self.fmu.getFMUState()
+            self.fmu_state = self.fmu.serializeFMUState(fmu_state)
+            self.fmu.freeFMUState(fmu_state)
+        elif self.state_mode == STATE_NATIVE:
+            self._save_state()
+        return results
+
+    def _save_state(self):
+        if self._state_handle is None:
+            self._state_handle = self.fmu.getFMUState()
         else:
-            fmu_state = None
-        return fmu_state
+            # the FMU overwrites an existing state instead of allocating one
+            self.fmu.fmi2GetFMUstate(self.fmu.component,
+                                     byref(self._state_handle))
+
+    def _free_state(self):
+        if self._state_handle is not None:
+            self.fmu.freeFMUState(self._state_handle)
+            self._state_handle = None
+
+    def rollback(self):
+        """
+        Set the FMU back to its state after the last step, e.g. after
+        trying out inputs. STATE_NATIVE only.
+        """
+        if self.state_mode != STATE_NATIVE:
+            raise RuntimeError(f'Rollback needs the state mode '
+                               f'{STATE_NATIVE}, not {self.state_mode}')
+        if self._state_handle is not None:
+            self.fmu.setFMUState(self._state_handle)
+
+    def checkpoint(self) -> dict:
+        """
+        Serialized state of the FMU and the simulation time, which restore
+        sets again in this or in a new instance of the same FMU.
+        """
+        fmu_state = self.fmu.getFMUState()
+        try:
+            state = self.fmu.serializeFMUState(fmu_state)
+        finally:
+            self.fmu.freeFMUState(fmu_state)
+        return {"time": self.current_time, "state": state}
+
+    def restore(self, checkpoint: dict):
+        """Set the FMU to a state of checkpoint"""
+        fmu_state = self.fmu.deserializeFMUState(checkpoint["state"])
+        self.fmu.setFMUState(fmu_state)
+        self.fmu.freeFMUState(fmu_state)
+        self.current_time = checkpoint["time"]
+        if self.state_mode == STATE_SERIALIZED:
+            self.fmu_state = checkpoint["state"]
+        elif self.state_mode == STATE_NATIVE:
+            self._save_state()
 
     def terminate_and_free_instance(self):
+        self._free_state()
         self.fmu.terminate()
         self.fmu.freeInstance()
-        shutil.rmtree(self.unzipdir, ignore_errors=True)
+        self.fmu = None
+        # the cached extraction is shared with other instances
+        if self.cache_dir is None:
+            shutil.rmtree(self.unzipdir, ignore_errors=True)
+        self.unzipdir = None
 
     def read_variables(self, vrs_list: list):
         """
@@ -172,10 +503,8 @@ class FMUHandler:
         vrs_list as list of strings
         Method retruns a dict with FMU variable names as key
         """
-        res = {}
         # read current variable values ans store in dict
-        for var in vrs_list:
-            res[var] = self.get_value(var)
+        res = self.io_plan(vrs_list).read_dict()
 
         # add current time to results
         res['SimTime'] = self.current_time
@@ -187,9 +516,7 @@ class FMUHandler:
         Sets multiple variables.
         var_dict is a dict with variable names in keys.
         '''
-
-        for key in var_dict:
-            self.set_value(key, var_dict[key])
+        self.set_values(var_dict)
         return "Variable set!!"
 
     def __enter__(self):
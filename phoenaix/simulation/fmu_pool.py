@@ -0,0 +1,217 @@
+"""
+Many scenarios of the FMU simulated in lock-step on all cores.
+
+The ModelicaAgent owns a single FMU instance, so every scenario of a study
+(building parameters, prices, forecast errors) used to need a pipeline of
+its own. FMUPool runs one FMU instance per scenario in a set of worker
+processes. Every instance has its own extracted copy of the FMU, because
+the binaries of many FMUs keep global state that instances in the same
+process would share. All scenarios advance by one step per call of step:
+the inputs of all scenarios go out as one array per worker, the outputs
+come back as one array.
+"""
+import multiprocessing
+import os
+import time
+import traceback
+import numpy as np
+from phoenaix.simulation.fmu_handler import \
+    FMUHandler, \
+    STATE_NONE
+
+# Seconds to wait for a worker to exit on close
+JOIN_TIMEOUT = 10.0
+
+
+def _worker_main(conn, fmu_path, step_size, tolerance, scenarios, inputs,
+                 outputs):
+    """
+    Loop of a worker process, answers every command on conn with
+    ("ok", result) or ("error", traceback).
+
+    Args:
+        scenarios: index and initial values of the scenarios of the worker
+    """
+    handlers = []
+    try:
+        for index, init_values in scenarios:
+            # an extracted copy of its own for every instance
+            handler = FMUHandler(fmu_path=fmu_path,
+                                 step_size=step_size,
+                                 tolerance=tolerance,
+                                 init_values=init_values,
+                                 state_mode=STATE_NONE,
+                                 cache_dir=None,
+                                 instance_name=f'scenario{index}')
+            handler.initialize()
+            handlers.append(handler)
+        output_plans = [handler.io_plan(outputs) for handler in handlers]
+        conn.send(("ok", None))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        return
+
+    while True:
+        command, payload = conn.recv()
+        try:
+            if command == "step":
+                for handler, values in zip(handlers, payload):
+                    handler.do_step(dict(zip(inputs, values.tolist())))
+                    handler.current_time += step_size
+                result = np.array([plan.read() for plan in output_plans])
+            elif command == "reset":
+                for handler in handlers:
+                    handler.reset()
+                result = None
+            elif command == "close":
+                for handler in handlers:
+                    handler.terminate_and_free_instance()
+                conn.send(("ok", None))
+                return
+            else:
+                raise ValueError(f'Unknown command {command}')
+            conn.send(("ok", result))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class FMUPool:
+    """
+    Worker processes with one FMU instance per scenario.
+
+    Args:
+        fmu_path: path of the FMU
+        step_size: communication step size of all instances in s
+        n_scenarios: number of scenarios
+        inputs: names of the variables set in every step
+        outputs: names of the variables returned after every step
+        n_workers: number of worker processes, all cores by default
+        init_values: initial values of every scenario, e.g. its building
+            parameters, list of dicts or None
+        tolerance: tolerance of the FMU solver
+    """
+
+    def __init__(self,
+                 fmu_path,
+                 step_size: float,
+                 n_scenarios: int,
+                 inputs: list,
+                 outputs: list,
+                 n_workers: int = None,
+                 init_values: list = None,
+                 tolerance: float = 0.0001):
+        if n_workers is None:
+            n_workers = os.cpu_count()
+        self.n_workers = max(1, min(n_workers, n_scenarios))
+        self.n_scenarios = n_scenarios
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        if init_values is None:
+            init_values = [None] * n_scenarios
+        if len(init_values) != n_scenarios:
+            raise ValueError(f'{len(init_values)} initial values for '
+                             f'{n_scenarios} scenarios')
+
+        # contiguous blocks of scenarios per worker
+        self._blocks = np.array_split(np.arange(n_scenarios), self.n_workers)
+        self._conns = []
+        self._processes = []
+        for block in self._blocks:
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(child_conn, str(fmu_path), step_size, tolerance,
+                      [(int(i), init_values[i]) for i in block],
+                      self.inputs, self.outputs),
+                daemon=True)
+            process.start()
+            self._conns.append(conn)
+            self._processes.append(process)
+        try:
+            self._gather()
+        except RuntimeError:
+            self.close()
+            raise
+
+        self.n_steps = 0
+        self.step_time = 0.0
+
+    def _gather(self):
+        results = []
+        errors = []
+        for conn in self._conns:
+            status, result = conn.recv()
+            if status == "error":
+                errors.append(result)
+            results.append(result)
+        if errors:
+            raise RuntimeError(f'FMU worker failed:\n{errors[0]}')
+        return results
+
+    def step(self, inputs) -> np.ndarray:
+        """
+        Advance all scenarios by one step.
+
+        Args:
+            inputs: values of the inputs, shape (scenario, input)
+
+        Returns:
+            values of the outputs after the step, shape (scenario, output)
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.shape != (self.n_scenarios, len(self.inputs)):
+            raise ValueError(f'Inputs of shape {inputs.shape}, expected '
+                             f'{(self.n_scenarios, len(self.inputs))}')
+        start_time = time.perf_counter()
+        for conn, block in zip(self._conns, self._blocks):
+            conn.send(("step", inputs[block]))
+        outputs = np.concatenate(self._gather())
+        self.step_time += time.perf_counter() - start_time
+        self.n_steps += 1
+        return outputs
+
+    def run(self, inputs) -> np.ndarray:
+        """
+        Simulate several steps.
+
+        Args:
+            inputs: shape (step, scenario, input)
+
+        Returns:
+            outputs of shape (step, scenario, output)
+        """
+        return np.array([self.step(step_inputs) for step_inputs in inputs])
+
+    def reset(self):
+        """Set all instances back to the start with fmi2Reset"""
+        for conn in self._conns:
+            conn.send(("reset", None))
+        self._gather()
+
+    @property
+    def throughput(self) -> float:
+        """Scenario-steps per second of all calls of step"""
+        if self.step_time == 0.0:
+            return 0.0
+        return self.n_steps * self.n_scenarios / self.step_time
+
+    def close(self):
+        """Free all instances and stop the workers"""
+        for conn, process in zip(self._conns, self._processes):
+            if process.is_alive():
+                try:
+                    conn.send(("close", None))
+                    conn.recv()
+                except (OSError, EOFError):
+                    pass
+            process.join(JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        self._conns = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
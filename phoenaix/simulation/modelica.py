@@ -1,7 +1,8 @@
 from pathlib import Path
 from phoenaix.utils.load_demands import load_demands_and_pv
-import paho.mqtt.client as mqtt
-from phoenaix.simulation.fmu_handler import FMUHandler
+from phoenaix.simulation.fmu_handler import \
+    FMUHandler, \
+    STATE_NATIVE
 import time
 import traceback
 from requests.exceptions import HTTPError
@@ -22,39 +23,38 @@ class ModelicaAgent(Device):
         fmu_path = Path(__file__).parents[2] / 'data' / \
             '01_input' / '05_fmu' / 'DEQ_MVP_FMU.fmu'
         self.offline_modus = offline_modus
+        # the state after every step stays in memory, it is only serialized
+        # on checkpoints
         self.fmu = FMUHandler(fmu_path=fmu_path,
-                              step_size=settings.TIMESTEP)
+                              step_size=settings.TIMESTEP,
+                              state_mode=STATE_NATIVE)
         self.fmu.initialize()
 
-        if not self.offline_modus:
-            self.mqtt_client = mqtt.Client()
-            self.mqtt_client.on_connect = self.on_connect
-            self.mqtt_client.on_message = self.on_message
-            self.mqtt_client.connect(host=settings.MQTT_HOST,
-                                     port=settings.MQTT_PORT)
         self.topic = '/fmu'
+        if not self.offline_modus:
+            self.bus.subscribe(self.topic, self.on_message)
+
+        self.building_ids = list(settings.BUILDING_IDS)
+        # buildings with a house model 'haus_<id>' in the FMU
+        self.fmu_building_ids = list(settings.FMU_BUILDING_IDS)
 
-        self.actual_data = load_demands_and_pv().iloc[::4].copy()
+        # only the heating demands are needed, one column per building
+        self.actual_data = load_demands_and_pv(
+            building_ids=self.building_ids)['heating'].iloc[::4].copy()
         self.max_n = self.actual_data.shape[0]
         self.n = 0
 
         self.attr_translation = {
-            'haus_1.SOC': 'SOC1',
-            'haus_2.SOC': 'SOC2',
-            'haus_3.SOC': 'SOC3'
+            f'haus_{building_id}.SOC': f'SOC{building_id}'
+            for building_id in self.fmu_building_ids
         }
+        self.demand_names = [f'thermalDemand{building_id}'
+                             for building_id in self.building_ids]
 
         self.logger = setup_logger(name=kwargs['entity_id'])
 
         self.attributes = {}
-        for name in ['thermalDemand0',
-                     'thermalDemand1',
-                     'thermalDemand2',
-                     'thermalDemand3',
-                     'thermalDemand4',
-                     'SOC1',
-                     'SOC2',
-                     'SOC3']:
+        for name in self.demand_names + list(self.attr_translation.values()):
             self.attributes[name] = Attribute(
                 device=self,
                 name=name,
@@ -75,20 +75,6 @@ class ModelicaAgent(Device):
             is_array=True
         )
 
-        self.attributes[f'{name}_prev'] = Attribute(
-            device=self,
-            name=f'{name}_prev',
-            initial_value=[None, None, None],
-            is_array=True
-        )
-
-        self.attributes['sinTime'] = Attribute(
-            device=self,
-            name='sinTime',
-            initial_value=[None, None, None],
-            is_array=True
-        )
-
         self.stop_event = kwargs.get('stop_event', None)
         self.current_time = time.perf_counter()
 
@@ -96,35 +82,21 @@ class ModelicaAgent(Device):
         input_dict = {}
 
         mpc_id = 'MPC:DEQ:MVP:000'
-        for name in ['relativePower1',
-                     'relativePower2',
-                     'relativePower3']:
+        for name in [f'relativePower{building_id}'
+                     for building_id in self.fmu_building_ids]:
             attr_value = self.cb_client.get_attribute_value(entity_id=mpc_id,
                                                             attr_name=name)
 
             input_dict[name] = attr_value
         return input_dict
 
-    def on_connect(self, client, userdata, flags, rc):
-        print(f"Connected {self.__class__.__name__} with result code "+str(rc))
-        # Subscribe to the /predict topic
-        client.subscribe(self.topic)
-
     def on_message(self, client, userdata, msg):
         if msg.topic != self.topic:
             return
         self.do_step()
 
     def run(self):
-        if self.stop_event is not None:
-            self.mqtt_client.loop_start()
-            while not self.stop_event.is_set():
-                time.sleep(1)
-            self.mqtt_client.loop_stop()
-
-        else:
-            self.mqtt_client.loop_forever()
-        #self.mqtt_client.loop_forever()
+        self.bus.run(stop_event=self.stop_event)
 
     def _shift_values(self, values, value):
         values[:-1] = values[1:]
@@ -144,7 +116,7 @@ class ModelicaAgent(Device):
             time.sleep(settings.CYCLE_TIME -
                        (time.perf_counter() - self.current_time))
             self.current_time = time.perf_counter()
-            self.mqtt_client.publish('/mpc')
+            self.bus.publish('/mpc')
             return
 
         return input_dict
@@ -154,17 +126,17 @@ class ModelicaAgent(Device):
         if not self.offline_modus:
             input_dict = self._online_pre_do_step()
 
-        for building_ix in range(5):
-            heat_demand = self.actual_data.iloc[self.n][(
-                'heating', building_ix)]
-            input_dict[f'thermalDemand{building_ix}'] = heat_demand
+        heat_demands = self.actual_data.iloc[self.n].to_numpy()
+        input_dict.update(zip(self.demand_names, heat_demands))
 
-        self.fmu.do_step(input_dict)
+        # buildings without a house model in the FMU have no inputs there
+        self.fmu.do_step({name: value for name, value in input_dict.items()
+                          if name in self.fmu.variables})
 
         offline_dict = {}
-        for modelica_variable in self.attr_translation:
-
-            soc = self.fmu.get_value(modelica_variable) / 3600
+        socs = self.fmu.io_plan(self.attr_translation).read() / 3600
+        for modelica_variable, soc in zip(self.attr_translation,
+                                          socs.tolist()):
             attr = self.attributes[self.attr_translation[modelica_variable]]
 
             offline_dict[self.attr_translation[modelica_variable]] = soc
@@ -172,11 +144,7 @@ class ModelicaAgent(Device):
             if not self.offline_modus:
                 attr.push()
 
-        for name in ['thermalDemand0',
-                     'thermalDemand1',
-                     'thermalDemand2',
-                     'thermalDemand3',
-                     'thermalDemand4']:
+        for name in self.demand_names:
             attr = self.attributes[name]
             attr.value = input_dict[name]
             offline_dict[name] = input_dict[name]
@@ -217,7 +185,7 @@ class ModelicaAgent(Device):
             self.logger.info(f'Sleeping {sleep_time}s')
             time.sleep(sleep_time)
         self.current_time = time.perf_counter()
-        self.mqtt_client.publish('/mpc')
+        self.bus.publish('/mpc')
 
 
 if __name__ == '__main__':
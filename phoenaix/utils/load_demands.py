@@ -1,47 +1,56 @@
+import functools
 import pandas as pd
 from phoenaix.config import ROOT_DIR
+from phoenaix.settings import settings
 from pathlib import Path
 
 DEMANDS_PATH = ROOT_DIR / 'data' / '01_input' / '01_demands'
 PV_PATH = ROOT_DIR / 'data' / '01_input' / '04_pv_generation'
 
-def load_demands_and_pv(year=2018):
+# Profiles of the buildings of the demonstrator. Larger neighborhoods reuse
+# them, building n gets the profiles of PROFILE_NAMES[n % 5].
+PROFILE_NAMES = ('SFH_1_0', 'SFH_1_1', 'SFH_1_2', 'SFH_1_3', 'MFH_5_0')
+
+
+@functools.lru_cache(maxsize=None)
+def _read_profile(path):
+    # every profile file is read once per process, even if many buildings
+    # or agents share it
+    return pd.read_csv(path, header=None).iloc[:, 0].to_numpy()
+
+
+def load_demands_and_pv(year=2018, building_ids=None):
+    """
+    Demand and PV profiles in 15 minute steps.
+
+    Args:
+        year: year of the time index
+        building_ids: buildings to load, settings.BUILDING_IDS by default
+
+    Returns:
+        DataFrame with the columns (quantity, building id)
+    """
+    if building_ids is None:
+        building_ids = settings.BUILDING_IDS
     building_id_map = {
-        0: 'SFH_1_0',
-        1: 'SFH_1_1',
-        2: 'SFH_1_2',
-        3: 'SFH_1_3',
-        4: 'MFH_5_0'}
+        _id: PROFILE_NAMES[_id % len(PROFILE_NAMES)] for _id in building_ids}
 
     start_date = f'{year}-01-01 00:00:00'
     end_date = f'{year}-12-31 23:59:59'
 
     # Create the time index with 15-minute intervals
     time_index = pd.date_range(start=start_date, end=end_date, freq='15T')
-    demands = []
+    columns = {}
     for demand in ['cooling', 'dhw', 'elec', 'heating']:
-        dfs = []
         for _id, name in building_id_map.items():
             file_name = f'{demand}_{name}.csv'
-            _df = pd.read_csv(DEMANDS_PATH / file_name, header=None)
-            _df.index = time_index
-            _df.columns = pd.MultiIndex.from_tuples([(demand, _id)])
-            dfs.append(_df)
-
-        df = pd.concat(dfs, axis=1)
-        demands.append(df)
-    
-    demands = pd.concat(demands, axis=1)
+            columns[(demand, _id)] = _read_profile(DEMANDS_PATH / file_name)
 
-    dfs = []
     for _id, name in building_id_map.items():
         file_name = f'decentralPV_{name}.csv'
-        _df = pd.read_csv(PV_PATH / file_name, header=None)
-        _df.index = time_index
-        _df.columns = pd.MultiIndex.from_tuples([('pv_power', _id)])
-        dfs.append(_df)
+        columns[('pv_power', _id)] = _read_profile(PV_PATH / file_name)
 
-    df = pd.concat(dfs, axis=1)
-    demands = pd.concat([demands, df], axis=1)
+    demands = pd.DataFrame(columns, index=time_index)
+    demands.columns = pd.MultiIndex.from_tuples(demands.columns)
 
-    return demands
\ No newline at end of file
+    return demands
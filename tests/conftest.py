@@ -0,0 +1,51 @@
+"""
+Fixtures of the optimizer tests.
+
+The neighborhoods and forecasts are those of optimizer.synthetic_inputs,
+the problems are solved with HiGHS, so no gurobi licence is needed. Tests
+of the gurobi models take gurobi_env and are skipped without a licence,
+their problems stay within the limits of the size-limited one.
+"""
+import gurobipy as gp
+import pytest
+from phoenaix.optimizer.synthetic_inputs import \
+    make_buildings, \
+    make_profiles, \
+    mpc_params, \
+    horizon
+
+
+@pytest.fixture
+def n_horizon():
+    return 12
+
+
+@pytest.fixture
+def param_mpc():
+    param_mpc = mpc_params()
+    # solved to optimality, so that objectives can be compared
+    param_mpc["gp"]["mip_gap"] = 0.0
+    return param_mpc
+
+
+@pytest.fixture
+def buildings():
+    # heat pump buildings and boiler buildings without dispatch freedom
+    return make_buildings(5)
+
+
+@pytest.fixture
+def demands_and_pv(buildings, n_horizon):
+    return horizon(make_profiles(buildings, 2 * n_horizon), 0, n_horizon)
+
+
+@pytest.fixture
+def gurobi_env():
+    env = gp.Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    try:
+        env.start()
+    except gp.GurobiError as e:
+        pytest.skip(f'No gurobi licence: {e}')
+    yield env
+    env.dispose()
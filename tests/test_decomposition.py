@@ -0,0 +1,76 @@
+import pytest
+from phoenaix.optimizer.synthetic_inputs import \
+    make_buildings, \
+    make_profiles, \
+    horizon
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.decomposition import DecomposedCentralModel
+from phoenaix.optimizer.results import OPTIMAL
+
+
+@pytest.fixture
+def buildings():
+    return make_buildings(3)
+
+
+@pytest.mark.parametrize("reduce_model, n_workers",
+                         [(True, 1), (False, 1), (False, 2)])
+def test_decomposition_equals_central(buildings, demands_and_pv, param_mpc,
+                                      n_horizon, reduce_model, n_workers):
+    central = solve_central(demands_and_pv=demands_and_pv,
+                            buildings=buildings,
+                            n_horizon=n_horizon,
+                            param_mpc=param_mpc,
+                            init_val=None,
+                            backend=make_backend("highs", param_mpc))
+
+    model = DecomposedCentralModel(buildings=buildings,
+                                   n_horizon=n_horizon,
+                                   param_mpc=param_mpc,
+                                   n_workers=n_workers,
+                                   reduce_model=reduce_model)
+    try:
+        res = model.solve(demands_and_pv=demands_and_pv)
+    finally:
+        model.dispose()
+
+    assert res.info["decomposition"]["converged"]
+    assert res.status == OPTIMAL
+    assert model.status == OPTIMAL
+    assert res.obj_val == pytest.approx(central.obj_val, rel=1e-6)
+    assert res.soc.shape == central.soc.shape
+
+
+def test_all_buildings_rigid(param_mpc, n_horizon):
+    # boiler buildings have no dispatch freedom, after the reduction no
+    # subproblem is left and only the coordinator is solved
+    boilers = [0, 4]
+    buildings = make_buildings(5)
+    demands_and_pv = horizon(make_profiles(buildings, 2 * n_horizon), 0,
+                             n_horizon)
+    buildings = {n: buildings[n] for n in boilers}
+    demands_and_pv = {key: {n: values[n] for n in boilers}
+                      for key, values in demands_and_pv.items()}
+    central = solve_central(demands_and_pv=demands_and_pv,
+                            buildings=buildings,
+                            n_horizon=n_horizon,
+                            param_mpc=param_mpc,
+                            init_val=None,
+                            backend=make_backend("highs", param_mpc))
+
+    model = DecomposedCentralModel(buildings=buildings,
+                                   n_horizon=n_horizon,
+                                   param_mpc=param_mpc,
+                                   n_workers=1,
+                                   reduce_model=True)
+    try:
+        res = model.solve(demands_and_pv=demands_and_pv)
+    finally:
+        model.dispose()
+
+    assert res.info["decomposition"]["n_subproblems"] == 0
+    assert res.status == OPTIMAL
+    assert res.mip_gap == 0.0
+    assert res.obj_val == pytest.approx(central.obj_val, rel=1e-6)
@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from phoenaix.simulation.fmu_handler import IOPlan
+
+# name: (type, value reference, initial value)
+VARIABLES = {
+    "T": ("Real", 1, 293.15),
+    "n": ("Integer", 1, 3),
+    "mode": ("Enumeration", 2, 2),
+    "on": ("Boolean", 1, 1),
+    "P": ("Real", 2, -1500.5),
+    "valid": ("Boolean", 2, 0),
+}
+
+
+class FakeFMU:
+    """
+    Values by FMI type and value reference behind the fmi2Get* and fmi2Set*
+    functions of an fmpy.fmi2.FMU2Slave, counting their calls.
+    """
+
+    def __init__(self):
+        self.component = object()
+        self.values = {}
+        for value_type, vr, value in VARIABLES.values():
+            value_type = "Integer" if value_type == "Enumeration" \
+                else value_type
+            self.values[value_type, vr] = value
+        self.calls = []
+
+    def _get(self, value_type):
+        def get(component, vrs, n_values, buffer):
+            assert component is self.component
+            self.calls.append(("get", value_type))
+            for i in range(n_values):
+                buffer[i] = self.values[value_type, vrs[i]]
+        return get
+
+    def _set(self, value_type):
+        def set_(component, vrs, n_values, buffer):
+            assert component is self.component
+            self.calls.append(("set", value_type))
+            for i in range(n_values):
+                self.values[value_type, vrs[i]] = buffer[i]
+        return set_
+
+    def __getattr__(self, name):
+        for prefix, make in (("fmi2Get", self._get), ("fmi2Set", self._set)):
+            if name.startswith(prefix):
+                return make(name[len(prefix):])
+        raise AttributeError(name)
+
+
+@pytest.fixture
+def fmu():
+    return FakeFMU()
+
+
+@pytest.fixture
+def variables():
+    return {name: SimpleNamespace(type=value_type, valueReference=vr)
+            for name, (value_type, vr, _) in VARIABLES.items()}
+
+
+def test_read_in_order_of_names(fmu, variables):
+    names = ["P", "on", "n", "T", "mode", "valid"]
+    plan = IOPlan(fmu=fmu, variables=variables, names=names)
+
+    np.testing.assert_array_equal(plan.read(),
+                                  [-1500.5, 1.0, 3.0, 293.15, 2.0, 0.0])
+    # one call per value type, Enumerations are read as Integers
+    assert sorted(fmu.calls) == [("get", "Boolean"), ("get", "Integer"),
+                                 ("get", "Real")]
+
+    out = np.full(len(plan), np.nan)
+    assert plan.read(out=out) is out
+    np.testing.assert_array_equal(out, plan.read())
+
+
+def test_read_dict_types(fmu, variables):
+    plan = IOPlan(fmu=fmu, variables=variables, names=list(VARIABLES))
+    values = plan.read_dict()
+
+    assert list(values) == list(VARIABLES)
+    assert values["T"] == pytest.approx(293.15)
+    assert values["n"] == 3 and isinstance(values["n"], int)
+    assert values["mode"] == 2 and isinstance(values["mode"], int)
+    assert values["on"] is True
+    assert values["valid"] is False
+
+
+def test_write_by_type(fmu, variables):
+    names = ["T", "n", "on", "valid", "mode"]
+    plan = IOPlan(fmu=fmu, variables=variables, names=names)
+    plan.write([300.5, 7.0, "False", "True", 4])
+
+    assert fmu.values["Real", 1] == pytest.approx(300.5)
+    assert fmu.values["Integer", 1] == 7
+    assert fmu.values["Integer", 2] == 4
+    assert fmu.values["Boolean", 1] == 0
+    assert fmu.values["Boolean", 2] == 1
+    assert sorted(call for call in fmu.calls if call[0] == "set") == \
+        [("set", "Boolean"), ("set", "Integer"), ("set", "Real")]
+    assert plan.read_dict() == {"T": pytest.approx(300.5), "n": 7,
+                                "on": False, "valid": True, "mode": 4}
+
+
+@pytest.mark.parametrize("value, expected", [(True, 1), (1, 1), (1.0, 1),
+                                             (False, 0), (0, 0), (0.5, 0)])
+def test_write_boolean(fmu, variables, value, expected):
+    plan = IOPlan(fmu=fmu, variables=variables, names=["on"])
+    plan.write([value])
+    assert fmu.values["Boolean", 1] == expected
+
+
+def test_unsupported_type(fmu, variables):
+    variables["name"] = SimpleNamespace(type="String", valueReference=3)
+    with pytest.raises(Exception, match="Unsupported type: String"):
+        IOPlan(fmu=fmu, variables=variables, names=["T", "name"])
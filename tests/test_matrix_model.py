@@ -0,0 +1,55 @@
+import pytest
+from phoenaix.optimizer.formulation import \
+    build_central_model, \
+    set_solver_params
+from phoenaix.optimizer.matrix_model import build_matrix_model
+from phoenaix.optimizer.results import \
+    OPTIMAL, \
+    gurobi_status, \
+    retrieve_results
+from phoenaix.optimizer.synthetic_inputs import \
+    make_buildings, \
+    make_profiles, \
+    horizon
+
+BUILDERS = {"dict": build_central_model,
+            "matrix": build_matrix_model}
+
+
+def solve(build_model, demands_and_pv, buildings, n_horizon, param_mpc,
+          env):
+    model, handles = build_model(demands_and_pv=demands_and_pv,
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=None,
+                                 env=env)
+    try:
+        set_solver_params(model, param_mpc)
+        model.optimize()
+        assert gurobi_status(model) == OPTIMAL
+        return retrieve_results(model=model,
+                                handles=handles,
+                                param_mpc=param_mpc)
+    finally:
+        model.dispose()
+
+
+@pytest.mark.parametrize("start", [0, 10])
+def test_builders_give_the_same_plan(param_mpc, gurobi_env, start):
+    # a boiler and a heat pump building, within the size-limited licence
+    buildings = make_buildings(2)
+    n_horizon = 4
+    demands_and_pv = horizon(make_profiles(buildings, 24), start, n_horizon)
+
+    results = {name: solve(build_model, demands_and_pv, buildings,
+                           n_horizon, param_mpc, gurobi_env)
+               for name, build_model in BUILDERS.items()}
+
+    assert results["matrix"].obj_val == \
+        pytest.approx(results["dict"].obj_val, rel=1e-6)
+    for n in buildings:
+        assert results["matrix"].hp_power(n) == \
+            pytest.approx(results["dict"].hp_power(n), abs=1e-3)
+        assert results["matrix"].tes_soc(n) == \
+            pytest.approx(results["dict"].tes_soc(n), abs=1e-6)
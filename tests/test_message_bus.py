@@ -0,0 +1,152 @@
+import threading
+import pytest
+from phoenaix.communication.local_broker import \
+    LocalBroker, \
+    LocalClient
+from phoenaix.communication.message_bus import \
+    MessageBus, \
+    topic_matches
+
+# Seconds to wait for messages and threads before a test fails
+TIMEOUT = 10.0
+
+
+class MutexClient(LocalClient):
+    """
+    LocalClient that locks like paho 1.6: on_message is called with the
+    callback mutex held, and publish takes the same mutex.
+    """
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        self.callback_mutex = threading.RLock()
+
+    def publish(self, topic, payload=None, qos=0):
+        with self.callback_mutex:
+            super().publish(topic, payload, qos)
+
+    def _loop(self):
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+        while True:
+            message = self._queue.get()
+            if message is self._STOP:
+                return
+            with self.callback_mutex:
+                self.on_message(self, None, message)
+
+
+class Collector:
+    """Handler that counts its messages until it has expected of them"""
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.payloads = []
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+
+    def __call__(self, client, userdata, msg):
+        with self._lock:
+            self.payloads.append(msg.payload)
+            if len(self.payloads) >= self.expected:
+                self.done.set()
+
+
+@pytest.fixture
+def broker():
+    return LocalBroker()
+
+
+@pytest.mark.parametrize("subscription, topic, matches", [
+    ("a/b", "a/b", True),
+    ("a/+", "a/b", True),
+    ("a/+", "a/b/c", False),
+    ("a/#", "a/b/c", True),
+    ("+/b", "a/c", False),
+    ("a/b/c", "a/b", False),
+])
+def test_topic_matches(subscription, topic, matches):
+    assert topic_matches(subscription, topic) == matches
+
+
+@pytest.mark.parametrize("inline", [False, True])
+def test_delivery_while_another_thread_publishes(broker, inline):
+    n_messages = 500
+    sender = MessageBus(broker.client())
+    receiver = MessageBus(broker.client())
+    collector = Collector(2 * n_messages)
+    receiver.subscribe("test/+", collector, inline=inline)
+    receiver.start()
+    sender.start()
+    try:
+        def publish(topic):
+            for i in range(n_messages):
+                sender.publish(topic, str(i))
+
+        threads = [threading.Thread(target=publish, args=(topic,))
+                   for topic in ("test/a", "test/b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(TIMEOUT)
+        assert collector.done.wait(TIMEOUT)
+    finally:
+        sender.close()
+        receiver.close()
+
+    assert sorted(collector.payloads) == \
+        sorted(2 * [str(i).encode() for i in range(n_messages)])
+    assert sender.stats()["published"] == 2 * n_messages
+    assert receiver.stats()["dispatched"] == 2 * n_messages
+    assert receiver.stats()["errors"] == 0
+
+
+def test_publish_does_not_deadlock_with_arriving_messages(broker):
+    # every ping is answered in the network thread, with the callback mutex
+    # of the client held, while the publishing thread is still inside
+    # publish_many and waits for the answer
+    n_messages = 20
+    bus = MessageBus(MutexClient(broker))
+    echoes = threading.Semaphore(0)
+    bus.subscribe("ping", lambda client, userdata, msg:
+                  bus.publish("pong", msg.payload), inline=True)
+    bus.subscribe("pong", lambda client, userdata, msg: echoes.release(),
+                  inline=True)
+    answered = []
+
+    def pings():
+        for i in range(n_messages):
+            yield "ping", str(i)
+            answered.append(echoes.acquire(timeout=TIMEOUT))
+
+    bus.start()
+    publisher = threading.Thread(target=bus.publish_many,
+                                 args=(pings(),),
+                                 daemon=True)
+    publisher.start()
+    publisher.join((n_messages + 1) * TIMEOUT)
+    # a deadlocked bus can not be closed, its threads are left behind
+    assert not publisher.is_alive()
+    bus.close()
+
+    assert answered == n_messages * [True]
+
+
+def test_unsubscribe_stops_delivery(broker):
+    bus = MessageBus(broker.client())
+    first = Collector(1)
+    second = Collector(2)
+    bus.subscribe("topic", first)
+    bus.subscribe("topic", second)
+    bus.start()
+    try:
+        bus.publish("topic", "1")
+        assert first.done.wait(TIMEOUT)
+        bus.unsubscribe("topic", first)
+        bus.publish("topic", "2")
+        assert second.done.wait(TIMEOUT)
+    finally:
+        bus.close()
+
+    assert first.payloads == [b"1"]
+    assert second.payloads == [b"1", b"2"]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from phoenaix.optimizer.formulation import cop_profile
+from phoenaix.optimizer.mpc import MPC
+from phoenaix.optimizer.persistent_model import PersistentCentralModel
+from phoenaix.optimizer.results import OPTIMAL
+from phoenaix.optimizer.synthetic_inputs import \
+    make_buildings, \
+    make_profiles, \
+    horizon, \
+    soc_init_from_results
+
+# Outdoor temperatures of the steps, the last one changes the CoP
+T_AIR = (5.0, 5.0, -5.0)
+
+
+@pytest.mark.parametrize("builder", ["matrix", "dict"])
+def test_updates_match_fresh_solves(param_mpc, gurobi_env, builder):
+    # within the size-limited licence
+    buildings = make_buildings(2)
+    n_horizon = 4
+    profiles = make_profiles(buildings, 24)
+    model = PersistentCentralModel(buildings=buildings,
+                                   n_horizon=n_horizon,
+                                   param_mpc=param_mpc,
+                                   builder=builder,
+                                   env=gurobi_env)
+    init_val = None
+    try:
+        for step, t_air in enumerate(T_AIR):
+            demands_and_pv = horizon(profiles, step, n_horizon)
+            demands_and_pv["t_air"] = [t_air] * n_horizon
+
+            res = model.solve(demands_and_pv=demands_and_pv,
+                              init_val=init_val)
+            fresh, status = MPC._run_central_optimization(
+                demands_and_pv=demands_and_pv,
+                buildings=buildings,
+                n_horizon=n_horizon,
+                param_mpc=param_mpc,
+                init_val=init_val,
+                builder=builder,
+                env=gurobi_env)
+
+            assert model.status == status == OPTIMAL
+            assert res.obj_val == pytest.approx(fresh.obj_val, rel=1e-6)
+            for n in buildings:
+                assert res.tes_soc(n) == pytest.approx(fresh.tes_soc(n),
+                                                       abs=1e-6)
+            init_val = soc_init_from_results(res)
+        # built once, then only updated, with the CoP of the last step
+        assert model.n_solves == len(T_AIR)
+        assert model.build_time == 0.0
+        np.testing.assert_allclose(model._cop,
+                                   cop_profile(demands_and_pv, n_horizon))
+    finally:
+        model.dispose()
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from phoenaix.optimizer.backends import \
+    make_backend, \
+    solve_central
+from phoenaix.optimizer.matrix_model import assemble_central_milp
+from phoenaix.optimizer.reduction import reduce_central_milp
+
+# Absolute tolerance of rows and bounds of the expanded solution
+FEAS_TOL = 1e-6
+
+
+@pytest.fixture
+def milp(buildings, demands_and_pv, param_mpc, n_horizon):
+    return assemble_central_milp(demands_and_pv=demands_and_pv,
+                                 buildings=buildings,
+                                 n_horizon=n_horizon,
+                                 param_mpc=param_mpc,
+                                 init_val=None)
+
+
+@pytest.mark.parametrize("skip_buildings", [True, False])
+def test_reduced_objective_equals_full(milp, buildings, param_mpc,
+                                       skip_buildings):
+    reduced = reduce_central_milp(milp=milp,
+                                  buildings=buildings,
+                                  param_mpc=param_mpc,
+                                  skip_buildings=skip_buildings)
+    assert reduced.n_cols < milp.n_cols
+    assert reduced.n_rows < milp.n_rows
+
+    backend = make_backend("highs", param_mpc)
+    full = backend.solve(milp)
+    solution = backend.solve(reduced)
+    assert full.has_solution and solution.has_solution
+    assert solution.obj_val + reduced.obj_offset == \
+        pytest.approx(full.obj_val, rel=1e-7)
+
+    x = reduced.expand(solution.x)
+    assert milp.c @ x == pytest.approx(full.obj_val, rel=1e-7)
+
+
+def test_expanded_solution_is_feasible(milp, buildings, param_mpc):
+    reduced = reduce_central_milp(milp=milp,
+                                  buildings=buildings,
+                                  param_mpc=param_mpc)
+    solution = make_backend("highs", param_mpc).solve(reduced)
+    x = reduced.expand(solution.x)
+
+    assert x.shape == (milp.n_cols,)
+    activity = milp.A @ x
+    eq = milp.sense == "="
+    le = milp.sense == "<"
+    ge = milp.sense == ">"
+    assert np.all(np.abs(activity[eq] - milp.rhs[eq]) <= FEAS_TOL)
+    assert np.all(activity[le] <= milp.rhs[le] + FEAS_TOL)
+    assert np.all(activity[ge] >= milp.rhs[ge] - FEAS_TOL)
+    assert np.all(x >= milp.lb - FEAS_TOL)
+    assert np.all(x <= milp.ub + FEAS_TOL)
+    is_int = milp.vtype != "C"
+    assert np.all(np.abs(x[is_int] - np.round(x[is_int])) <= FEAS_TOL)
+
+
+def test_solve_central_with_reduction(buildings, demands_and_pv, param_mpc,
+                                      n_horizon):
+    backend = make_backend("highs", param_mpc)
+    kwargs = dict(demands_and_pv=demands_and_pv,
+                  buildings=buildings,
+                  n_horizon=n_horizon,
+                  param_mpc=param_mpc,
+                  init_val=None,
+                  backend=backend)
+    full = solve_central(**kwargs)
+    reduced = solve_central(reduce_model=True, **kwargs)
+
+    assert reduced.obj_val == pytest.approx(full.obj_val, rel=1e-7)
+    assert reduced.info["cols_removed"] > 0
+    assert reduced.soc.shape == full.soc.shape